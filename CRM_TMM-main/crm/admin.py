@@ -1,6 +1,11 @@
 # crm/admin.py
-from django.contrib import admin
-from .models import Cliente, Taller, Inscripcion, Interes, Producto, VentaProducto, DetalleVenta, Empresa # Importar Empresa
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from .models import Cliente, Taller, Inscripcion, Interes, Producto, VentaProducto, DetalleVenta, Empresa, PuntajeCliente, Segmento, MovimientoStock # Importar Empresa
+from .utils import stock
+from .utils.deudores import cambiar_estado_masivo
+from .utils.segmentos_guardados import refrescar_segmento
 
 # --- INLINES (Sin cambios) ---
 class DetalleVentaInline(admin.TabularInline):
@@ -33,11 +38,11 @@ class ClienteAdmin(admin.ModelAdmin):
     list_filter = ('tipo_cliente', 'comuna_vive', 'intereses_cliente', 'empresa') # Añadido filtro por empresa
     readonly_fields = ('fecha_registro',)
     # Usar raw_id_fields para el campo 'empresa' si hay muchas empresas, para mejor rendimiento
-    raw_id_fields = ('empresa',)
+    raw_id_fields = ('empresa', 'usuario')
 
     fieldsets = (
         ('Información del Contacto', { # Título actualizado
-            'fields': ('nombre_completo', 'email', 'telefono', 'fecha_nacimiento', 'comuna_vive')
+            'fields': ('nombre_completo', 'email', 'usuario', 'telefono', 'fecha_nacimiento', 'comuna_vive')
         }),
         # --- NUEVO: Sección Empresa ---
          ('Información B2B (Opcional)', {
@@ -62,12 +67,41 @@ class TallerAdmin(admin.ModelAdmin):
     search_fields = ('nombre', 'descripcion')
     readonly_fields = ('cupos_disponibles',)
 
+class InscripcionActionForm(ActionForm):
+    # Monto usado por la acción "Marcar como abonado"
+    monto_abono = forms.DecimalField(required=False, min_value=1, decimal_places=0, label='Monto abonado')
+
+
 @admin.register(Inscripcion)
 class InscripcionAdmin(admin.ModelAdmin):
-    list_display = ('get_cliente_display', 'taller', 'monto_pagado', 'estado_pago', 'fecha_inscripcion') # Método para mostrar nombre/empresa
+    list_display = ('get_cliente_display', 'taller', 'monto_pagado', 'saldo_pendiente', 'estado_pago', 'fecha_inscripcion') # Método para mostrar nombre/empresa
     list_filter = ('estado_pago', 'taller__nombre', 'fecha_inscripcion', 'cliente__tipo_cliente') # Añadido filtro por tipo cliente
     search_fields = ('cliente__nombre_completo', 'taller__nombre', 'cliente__empresa__razon_social') # Añadido búsqueda por empresa
     raw_id_fields = ('cliente', 'taller')
+    action_form = InscripcionActionForm
+    actions = ['marcar_pagado', 'marcar_abonado', 'anular']
+
+    def _cambiar_estado(self, request, queryset, estado, monto=None):
+        try:
+            n = cambiar_estado_masivo(queryset.values_list('id', flat=True), estado, monto=monto)
+        except ValueError as e:
+            self.message_user(request, str(e), messages.ERROR)
+            return
+        self.message_user(request, f'{n} inscripciones marcadas como {estado}.', messages.SUCCESS)
+
+    @admin.action(description='Marcar como pagado')
+    def marcar_pagado(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'PAGADO')
+
+    @admin.action(description='Marcar como abonado (usa "Monto abonado")')
+    def marcar_abonado(self, request, queryset):
+        form = self.action_form(request.POST)
+        monto = form.cleaned_data.get('monto_abono') if form.is_valid() else None
+        self._cambiar_estado(request, queryset, 'ABONADO', monto=monto)
+
+    @admin.action(description='Anular (libera cupos)')
+    def anular(self, request, queryset):
+        self._cambiar_estado(request, queryset, 'ANULADO')
 
     # Método para mejorar la visualización del cliente en el listado
     @admin.display(description='Cliente / Empresa', ordering='cliente__nombre_completo')
@@ -82,12 +116,73 @@ class InteresAdmin(admin.ModelAdmin):
     list_display = ('nombre',)
     search_fields = ('nombre',)
 
+class ProductoAdminForm(forms.ModelForm):
+    # El stock de un producto existente solo cambia con movimientos del libro
+    movimiento_stock = forms.IntegerField(
+        required=False, label='Movimiento de stock',
+        help_text='Unidades que entran (+) o salen (-). Queda registrado en el libro de stock.',
+    )
+    tipo_movimiento = forms.ChoiceField(
+        choices=[('REPOSICION', 'Reposición'), ('AJUSTE', 'Ajuste')], initial='REPOSICION',
+        label='Tipo de movimiento',
+    )
+    nota_movimiento = forms.CharField(required=False, max_length=200, label='Nota del movimiento')
+
+    class Meta:
+        model = Producto
+        fields = '__all__'
+
+
 @admin.register(Producto)
 class ProductoAdmin(admin.ModelAdmin):
-    list_display = ('nombre', 'precio_venta', 'stock_actual', 'esta_disponible') # Añadido stock
+    form = ProductoAdminForm
+    list_display = ('nombre', 'precio_venta', 'get_stock_vigente', 'stock_reservado', 'esta_disponible') # Añadido stock
     list_filter = ('esta_disponible',)
     search_fields = ('nombre',)
-    readonly_fields = () # Quitar stock si quieres editarlo aquí
+
+    def get_queryset(self, request):
+        return stock.con_stock(super().get_queryset(request))
+
+    def get_readonly_fields(self, request, obj=None):
+        # stock_actual es el consolidado: se fija al crear y luego lo mantiene `consolidar_stock`
+        return ('stock_actual', 'get_stock_vigente') if obj else ()
+
+    def get_fields(self, request, obj=None):
+        fields = super().get_fields(request, obj)
+        if obj is None:
+            return [f for f in fields if f not in ('movimiento_stock', 'tipo_movimiento', 'nota_movimiento')]
+        return fields
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        cantidad = form.cleaned_data.get('movimiento_stock') if change else None
+        if cantidad:
+            stock.registrar(
+                obj.pk, cantidad, form.cleaned_data['tipo_movimiento'], form.cleaned_data.get('nota_movimiento', '')
+            )
+
+    @admin.display(description='Stock vigente')
+    def get_stock_vigente(self, obj):
+        return obj.stock_vigente
+
+
+@admin.register(MovimientoStock)
+class MovimientoStockAdmin(admin.ModelAdmin):
+    list_display = ('creado_en', 'producto', 'tipo', 'cantidad', 'venta', 'nota')
+    list_filter = ('tipo', 'creado_en')
+    search_fields = ('producto__nombre', 'nota')
+    raw_id_fields = ('producto', 'venta')
+    # Libro de solo inserción: se consulta para auditoría, no se edita
+    readonly_fields = [f.name for f in MovimientoStock._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 @admin.register(VentaProducto)
 class VentaProductoAdmin(admin.ModelAdmin):
@@ -105,3 +200,36 @@ class VentaProductoAdmin(admin.ModelAdmin):
             return f"{obj.cliente.nombre_completo} ({obj.cliente.empresa.razon_social})"
         return getattr(obj.cliente, 'nombre_completo', '')
 
+
+@admin.register(PuntajeCliente)
+class PuntajeClienteAdmin(admin.ModelAdmin):
+    list_display = ('cliente', 'puntaje_total', 'puntaje_r', 'puntaje_f', 'puntaje_m', 'valor_vida', 'recencia_dias', 'calculado_en')
+    list_filter = ('puntaje_total',)
+    search_fields = ('cliente__nombre_completo', 'cliente__email')
+    ordering = ('-puntaje_total', '-valor_vida')
+    raw_id_fields = ('cliente',)
+    # Tabla calculada por el comando `calcular_puntajes`: solo lectura
+    readonly_fields = [f.name for f in PuntajeCliente._meta.fields]
+
+
+@admin.register(Segmento)
+class SegmentoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'expresion', 'total_miembros', 'refrescado_en', 'creado_por')
+    search_fields = ('nombre', 'expresion')
+    # Los miembros se materializan con refrescar_segmento: no se editan a mano
+    readonly_fields = ('total_miembros', 'refrescado_en', 'creado_por')
+    actions = ['refrescar_completo']
+
+    def save_model(self, request, obj, form, change):
+        if not obj.creado_por_id:
+            obj.creado_por = request.user
+        super().save_model(request, obj, form, change)
+        if change and 'expresion' not in form.changed_data:
+            return
+        refrescar_segmento(obj, completo=True)
+
+    @admin.action(description='Refrescar miembros (completo)')
+    def refrescar_completo(self, request, queryset):
+        for segmento in queryset:
+            refrescar_segmento(segmento, completo=True)
+        self.message_user(request, f'{queryset.count()} segmentos refrescados.', messages.SUCCESS)
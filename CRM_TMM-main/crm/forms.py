@@ -48,15 +48,15 @@ class RegistroClienteForm(UserCreationForm):
         telefono_data = self.cleaned_data.get('telefono')
         nacimiento_data = self.cleaned_data.get('fecha_nacimiento')
         
-        # Actualizar o crear el objeto Cliente CRM
-        Cliente.objects.update_or_create(
-            email=user.email,
-            defaults={
-                'nombre_completo': f"{user.first_name} {user.last_name}".strip(),
-                'telefono': telefono_data,
-                'fecha_nacimiento': nacimiento_data,
-            }
-        )
+        # Actualizar o crear el objeto Cliente CRM (vinculado a la cuenta si ya está guardada)
+        defaults = {
+            'nombre_completo': f"{user.first_name} {user.last_name}".strip(),
+            'telefono': telefono_data,
+            'fecha_nacimiento': nacimiento_data,
+        }
+        if user.pk:
+            defaults['usuario'] = user
+        Cliente.objects.update_or_create(email=user.email, defaults=defaults)
         return user
     
     def clean_email(self):
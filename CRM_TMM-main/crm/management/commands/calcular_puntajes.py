@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from crm.utils.scoring import calcular_puntajes, SCORE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los puntajes RFM y valor de vida de los clientes (pensado para ejecución nocturna)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true', help='Recalcular todos los clientes en vez de solo los tocados desde la última ejecución')
+        parser.add_argument('--batch-size', type=int, default=SCORE_BATCH_SIZE, help='Filas por INSERT/UPDATE en lote')
+
+    def handle(self, *args, **options):
+        modo = 'completo' if options['completo'] else 'incremental'
+        self.stdout.write(f'Calculando puntajes RFM (modo {modo})...')
+        actualizados = calcular_puntajes(completo=options['completo'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Puntajes actualizados: {actualizados} clientes.'))
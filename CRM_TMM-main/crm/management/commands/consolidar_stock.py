@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from crm.utils.stock import LOTE_CONSOLIDACION, consolidar
+
+
+class Command(BaseCommand):
+    help = 'Pliega los movimientos del libro de stock en el stock consolidado de cada producto (programar periódicamente)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=LOTE_CONSOLIDACION,
+            help='Productos consolidados por transacción.',
+        )
+
+    def handle(self, *args, **options):
+        consolidados = consolidar(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{consolidados} productos consolidados.'))
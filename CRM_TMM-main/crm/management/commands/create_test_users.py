@@ -1,5 +1,20 @@
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+
+def _inicializar_proceso():
+    # Con el método 'spawn' (macOS/Windows) los procesos hijos no heredan Django configurado
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
 
 
 class Command(BaseCommand):
@@ -9,28 +24,44 @@ class Command(BaseCommand):
         parser.add_argument('--count', type=int, default=100, help='Number of users to create')
         parser.add_argument('--prefix', type=str, default='locust', help='Username prefix')
         parser.add_argument('--password', type=str, default='locustpass', help='Password for all users')
+        parser.add_argument('--bulk', action='store_true',
+                            help='Bulk mode: hash once (or in a process pool) and bulk_create in chunks')
+        parser.add_argument('--unique-passwords', action='store_true',
+                            help='Bulk mode: use "<password><i>" per user, hashed in a process pool')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Bulk mode: hashing processes for --unique-passwords')
+        parser.add_argument('--chunk', type=int, default=5000, help='Bulk mode: users per INSERT batch')
+        parser.add_argument('--clientes', action='store_true',
+                            help='Bulk mode: also create a linked Cliente per user')
+        parser.add_argument('--output', type=str, default='locust_users.csv', help='Credentials file for Locust')
 
     def handle(self, *args, **options):
         User = get_user_model()
         count = options['count']
         prefix = options['prefix']
         password = options['password']
-        
+
         # Eliminar usuarios existentes con ese prefijo para asegurar que se recreen (ej. con nuevo hash)
         self.stdout.write(f'Eliminando usuarios existentes con prefijo "{prefix}"...')
+        if options['bulk'] and options['clientes']:
+            from crm.models import Cliente
+            Cliente.objects.filter(usuario__username__startswith=prefix).delete()
         deleted, _ = User.objects.filter(username__startswith=prefix).delete()
         self.stdout.write(self.style.SUCCESS(f'Se eliminaron {deleted} usuarios anteriores.'))
 
+        if options['bulk']:
+            return self._crear_en_lote(User, count, prefix, password, options)
+
         created = 0
         self.stdout.write(f'Creando {count} nuevos usuarios...')
         for i in range(1, count + 1):
             username = f"{prefix}{i}"
             User.objects.create_user(username=username, email=f"{username}@example.com", password=password)
             created += 1
-        
+
         # Also write a credentials file that Locust can consume (username,password per line)
         try:
-            out_path = 'locust_users.csv'
+            out_path = options['output']
             with open(out_path, 'w', encoding='utf-8') as f:
                 for i in range(1, count + 1):
                     username = f"{prefix}{i}"
@@ -40,3 +71,62 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING(f'Could not write credentials file: {e}'))
 
         self.stdout.write(self.style.SUCCESS(f'Created {created} test users (prefix={prefix}, count={count})'))
+
+    def _crear_en_lote(self, User, count, prefix, password, options):
+        """Hashes en paralelo (o uno solo reutilizado), INSERT por lotes y CSV escrito por lote."""
+        inicio = time.perf_counter()
+        chunk = max(1, options['chunk'])
+        unicas = options['unique_passwords']
+        pool = ProcessPoolExecutor(max_workers=options['workers'], initializer=_inicializar_proceso) if unicas else None
+        # Misma contraseña para todos: un solo hash (mismo salt; aceptable para cuentas de prueba)
+        hash_comun = None if unicas else make_password(password)
+        created = 0
+
+        self.stdout.write(f'Creando {count} nuevos usuarios en lotes de {chunk}...')
+        try:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+                escritor = csv.writer(f)
+                for desde in range(1, count + 1, chunk):
+                    indices = range(desde, min(desde + chunk, count + 1))
+                    claves = [f'{password}{i}' if unicas else password for i in indices]
+                    if pool:
+                        hashes = list(pool.map(make_password, claves, chunksize=max(1, len(claves) // (options['workers'] * 4))))
+                    else:
+                        hashes = [hash_comun] * len(claves)
+                    usuarios = [
+                        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=hash_)
+                        for i, hash_ in zip(indices, hashes)
+                    ]
+                    with transaction.atomic():
+                        usuarios = User.objects.bulk_create(usuarios, batch_size=chunk)
+                        if options['clientes']:
+                            self._crear_clientes(usuarios)
+                    escritor.writerows((u.username, clave) for u, clave in zip(usuarios, claves))
+                    f.flush()
+                    created += len(usuarios)
+                    self.stdout.write(f'  {created}/{count}')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if options['clientes']:
+            from crm.utils import segmentos
+            transaction.on_commit(segmentos.cambios_registrados)
+        self.stdout.write(self.style.SUCCESS(f'Wrote credentials to {options["output"]}'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {created} test users (prefix={prefix}, count={count}) in {time.perf_counter() - inicio:.1f}s'
+        ))
+
+    def _crear_clientes(self, usuarios):
+        from crm.models import Cliente
+        from crm.utils.busqueda import indexar_clientes
+        from crm.utils.segmentos_guardados import registrar_cambio
+
+        # bulk_create no dispara señales: índice de búsqueda y segmentos se actualizan aquí
+        Cliente.objects.bulk_create(
+            [Cliente(nombre_completo=u.username, email=u.email, usuario_id=u.pk) for u in usuarios],
+            batch_size=len(usuarios), ignore_conflicts=True,
+        )
+        ids = list(Cliente.objects.filter(usuario_id__in=[u.pk for u in usuarios]).values_list('pk', flat=True))
+        indexar_clientes(ids)
+        registrar_cambio(ids)
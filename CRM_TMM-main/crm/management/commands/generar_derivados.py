@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from crm.models import Producto, Taller
+from crm.utils.imagenes import pendiente, procesar
+
+
+class Command(BaseCommand):
+    help = 'Genera los derivados WebP/JPEG (miniatura, tarjeta, detalle) de las imágenes de talleres y productos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Reprocesa también los objetos que ya tienen derivados (p.ej. tras cambiar los tamaños).',
+        )
+
+    def handle(self, *args, **options):
+        for modelo in (Taller, Producto):
+            procesados = 0
+            for obj in modelo.objects.only('imagen', 'imagen_variantes').iterator():
+                if not options['todos'] and not pendiente(obj):
+                    continue
+                if options['todos']:
+                    modelo.objects.filter(pk=obj.pk).update(imagen_variantes={})
+                try:
+                    procesar(modelo, obj.pk)
+                    procesados += 1
+                except Exception as e:
+                    self.stderr.write(f'{modelo.__name__} {obj.pk}: {e}')
+            self.stdout.write(self.style.SUCCESS(f'{modelo._meta.verbose_name_plural}: {procesados} procesados.'))
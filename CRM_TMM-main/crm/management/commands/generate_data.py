@@ -0,0 +1,84 @@
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from crm.models import Cliente, Empresa, Interes, Producto, Taller
+from crm.utils import datos_sinteticos, snapshots_bd
+
+
+class Command(BaseCommand):
+    help = 'Genera un conjunto de datos sintético y determinista'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clientes', type=int, default=200)
+        parser.add_argument('--empresas', type=int, default=5)
+        parser.add_argument('--talleres', type=int, default=40)
+        parser.add_argument('--inscripciones-por-cliente', type=float, default=2.0,
+                            help='Promedio de inscripciones por cliente (distribución con cola larga)')
+        parser.add_argument('--ventas', type=int, default=100)
+        parser.add_argument('--productos', type=int, default=10)
+        parser.add_argument('--meses', type=int, default=12, help='Meses de historia hacia atrás desde la fecha base')
+        parser.add_argument('--usuarios', type=int, default=20,
+                            help='Clientes B2C con cuenta usuario_b2c_<n> / password123')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--fecha-base', type=datetime.date.fromisoformat, default=None,
+                            help='Fecha "de hoy" del conjunto (YYYY-MM-DD); por defecto la fecha actual')
+        parser.add_argument('--lote', type=int, default=datos_sinteticos.LOTE, help='Filas por bulk_create/transacción')
+        parser.add_argument('--limpiar', action='store_true', help='Eliminar antes los datos existentes')
+        parser.add_argument('--snapshot', action='store_true',
+                            help='Restaurar el snapshot de estos parámetros si existe; si no, generar y guardarlo '
+                                 '(requiere --fecha-base; sobre una base con datos, también --limpiar)')
+        parser.add_argument('--snapshot-dir', type=str, default=None,
+                            help='Directorio de snapshots (por defecto settings.SNAPSHOTS_BD_DIR)')
+
+    def handle(self, *args, **options):
+        parametros = {
+            nombre: options[nombre] for nombre in (
+                'clientes', 'empresas', 'talleres', 'inscripciones_por_cliente', 'ventas', 'productos',
+                'meses', 'usuarios', 'semilla',
+            )
+        }
+        if options['snapshot'] and options['fecha_base'] is None:
+            # La fecha base es parte de la clave: con la fecha del día el snapshot no se reutilizaría
+            raise CommandError('--snapshot requiere --fecha-base para que el snapshot se pueda reutilizar.')
+        parametros['fecha_base'] = (options['fecha_base'] or timezone.localdate()).isoformat()
+
+        # Restaurar un snapshot reemplaza la base completa (en PostgreSQL, DROP DATABASE): igual
+        # que al generar, sobre datos existentes solo se hace con --limpiar explícito
+        if not options['limpiar'] and any(m.objects.exists() for m in (Interes, Empresa, Cliente, Taller, Producto)):
+            raise CommandError('La base de datos ya tiene datos; use --limpiar para reemplazarlos.')
+
+        if options['snapshot']:
+            meta = snapshots_bd.buscar(snapshots_bd.nombre_snapshot(parametros), options['snapshot_dir'])
+            if meta:
+                try:
+                    segundos, metodo = snapshots_bd.restaurar(meta, options['snapshot_dir'])
+                except snapshots_bd.SnapshotNoDisponible as e:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.SUCCESS(f'Snapshot {meta["nombre"]} restaurado en {segundos:.2f}s ({metodo})'))
+                return
+
+        if options['limpiar']:
+            self.stdout.write('Limpiando la base de datos...')
+            datos_sinteticos.limpiar()
+
+        if not User.objects.filter(username='admin_tmm').exists():
+            User.objects.create_superuser('admin_tmm', 'carolina@tmm.cl', 'adminpass')
+
+        inicio = time.monotonic()
+        totales = datos_sinteticos.generar(
+            **{**parametros, 'fecha_base': datetime.date.fromisoformat(parametros['fecha_base'])},
+            lote=max(1, options['lote']), avisar=self.stdout.write,
+        )
+        resumen = ', '.join(f'{tabla}={n}' for tabla, n in totales.items())
+        self.stdout.write(self.style.SUCCESS(f'Datos generados en {time.monotonic() - inicio:.1f}s ({resumen})'))
+
+        if options['snapshot']:
+            try:
+                meta = snapshots_bd.guardar(parametros, options['snapshot_dir'], totales)
+            except snapshots_bd.SnapshotNoDisponible as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'Snapshot {meta["nombre"]} guardado'))
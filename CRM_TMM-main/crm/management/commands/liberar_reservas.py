@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from crm.utils.reservas import LOTE_LIBERACION, liberar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Libera en lote las reservas de stock de carritos que ya vencieron (programar cada pocos minutos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=LOTE_LIBERACION,
+            help='Reservas liberadas por transacción.',
+        )
+
+    def handle(self, *args, **options):
+        liberadas = liberar_vencidas(lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{liberadas} reservas vencidas liberadas.'))
@@ -0,0 +1,53 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.http import HttpResponse
+from django.test import RequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tmm_project.middleware import CacheTokens, JWTAuthMiddleware
+
+
+class Command(BaseCommand):
+    help = ('Mide peticiones/segundo de JWTAuthMiddleware: validación completa en cada petición '
+            '(comportamiento anterior) contra la ruta rápida (rutas públicas + LRU de tokens)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=2000, help='Peticiones por escenario.')
+        parser.add_argument('--usuario', help='username dueño del token (por defecto, el primer usuario activo).')
+
+    def handle(self, *args, **options):
+        usuarios = User.objects.filter(is_active=True)
+        if options['usuario']:
+            usuarios = usuarios.filter(username=options['usuario'])
+        user = usuarios.order_by('pk').first()
+        if user is None:
+            raise CommandError('No hay un usuario activo para emitir el token.')
+        token = str(AccessToken.for_user(user))
+        factory = RequestFactory()
+
+        def responder(request):
+            return HttpResponse()
+
+        middlewares = {
+            'completo': JWTAuthMiddleware(responder, cache_tokens=CacheTokens(0, 0), rutas_publicas=((), [])),
+            'rapido': JWTAuthMiddleware(responder),
+        }
+        escenarios = [
+            ('estático', '/static/css/estilos.css'),
+            ('catálogo', '/productos/'),
+            ('privada', '/cuenta/perfil/'),
+        ]
+        n = options['peticiones']
+        for nombre, path in escenarios:
+            resultados = {}
+            for modo, middleware in middlewares.items():
+                inicio = time.perf_counter()
+                for _ in range(n):
+                    middleware(factory.get(path, HTTP_AUTHORIZATION=f'Bearer {token}'))
+                resultados[modo] = n / (time.perf_counter() - inicio)
+            self.stdout.write(
+                f'{nombre:<9} completo: {resultados["completo"]:>9.0f} req/s   '
+                f'rápido: {resultados["rapido"]:>9.0f} req/s   (x{resultados["rapido"] / resultados["completo"]:.1f})'
+            )
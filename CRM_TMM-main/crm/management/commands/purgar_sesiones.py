@@ -0,0 +1,33 @@
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = 'Borra en lotes las filas vencidas de django_session (alternativa a clearsessions sin un DELETE gigante)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=5000, help='Filas borradas por DELETE.')
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            default=0.0,
+            help='Segundos de espera entre lotes (para no saturar la BD en horario de uso).',
+        )
+
+    def handle(self, *args, **options):
+        ahora = timezone.now()
+        total = 0
+        while True:
+            claves = list(
+                Session.objects.filter(expire_date__lt=ahora).values_list('session_key', flat=True)[:options['lote']]
+            )
+            if not claves:
+                break
+            borradas, _ = Session.objects.filter(session_key__in=claves).delete()
+            total += borradas
+            if options['pausa']:
+                time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f'{total} sesiones vencidas borradas.'))
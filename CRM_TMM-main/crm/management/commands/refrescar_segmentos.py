@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from crm.utils.segmentos_guardados import refrescar_todos
+
+
+class Command(BaseCommand):
+    help = 'Refresca los miembros de los segmentos guardados (incremental por defecto) y purga el registro de cambios'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Re-evalúa todos los clientes (p.ej. tras renombrar intereses usados por nombre).',
+        )
+
+    def handle(self, *args, **options):
+        resultados = refrescar_todos(completo=options['completo'])
+        for nombre, evaluados in resultados.items():
+            self.stdout.write(f'{nombre}: {evaluados} clientes re-evaluados.')
+        self.stdout.write(self.style.SUCCESS(f'{len(resultados)} segmentos refrescados.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from crm.utils.busqueda import indexar_clientes
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de clientes (FTS5 en SQLite; en PostgreSQL los índices se mantienen solos)'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(f'Motor {connection.vendor}: los índices tsvector/trigram se actualizan automáticamente.')
+            return
+        total = indexar_clientes()
+        self.stdout.write(self.style.SUCCESS(f'Índice de búsqueda reconstruido: {total} clientes.'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from crm.utils import snapshots_bd
+
+
+class Command(BaseCommand):
+    help = 'Guarda, restaura o lista snapshots de la base de datos completa (SQLite: archivo; PostgreSQL: plantilla)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('accion', choices=['guardar', 'restaurar', 'listar'])
+        parser.add_argument('--nombre', type=str, default=None, help='Snapshot a restaurar (por defecto el más reciente del esquema actual)')
+        parser.add_argument('--etiqueta', type=str, default='manual', help='Identifica un snapshot guardado a mano')
+        parser.add_argument('--dir', type=str, default=None, help='Directorio de snapshots (por defecto settings.SNAPSHOTS_BD_DIR)')
+        parser.add_argument('--forzar', action='store_true', help='PostgreSQL: cerrar otras conexiones a la base al restaurar')
+
+    def handle(self, *args, **options):
+        directorio = options['dir']
+        try:
+            getattr(self, f'_{options["accion"]}')(directorio, options)
+        except snapshots_bd.SnapshotNoDisponible as e:
+            raise CommandError(str(e))
+
+    def _guardar(self, directorio, options):
+        meta = snapshots_bd.guardar({'etiqueta': options['etiqueta']}, directorio)
+        self.stdout.write(self.style.SUCCESS(f'Snapshot {meta["nombre"]} guardado'))
+
+    def _restaurar(self, directorio, options):
+        if options['nombre']:
+            meta = snapshots_bd.buscar(options['nombre'], directorio)
+        else:
+            esquema = snapshots_bd.version_esquema()
+            compatibles = [m for m in snapshots_bd.listar(directorio) if m['esquema'] == esquema]
+            meta = max(compatibles, key=lambda m: m['creado_en']) if compatibles else None
+        if meta is None:
+            raise CommandError('No se encontró un snapshot para restaurar.')
+        segundos, metodo = snapshots_bd.restaurar(meta, directorio, forzar=options['forzar'])
+        self.stdout.write(self.style.SUCCESS(f'Snapshot {meta["nombre"]} restaurado en {segundos:.2f}s ({metodo})'))
+
+    def _listar(self, directorio, options):
+        esquema = snapshots_bd.version_esquema()
+        for meta in snapshots_bd.listar(directorio):
+            vigente = '' if meta['esquema'] == esquema else ' [otro esquema]'
+            self.stdout.write(f'{meta["nombre"]}  {meta["motor"]}  {meta["creado_en"]}  {meta["parametros"]}{vigente}')
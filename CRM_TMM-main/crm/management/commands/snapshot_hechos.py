@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from crm.utils.factstore import create_snapshot, get_factstore_dir, SNAPSHOT_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Exporta inscripciones y ventas a un snapshot columnar (.npy) para reportes sin consultar la BD'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', type=str, default=None, help='Directorio base de snapshots (por defecto settings.FACTSTORE_DIR)')
+        parser.add_argument('--chunk-size', type=int, default=SNAPSHOT_CHUNK_SIZE, help='Filas por lectura del cursor')
+        parser.add_argument('--conservar', type=int, default=2, help='Cantidad de snapshots antiguos a conservar')
+
+    def handle(self, *args, **options):
+        base_dir = options['dir'] or get_factstore_dir()
+        self.stdout.write(f'Exportando snapshot de hechos en {base_dir}...')
+        inicio = time.monotonic()
+        destino, filas = create_snapshot(base_dir=base_dir, chunk_size=options['chunk_size'], conservar=options['conservar'])
+        duracion = time.monotonic() - inicio
+        resumen = ', '.join(f'{tabla}={n}' for tabla, n in filas.items())
+        self.stdout.write(self.style.SUCCESS(f'Snapshot {destino} listo en {duracion:.1f}s ({resumen})'))
@@ -0,0 +1,33 @@
+from django.utils.functional import SimpleLazyObject
+
+from .utils import carrito
+from .utils.clientes import cliente_de_usuario
+
+
+class CarritoMiddleware:
+    """Persiste el carrito modificado durante la petición (cookie firmada o sesión).
+
+    Debe ir después de SessionMiddleware para que los cambios en la sesión se guarden.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return carrito.persistir(request, response)
+
+
+class ClienteMiddleware:
+    """Agrega `request.cliente`: el Cliente del usuario autenticado (falso si no hay).
+
+    Se resuelve de forma perezosa y a lo sumo una vez por petición, por usuario_id.
+    Debe ir después de AuthenticationMiddleware y JWTAuthMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.cliente = SimpleLazyObject(lambda: cliente_de_usuario(request.user))
+        return self.get_response(request)
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0009_emaillog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PuntajeCliente',
+            fields=[
+                ('cliente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='puntaje', serialize=False, to='crm.cliente')),
+                ('ultima_actividad', models.DateTimeField(blank=True, null=True, verbose_name='Última Actividad')),
+                ('recencia_dias', models.IntegerField(blank=True, null=True, verbose_name='Días desde la Última Actividad')),
+                ('frecuencia', models.PositiveIntegerField(default=0, verbose_name='Inscripciones + Compras')),
+                ('monto_total', models.DecimalField(decimal_places=0, default=0, max_digits=12, verbose_name='Monto Total Pagado')),
+                ('valor_vida', models.DecimalField(decimal_places=0, default=0, max_digits=12, verbose_name='Valor de Vida Estimado (CLP)')),
+                ('puntaje_r', models.PositiveSmallIntegerField(default=1, verbose_name='R')),
+                ('puntaje_f', models.PositiveSmallIntegerField(default=1, verbose_name='F')),
+                ('puntaje_m', models.PositiveSmallIntegerField(default=1, verbose_name='M')),
+                ('puntaje_total', models.PositiveSmallIntegerField(default=3, verbose_name='Puntaje RFM (3-15)')),
+                ('calculado_en', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'verbose_name': 'Puntaje de Cliente (RFM)',
+                'verbose_name_plural': 'Puntajes de Clientes (RFM)',
+                'indexes': [models.Index(fields=['-puntaje_total', '-valor_vida'], name='crm_puntaje_total_idx'), models.Index(fields=['-valor_vida'], name='crm_puntaje_valor_idx')],
+            },
+        ),
+    ]
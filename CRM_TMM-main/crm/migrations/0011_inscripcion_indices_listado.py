@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0010_puntajecliente'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inscripcion',
+            index=models.Index(fields=['-fecha_inscripcion', '-id'], name='crm_insc_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inscripcion',
+            index=models.Index(fields=['estado_pago', '-fecha_inscripcion', '-id'], name='crm_insc_estado_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:13
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+
+def calcular_saldos(apps, schema_editor):
+    Inscripcion = apps.get_model('crm', 'Inscripcion')
+    Taller = apps.get_model('crm', 'Taller')
+    precio = Subquery(Taller.objects.filter(pk=OuterRef('taller_id')).values('precio')[:1])
+    Inscripcion.objects.exclude(estado_pago__in=['PAGADO', 'ANULADO']).update(
+        saldo_pendiente=Greatest(precio - F('monto_pagado'), 0)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0011_inscripcion_indices_listado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inscripcion',
+            name='saldo_pendiente',
+            field=models.DecimalField(decimal_places=0, default=0, editable=False, max_digits=10, verbose_name='Saldo Pendiente'),
+        ),
+        migrations.RunPython(calcular_saldos, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='inscripcion',
+            index=models.Index(condition=models.Q(('saldo_pendiente__gt', 0)), fields=['-saldo_pendiente', 'fecha_inscripcion'], name='crm_insc_saldo_idx'),
+        ),
+    ]
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+# PostgreSQL: unaccent inmutable (requisito para usarlo en índices) + tsvector y trigram
+PG_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE OR REPLACE FUNCTION crm_unaccent(text) RETURNS text AS $$
+        SELECT public.unaccent('public.unaccent'::regdictionary, $1)
+    $$ LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS crm_cliente_busqueda_fts ON crm_cliente USING gin (
+        to_tsvector('simple', crm_unaccent(coalesce(nombre_completo, '') || ' ' ||
+        coalesce(email, '') || ' ' || coalesce(telefono, '')))
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS crm_cliente_nombre_trgm ON crm_cliente USING gin (crm_unaccent(lower(nombre_completo)) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS crm_empresa_busqueda_fts ON crm_empresa USING gin (to_tsvector('simple', crm_unaccent(razon_social)))",
+]
+PG_REVERSE = [
+    "DROP INDEX IF EXISTS crm_empresa_busqueda_fts",
+    "DROP INDEX IF EXISTS crm_cliente_nombre_trgm",
+    "DROP INDEX IF EXISTS crm_cliente_busqueda_fts",
+    "DROP FUNCTION IF EXISTS crm_unaccent(text)",
+]
+
+# SQLite: tabla FTS5 paralela (rowid = id del cliente), sincronizada por señales
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS crm_cliente_fts USING fts5(
+        nombre, email, telefono, empresa,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO crm_cliente_fts (rowid, nombre, email, telefono, empresa)
+    SELECT c.id, c.nombre_completo, c.email, coalesce(c.telefono, ''), coalesce(e.razon_social, '')
+    FROM crm_cliente c LEFT JOIN crm_empresa e ON e.id = c.empresa_id
+    """,
+]
+SQLITE_REVERSE = ["DROP TABLE IF EXISTS crm_cliente_fts"]
+
+
+def _ejecutar(schema_editor, sentencias):
+    for sql in sentencias:
+        schema_editor.execute(sql)
+
+
+def crear_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _ejecutar(schema_editor, PG_FORWARD)
+    elif vendor == 'sqlite':
+        _ejecutar(schema_editor, SQLITE_FORWARD)
+
+
+def eliminar_indices(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _ejecutar(schema_editor, PG_REVERSE)
+    elif vendor == 'sqlite':
+        _ejecutar(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0012_inscripcion_saldo_pendiente'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, eliminar_indices),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0013_busqueda_clientes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cliente',
+            index=models.Index(fields=['-fecha_registro', '-id'], name='crm_cliente_registro_idx'),
+        ),
+    ]
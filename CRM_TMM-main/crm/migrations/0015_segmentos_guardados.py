@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:21
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0014_cliente_indice_listado'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioSegmentacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cliente_id', models.BigIntegerField()),
+                ('registrado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Segmento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100, unique=True, verbose_name='Nombre del Segmento')),
+                ('expresion', models.TextField(verbose_name='Definición')),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('refrescado_en', models.DateTimeField(blank=True, null=True, verbose_name='Último Refresco')),
+                ('ultimo_cambio_id', models.BigIntegerField(default=0, editable=False)),
+                ('total_miembros', models.PositiveIntegerField(default=0, editable=False, verbose_name='Miembros')),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SegmentoMiembro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agregado_en', models.DateTimeField(auto_now_add=True)),
+                ('cliente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='membresias_segmento', to='crm.cliente')),
+                ('segmento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='miembros', to='crm.segmento')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='segmento',
+            name='clientes',
+            field=models.ManyToManyField(blank=True, related_name='segmentos', through='crm.SegmentoMiembro', to='crm.cliente'),
+        ),
+        migrations.AddConstraint(
+            model_name='segmentomiembro',
+            constraint=models.UniqueConstraint(fields=('segmento', 'cliente'), name='crm_segmento_miembro_unico'),
+        ),
+    ]
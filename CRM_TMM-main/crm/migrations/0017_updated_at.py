@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0016_imagen_variantes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Última Modificación'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='taller',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Última Modificación'),
+            preserve_default=False,
+        ),
+    ]
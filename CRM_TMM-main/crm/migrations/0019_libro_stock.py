@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0018_reservas_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='stock_consolidado_hasta',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='stock_actual',
+            field=models.IntegerField(default=0, verbose_name='Stock en Bodega (consolidado)'),
+        ),
+        migrations.CreateModel(
+            name='MovimientoStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('VENTA', 'Venta'), ('REPOSICION', 'Reposición'), ('AJUSTE', 'Ajuste')], max_length=10)),
+                ('cantidad', models.IntegerField(verbose_name='Cantidad (+ entra / - sale)')),
+                ('nota', models.CharField(blank=True, max_length=200)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='movimientos_stock', to='crm.producto')),
+                ('venta', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimientos_stock', to='crm.ventaproducto')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Stock',
+                'verbose_name_plural': 'Movimientos de Stock',
+                'indexes': [models.Index(fields=['producto', 'id'], name='crm_movstock_producto_id')],
+            },
+        ),
+    ]
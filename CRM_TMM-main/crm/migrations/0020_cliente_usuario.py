@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+LOTE = 1000
+
+
+def vincular_por_email(apps, schema_editor):
+    """Vincula cada Cliente con el User de su mismo email, en lotes de usuarios.
+
+    Si varios usuarios comparten email, queda vinculado el de menor id.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Cliente = apps.get_model('crm', 'Cliente')
+    ultimo_id = 0
+    while True:
+        usuarios = list(
+            User.objects.filter(pk__gt=ultimo_id).exclude(email='')
+            .order_by('pk').values_list('pk', 'email')[:LOTE]
+        )
+        if not usuarios:
+            return
+        por_email = {}
+        for pk, email in usuarios:
+            por_email.setdefault(email, pk)
+        clientes = list(Cliente.objects.filter(email__in=por_email, usuario__isnull=True).only('pk', 'email'))
+        usados = set(Cliente.objects.filter(usuario_id__in=por_email.values()).values_list('usuario_id', flat=True))
+        vincular = []
+        for cliente in clientes:
+            usuario_id = por_email[cliente.email]
+            if usuario_id not in usados:
+                cliente.usuario_id = usuario_id
+                usados.add(usuario_id)
+                vincular.append(cliente)
+        Cliente.objects.bulk_update(vincular, ['usuario'], batch_size=LOTE)
+        ultimo_id = usuarios[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0019_libro_stock'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='usuario',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='cliente', to=settings.AUTH_USER_MODEL, verbose_name='Usuario Web'),
+        ),
+        migrations.RunPython(vincular_por_email, migrations.RunPython.noop),
+    ]
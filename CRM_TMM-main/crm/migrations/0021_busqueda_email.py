@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# PostgreSQL: trigram sobre el email para las búsquedas con forma de correo (ver utils/busqueda.py)
+PG_FORWARD = [
+    "CREATE INDEX IF NOT EXISTS crm_cliente_email_trgm ON crm_cliente USING gin (lower(email) gin_trgm_ops)",
+]
+PG_REVERSE = ["DROP INDEX IF EXISTS crm_cliente_email_trgm"]
+
+
+def crear_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in PG_FORWARD:
+            schema_editor.execute(sql)
+
+
+def eliminar_indice(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in PG_REVERSE:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crm', '0020_cliente_usuario'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
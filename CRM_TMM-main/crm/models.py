@@ -1,6 +1,8 @@
 # crm/models.py
+from decimal import Decimal
 from django.db import models
-from django.db.models import F # Necesario para la actualización atómica
+from django.db.models import F, Q, Sum # Necesario para la actualización atómica
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import date
@@ -57,6 +59,11 @@ class Cliente(models.Model):
     email = models.EmailField(unique=True, verbose_name="Correo Electrónico (Contacto)") # Etiqueta actualizada
     telefono = models.CharField(max_length=20, blank=True, null=True, verbose_name="Teléfono (Contacto)") # Etiqueta actualizada
     fecha_nacimiento = models.DateField(blank=True, null=True, verbose_name="Fecha de Nacimiento (si aplica)") # Etiqueta actualizada
+    # Cuenta web del contacto (los invitados no tienen). Se resuelve por id en request.cliente
+    usuario = models.OneToOneField(
+        User, on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='cliente', verbose_name="Usuario Web",
+    )
 
     # --- NUEVO CAMPO: Vínculo con Empresa ---
     empresa = models.ForeignKey(
@@ -76,11 +83,24 @@ class Cliente(models.Model):
     observaciones = models.TextField(blank=True, verbose_name="Observaciones de Gestión (Seguimiento, etc.)")
     fecha_registro = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Orden por defecto de listado_clientes (paginación LIMIT/OFFSET)
+            models.Index(fields=['-fecha_registro', '-id'], name='crm_cliente_registro_idx'),
+        ]
+
     def __str__(self):
         if self.tipo_cliente == 'B2B' and self.empresa:
             return f"{self.nombre_completo} ({self.empresa.razon_social})"
         return f"{self.nombre_completo} ({self.get_tipo_cliente_display()})"
 
+def _incluir_updated_at(kwargs):
+    """auto_now solo se aplica a los campos guardados: con update_fields (p.ej. solo
+    stock_actual o cupos_disponibles) hay que agregar updated_at explícitamente."""
+    if kwargs.get('update_fields') is not None:
+        kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+
+
 # --- MODELO 3: Taller (Sin cambios) ---
 class Taller(models.Model):
     """
@@ -110,12 +130,34 @@ class Taller(models.Model):
     cupos_totales = models.IntegerField(default=10, verbose_name="Cupos Máximos")
     cupos_disponibles = models.IntegerField(editable=False, default=0, verbose_name="Cupos Disponibles")
     esta_activo = models.BooleanField(default=True, verbose_name="¿Está activo/visible?")
+    # Derivados WebP/JPEG redimensionados de `imagen` (ver utils/imagenes.py)
+    imagen_variantes = models.JSONField(default=dict, blank=True, editable=False)
+    # Validador de las respuestas condicionales (ETag/Last-Modified) del catálogo
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última Modificación")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Recordar el precio cargado para detectar cambios al guardar
+        instance._precio_original = instance.__dict__.get('precio')
+        return instance
 
     def save(self, *args, **kwargs):
-        """Inicializa los cupos disponibles al total en la creación."""
+        """Inicializa los cupos disponibles al total en la creación.
+
+        Si cambia el precio de un taller existente, recalcula el saldo pendiente
+        de sus inscripciones con un único UPDATE.
+        """
         if not self.id:
             self.cupos_disponibles = self.cupos_totales
+        _incluir_updated_at(kwargs)
+        precio_cambiado = self.id and getattr(self, '_precio_original', self.precio) != self.precio
         super().save(*args, **kwargs)
+        if precio_cambiado:
+            Inscripcion.objects.filter(taller_id=self.id).exclude(
+                estado_pago__in=Inscripcion.ESTADOS_SIN_SALDO
+            ).update(saldo_pendiente=Greatest(self.precio - F('monto_pagado'), 0))
+        self._precio_original = self.precio
 
     def __str__(self):
         return f"{self.nombre} ({self.fecha_taller})"
@@ -133,15 +175,41 @@ class Inscripcion(models.Model):
         ('ANULADO', 'Anulado'),
     ]
 
+    # Estados que no generan deuda (saldo_pendiente = 0)
+    ESTADOS_SIN_SALDO = ['PAGADO', 'ANULADO']
+
     cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='inscripciones')
     taller = models.ForeignKey(Taller, on_delete=models.CASCADE, related_name='inscripciones')
     monto_pagado = models.DecimalField(max_digits=10, decimal_places=0, default=0, verbose_name="Monto Pagado")
     estado_pago = models.CharField(max_length=10, choices=ESTADO_PAGO_CHOICES, default='PENDIENTE', verbose_name="Estado de Pago")
+    # Deuda vigente (precio del taller - monto pagado). Se mantiene en save() y en las
+    # actualizaciones masivas para poder ordenar/agrupar deudores sin calcularla por fila.
+    saldo_pendiente = models.DecimalField(max_digits=10, decimal_places=0, default=0, editable=False, verbose_name="Saldo Pendiente")
     fecha_inscripcion = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('cliente', 'taller')
         verbose_name_plural = "Inscripciones"
+        indexes = [
+            # Listados paginados de gestion_deudores (todas / por estado, más recientes primero)
+            models.Index(fields=['-fecha_inscripcion', '-id'], name='crm_insc_fecha_idx'),
+            models.Index(fields=['estado_pago', '-fecha_inscripcion', '-id'], name='crm_insc_estado_fecha_idx'),
+            # Deudores ordenados por monto adeudado y reporte de antigüedad (solo filas con deuda)
+            models.Index(fields=['-saldo_pendiente', 'fecha_inscripcion'], name='crm_insc_saldo_idx', condition=Q(saldo_pendiente__gt=0)),
+        ]
+
+    def calcular_saldo(self):
+        """Saldo adeudado según el estado de pago y el precio del taller."""
+        if self.estado_pago in self.ESTADOS_SIN_SALDO:
+            return Decimal(0)
+        return max(Decimal(self.taller.precio) - Decimal(self.monto_pagado or 0), Decimal(0))
+
+    def save(self, *args, **kwargs):
+        self.saldo_pendiente = self.calcular_saldo()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'saldo_pendiente' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['saldo_pendiente']
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.cliente.nombre_completo} inscrito en {self.taller.nombre}"
@@ -158,11 +226,54 @@ class Producto(models.Model):
     precio_venta = models.DecimalField(max_digits=10, decimal_places=0, verbose_name="Precio de Venta (CLP)")
     esta_disponible = models.BooleanField(default=True, verbose_name="¿Está disponible para la venta?")
     imagen = models.ImageField(upload_to='productos/', blank=True, null=True, verbose_name="Imagen del Producto")
-    stock_actual = models.IntegerField(default=0, verbose_name="Stock Actual en Bodega")
+    # Stock a la fecha de la última consolidación del libro (MovimientoStock); el vigente
+    # es este valor más los movimientos posteriores (ver stock_vigente y utils/stock.py)
+    stock_actual = models.IntegerField(default=0, verbose_name="Stock en Bodega (consolidado)")
+    stock_consolidado_hasta = models.BigIntegerField(default=0, editable=False)
+    # Suma de las ReservaStock vigentes (contador mantenido por utils/reservas.py)
+    stock_reservado = models.IntegerField(default=0, editable=False, verbose_name="Stock Reservado en Carritos")
+    # Derivados WebP/JPEG redimensionados de `imagen` (ver utils/imagenes.py)
+    imagen_variantes = models.JSONField(default=dict, blank=True, editable=False)
+    # Validador de las respuestas condicionales (ETag/Last-Modified) del catálogo
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última Modificación")
+
+    # Contadores que mantienen utils/stock.py y utils/reservas.py con UPDATE atómicos
+    CAMPOS_MANTENIDOS = ('stock_actual', 'stock_consolidado_hasta', 'stock_reservado')
 
     class Meta:
         verbose_name_plural = "Productos (Kits)"
 
+    def save(self, *args, **kwargs):
+        # Un save() completo de una fila existente (p.ej. el admin) no debe reescribir los
+        # contadores con los valores leídos al cargar el objeto: se pierden reservas y
+        # consolidaciones hechas entretanto. Para fijarlos hay que nombrarlos en update_fields.
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.CAMPOS_MANTENIDOS
+            ]
+        _incluir_updated_at(kwargs)
+        super().save(*args, **kwargs)
+
+    @property
+    def stock_vigente(self):
+        """Stock consolidado más los movimientos posteriores.
+
+        Usa la anotación `stock_movido` de utils.stock.con_stock si está; si no, la consulta
+        recorre solo los movimientos desde la última consolidación.
+        """
+        movido = getattr(self, 'stock_movido', None)
+        if movido is None:
+            movido = self.movimientos_stock.filter(
+                pk__gt=self.stock_consolidado_hasta
+            ).aggregate(total=Sum('cantidad'))['total'] or 0
+        return self.stock_actual + movido
+
+    @property
+    def stock_disponible(self):
+        """Unidades que aún se pueden agregar a un carrito."""
+        return max(self.stock_vigente - self.stock_reservado, 0)
+
     def __str__(self):
         return self.nombre
 
@@ -230,4 +341,142 @@ class EmailLog(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"Email to {self.recipient} [{self.status}] at {self.created_at}"
\ No newline at end of file
+        return f"Email to {self.recipient} [{self.status}] at {self.created_at}"
+
+# --- MODELO 9: PuntajeCliente (Valor del cliente calculado en lote) ---
+class PuntajeCliente(models.Model):
+    """Puntaje RFM (Recencia, Frecuencia, Monto) y valor de vida de un cliente.
+
+    No se calcula en cada request: lo escribe el comando `calcular_puntajes`
+    (pensado para ejecutarse cada noche) usando consultas agregadas y puntajes
+    por quintiles calculados con NumPy. Permite ordenar y filtrar el listado
+    de clientes por valor sin agregar inscripciones/ventas por fila.
+    """
+    cliente = models.OneToOneField(Cliente, on_delete=models.CASCADE, primary_key=True, related_name='puntaje')
+    ultima_actividad = models.DateTimeField(blank=True, null=True, verbose_name="Última Actividad")
+    recencia_dias = models.IntegerField(blank=True, null=True, verbose_name="Días desde la Última Actividad")
+    frecuencia = models.PositiveIntegerField(default=0, verbose_name="Inscripciones + Compras")
+    monto_total = models.DecimalField(max_digits=12, decimal_places=0, default=0, verbose_name="Monto Total Pagado")
+    valor_vida = models.DecimalField(max_digits=12, decimal_places=0, default=0, verbose_name="Valor de Vida Estimado (CLP)")
+    puntaje_r = models.PositiveSmallIntegerField(default=1, verbose_name="R")
+    puntaje_f = models.PositiveSmallIntegerField(default=1, verbose_name="F")
+    puntaje_m = models.PositiveSmallIntegerField(default=1, verbose_name="M")
+    puntaje_total = models.PositiveSmallIntegerField(default=3, verbose_name="Puntaje RFM (3-15)")
+    calculado_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        verbose_name = "Puntaje de Cliente (RFM)"
+        verbose_name_plural = "Puntajes de Clientes (RFM)"
+        indexes = [
+            models.Index(fields=['-puntaje_total', '-valor_vida'], name='crm_puntaje_total_idx'),
+            models.Index(fields=['-valor_vida'], name='crm_puntaje_valor_idx'),
+        ]
+
+    @property
+    def codigo_rfm(self):
+        return f"{self.puntaje_r}{self.puntaje_f}{self.puntaje_m}"
+
+    def __str__(self):
+        return f"{self.cliente_id}: RFM {self.codigo_rfm} (${self.valor_vida})"
+
+
+# --- MODELO 10: Segmentos guardados (membresía materializada) ---
+class Segmento(models.Model):
+    """Segmento de clientes con nombre y definición guardada.
+
+    La definición usa la sintaxis de expresiones de `utils/segmentos.py`
+    (p.ej. `tipo:B2C AND interes:Resina AND deuda`). Los miembros se materializan
+    en SegmentoMiembro y se refrescan solo para los clientes registrados en
+    CambioSegmentacion desde el último refresco.
+    """
+    nombre = models.CharField(max_length=100, unique=True, verbose_name="Nombre del Segmento")
+    expresion = models.TextField(verbose_name="Definición")
+    creado_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    refrescado_en = models.DateTimeField(blank=True, null=True, verbose_name="Último Refresco")
+    ultimo_cambio_id = models.BigIntegerField(default=0, editable=False)
+    total_miembros = models.PositiveIntegerField(default=0, editable=False, verbose_name="Miembros")
+    clientes = models.ManyToManyField(Cliente, through='SegmentoMiembro', related_name='segmentos', blank=True)
+
+    class Meta:
+        ordering = ['nombre']
+
+    def __str__(self):
+        return f"{self.nombre} ({self.total_miembros})"
+
+
+class SegmentoMiembro(models.Model):
+    segmento = models.ForeignKey(Segmento, on_delete=models.CASCADE, related_name='miembros')
+    cliente = models.ForeignKey(Cliente, on_delete=models.CASCADE, related_name='membresias_segmento')
+    agregado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # También es el índice para leer los miembros de un segmento (segmento_id, cliente_id)
+            models.UniqueConstraint(fields=['segmento', 'cliente'], name='crm_segmento_miembro_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.segmento_id} -> {self.cliente_id}"
+
+
+class CambioSegmentacion(models.Model):
+    """Registro de clientes tocados (datos, intereses o inscripciones) pendientes de re-segmentar."""
+    cliente_id = models.BigIntegerField()
+    registrado_en = models.DateTimeField(auto_now_add=True)
+
+
+# --- MODELO 11: ReservaStock (unidades apartadas por un carrito) ---
+class ReservaStock(models.Model):
+    """Reserva temporal de unidades de un Producto hecha al agregarlo al carrito.
+
+    El carrito guarda el id de su reserva por producto. Las vencidas se liberan
+    en lote con el comando `liberar_reservas`.
+    """
+    producto = models.ForeignKey(Producto, on_delete=models.CASCADE, related_name='reservas')
+    cantidad = models.PositiveIntegerField()
+    expira_en = models.DateTimeField(db_index=True)
+    creada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Reserva de Stock"
+        verbose_name_plural = "Reservas de Stock"
+
+    def __str__(self):
+        return f"{self.cantidad} x {self.producto_id} hasta {self.expira_en:%Y-%m-%d %H:%M}"
+
+
+# --- MODELO 12: MovimientoStock (libro de stock, solo inserciones) ---
+class MovimientoStock(models.Model):
+    """Entrada del libro de stock: ventas (negativas), reposiciones y ajustes.
+
+    Nunca se modifica ni se borra. El comando `consolidar_stock` pliega los
+    movimientos en Producto.stock_actual; el historial queda para auditoría.
+
+    El libro aporta trazabilidad, no concurrencia: cada inserción se hace con la
+    fila del Producto bloqueada (ver utils/stock.py), así que las compras de un
+    mismo producto se siguen serializando igual que antes.
+    """
+    TIPO_CHOICES = [
+        ('VENTA', 'Venta'),
+        ('REPOSICION', 'Reposición'),
+        ('AJUSTE', 'Ajuste'),
+    ]
+
+    producto = models.ForeignKey(Producto, on_delete=models.PROTECT, related_name='movimientos_stock')
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    cantidad = models.IntegerField(verbose_name="Cantidad (+ entra / - sale)")
+    venta = models.ForeignKey(VentaProducto, on_delete=models.SET_NULL, null=True, blank=True, related_name='movimientos_stock')
+    nota = models.CharField(max_length=200, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Movimiento de Stock"
+        verbose_name_plural = "Movimientos de Stock"
+        indexes = [
+            # Lectura del stock vigente: movimientos de un producto posteriores a su consolidación
+            models.Index(fields=['producto', 'id'], name='crm_movstock_producto_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} {self.cantidad:+d} de {self.producto_id}"
@@ -0,0 +1,42 @@
+"""
+Motor de sesiones para varios nodos de la aplicación detrás de un balanceador
+(SESSION_ENGINE = 'crm.sesiones', se activa con SESIONES_EN_CACHE).
+
+Las sesiones viven en la caché compartida (CACHES['default'], p.ej. Redis o
+memcached). Solo las sesiones autenticadas se escriben además en django_session
+(write-through), para que un reinicio o desalojo de la caché no cierre la sesión
+de nadie. Las sesiones anónimas (carrito, mensajes) no tocan la base de datos.
+"""
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+
+class SessionStore(CachedDBStore):
+
+    def _autenticada(self, must_create=False):
+        return SESSION_KEY in self._get_session(no_load=must_create)
+
+    def exists(self, session_key):
+        # Solo se consulta la caché al generar claves nuevas: una colisión con una sesión
+        # que solo está en la BD la detecta el INSERT (must_create) del write-through.
+        return bool(session_key) and (self.cache_key_prefix + session_key) in self._cache
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        if not self._autenticada(must_create):
+            return self._guardar_en_cache(must_create)
+        try:
+            super().save(must_create)
+        except UpdateError:
+            # Sesión que hasta ahora era anónima (solo en caché): primer guardado en la BD
+            super().save(must_create=True)
+
+    def _guardar_en_cache(self, must_create):
+        datos = self._get_session(no_load=must_create)
+        if must_create:
+            if not self._cache.add(self.cache_key, datos, self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, datos, self.get_expiry_age())
@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from .models import Cliente, Empresa, Inscripcion, Interes, Producto, Taller
+from .utils import segmentos
+from .utils import cache_catalogo, cupos, imagenes
+from .utils.busqueda import desindexar_cliente, indexar_clientes
+from .utils.clientes import olvidar_sin_cliente
+from .utils.deudores import invalidar_conteos
+from .utils.segmentos_guardados import registrar_cambio
+
+
+@receiver([post_save, post_delete], sender=Inscripcion)
+def inscripcion_cambiada(sender, instance, **kwargs):
+    """Invalida los conteos cacheados de gestion_deudores al cambiar una inscripción.
+
+    Tras el commit: si se invalidara antes, una lectura concurrente podría volver a
+    cachear el conteo previo bajo la versión nueva.
+    """
+    transaction.on_commit(invalidar_conteos)
+    _actualizar_segmentos(instance.cliente_id)
+
+
+@receiver(post_save, sender=Cliente)
+def cliente_guardado(sender, instance, **kwargs):
+    """Mantiene al día el índice de búsqueda de clientes (FTS5 en SQLite)."""
+    indexar_clientes([instance.pk])
+    _actualizar_segmentos(instance.pk)
+    if instance.usuario_id:
+        # El usuario ya tiene cliente: olvidar la ausencia recordada por cliente_de_usuario
+        usuario_id = instance.usuario_id
+        transaction.on_commit(lambda: olvidar_sin_cliente(usuario_id))
+
+
+@receiver(post_delete, sender=Cliente)
+def cliente_eliminado(sender, instance, **kwargs):
+    desindexar_cliente(instance.pk)
+    _actualizar_segmentos(instance.pk)
+
+
+@receiver(post_save, sender=Empresa)
+def empresa_guardada(sender, instance, created, **kwargs):
+    """La razón social se indexa junto a cada contacto de la empresa."""
+    if not created:
+        indexar_clientes(list(instance.contactos.values_list('id', flat=True)))
+
+
+def _actualizar_segmentos(cliente_id):
+    # El registro para los segmentos guardados va en la misma transacción que el cambio
+    registrar_cambio([cliente_id])
+    # Tras el commit: el índice en memoria solo debe reflejar datos confirmados
+    transaction.on_commit(segmentos.cambios_registrados)
+
+
+@receiver(m2m_changed, sender=Cliente.intereses_cliente.through)
+def intereses_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    """Refleja en el índice de segmentación los intereses agregados o quitados."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _actualizar_segmentos(instance.pk)
+    else:
+        # Cambio desde el lado del Interes: puede tocar muchos clientes
+        if pk_set:
+            registrar_cambio(pk_set)
+            transaction.on_commit(segmentos.cambios_registrados)
+        else:
+            # clear() no informa qué clientes tenía el interés
+            transaction.on_commit(segmentos.invalidar_indice)
+
+
+@receiver([post_save, post_delete], sender=Interes)
+def interes_cambiado(sender, instance, **kwargs):
+    """Los nombres de interés se resuelven desde el índice: reconstruir."""
+    transaction.on_commit(segmentos.invalidar_indice)
+    # La categoría se muestra en el detalle de cada taller
+    transaction.on_commit(lambda: cache_catalogo.invalidar('categorias'))
+
+
+@receiver([post_save, post_delete], sender=Taller)
+def taller_cambiado(sender, instance, signal, **kwargs):
+    """Invalida el catálogo y el detalle cacheados y publica los cupos al feed de SSE."""
+    cache_catalogo.invalidar_talleres([instance.pk])
+    pk, disponibles, totales = instance.pk, instance.cupos_disponibles, instance.cupos_totales
+    if signal is post_delete:
+        transaction.on_commit(lambda: cupos.retirar(pk))
+    else:
+        transaction.on_commit(lambda: cupos.publicar(pk, disponibles, totales))
+        if imagenes.pendiente(instance):
+            imagenes.encolar(instance)
+
+
+@receiver([post_save, post_delete], sender=Producto)
+def producto_cambiado(sender, instance, signal, **kwargs):
+    """Invalida el catálogo y el detalle cacheados (los movimientos de stock invalidan en utils/stock.py)."""
+    cache_catalogo.invalidar_productos([instance.pk])
+    if signal is post_save and imagenes.pendiente(instance):
+        imagenes.encolar(instance)
@@ -0,0 +1,142 @@
+"""
+Stream SSE de cupos de talleres (/talleres/cupos/stream/?ids=1,2).
+
+Se monta directamente en tmm_project/asgi.py, sin pasar por el middleware de
+Django: cada conexión es solo una cola en memoria. Un único Difusor por proceso
+lee el feed de cambios de crm/utils/cupos.py (una consulta a la caché por
+intervalo, no una por cliente) y reparte los eventos a las conexiones
+interesadas en cada taller.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from .utils import cupos
+
+
+STREAM_PATH = '/talleres/cupos/stream/'
+INTERVALO = 1.0          # segundos entre lecturas del feed
+KEEPALIVE = 15.0         # comentario SSE para mantener viva la conexión
+MAX_EVENTOS_POR_LECTURA = 500
+TAMANO_COLA = 100
+
+
+class Difusor:
+    """Lee el feed de cupos una vez por intervalo y lo reparte a los suscriptores."""
+
+    def __init__(self, intervalo=INTERVALO):
+        self.intervalo = intervalo
+        self.suscriptores = {}  # cola -> set de ids (vacío = todos los talleres)
+        self.ultimo_seq = None
+        self._tarea = None
+
+    def suscribir(self, ids):
+        cola = asyncio.Queue(maxsize=TAMANO_COLA)
+        self.suscriptores[cola] = set(ids)
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._bucle())
+        return cola
+
+    def desuscribir(self, cola):
+        self.suscriptores.pop(cola, None)
+
+    async def _bucle(self):
+        while self.suscriptores:
+            await self.revisar()
+            await asyncio.sleep(self.intervalo)
+        # Sin conexiones no se consulta el feed; al volver se retoma desde el seq vigente
+        self.ultimo_seq = None
+
+    async def revisar(self):
+        seq = await cache.aget(cupos._SEQ_KEY, 0)
+        if self.ultimo_seq is None or seq < self.ultimo_seq:
+            self.ultimo_seq = seq
+            return
+        if seq == self.ultimo_seq:
+            return
+        desde = max(self.ultimo_seq + 1, seq - MAX_EVENTOS_POR_LECTURA + 1)
+        claves = [cupos.clave_evento(n) for n in range(desde, seq + 1)]
+        eventos = await cache.aget_many(claves)
+        self.ultimo_seq = seq
+        # Un taller que cambió varias veces se envía una sola vez con su último valor
+        ultimos = {}
+        for clave in claves:
+            if clave in eventos:
+                taller_id, disponibles, totales = eventos[clave]
+                ultimos[taller_id] = {'disponibles': disponibles, 'totales': totales}
+        for cola, ids in list(self.suscriptores.items()):
+            cambios = {pk: valor for pk, valor in ultimos.items() if not ids or pk in ids}
+            if not cambios:
+                continue
+            try:
+                cola.put_nowait(cambios)
+            except asyncio.QueueFull:
+                # Cliente lento: se vacía su cola y se cierra el stream (EventSource reconecta solo)
+                self.desuscribir(cola)
+                while not cola.empty():
+                    cola.get_nowait()
+                cola.put_nowait(None)
+
+
+difusor = Difusor()
+
+
+def _evento(datos):
+    cuerpo = json.dumps({str(pk): valor for pk, valor in datos.items()})
+    return f'event: cupos\ndata: {cuerpo}\n\n'.encode()
+
+
+async def _esperar_desconexion(receive):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            return
+
+
+async def app_cupos(scope, receive, send):
+    """Aplicación ASGI del stream: estado inicial y luego solo los cambios."""
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    parametros = parse_qs(scope.get('query_string', b'').decode())
+    ids = cupos.parsear_ids(','.join(parametros.get('ids', [])))
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+    cola = difusor.suscribir(ids)
+    desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+    try:
+        if ids:
+            inicial = await sync_to_async(cupos.cupos_de)(ids)
+            await send({'type': 'http.response.body', 'body': _evento(inicial), 'more_body': True})
+        while True:
+            siguiente = asyncio.ensure_future(cola.get())
+            hechos, _ = await asyncio.wait(
+                {siguiente, desconexion}, timeout=KEEPALIVE, return_when=asyncio.FIRST_COMPLETED
+            )
+            if desconexion in hechos:
+                siguiente.cancel()
+                return
+            if siguiente not in hechos:
+                siguiente.cancel()
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                continue
+            cambios = siguiente.result()
+            if cambios is None:
+                break
+            await send({'type': 'http.response.body', 'body': _evento(cambios), 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        difusor.desuscribir(cola)
+        desconexion.cancel()
@@ -1,4 +1,8 @@
 from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..utils import cache_catalogo
+from ..utils.imagenes import srcset
 
 # Crea una instancia de la librería de plantillas
 register = template.Library()
@@ -15,4 +19,36 @@ def sub(value, arg):
         return float(value) - float(arg)
     except (ValueError, TypeError):
         # Devuelve el valor original si hay un error (ej. si no son números)
-        return value
\ No newline at end of file
+        return value
+
+@register.simple_tag
+def imagen_responsive(obj, variante, alt='', sizes='100vw', **atributos):
+    """
+    <picture> con srcset WebP/JPEG de los derivados de `obj.imagen` (ver utils/imagenes.py).
+    Uso: {% imagen_responsive taller 'tarjeta' alt=taller.nombre sizes='300px' style='...' %}
+
+    Mientras los derivados no estén listos se usa la imagen original.
+    """
+    if not obj.imagen:
+        return ''
+    extra = format_html_join('', ' {}="{}"', atributos.items())
+    webp = srcset(obj, variante, 'webp')
+    jpeg = srcset(obj, variante, 'jpeg')
+    if not jpeg:
+        return format_html('<img src="{}" alt="{}" loading="lazy"{}>', obj.imagen.url, alt, extra)
+    # El src por defecto es el ancho menor (1x)
+    src = jpeg.split(', ')[0].rsplit(' ', 1)[0]
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"{}></picture>',
+        webp, sizes, src, jpeg, sizes, alt, extra,
+    )
+
+
+@register.simple_tag
+def disponibles_producto(producto):
+    """
+    Marcador de las unidades disponibles, reemplazado al responder (ver cache_catalogo.insertar_disponibles).
+    Uso: {% disponibles_producto producto %}
+    """
+    return cache_catalogo.marcador_stock(producto.pk)
@@ -0,0 +1,225 @@
+# crm/tests/test_reportes.py
+import datetime
+import tempfile
+from unittest import mock
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from crm.models import Taller, Cliente, Inscripcion, PuntajeCliente, VentaProducto, Interes, Producto, DetalleVenta
+from crm.utils.cohorts import build_cohort_matrix, get_cohort_report
+from crm.utils.scoring import calcular_puntajes, quintile_scores
+from crm.utils.factstore import FactStore, create_snapshot
+
+
+class CohortMatrixTests(TestCase):
+
+    def test_matriz_vectorizada(self):
+        """Cuenta clientes distintos por cohorte y desfase, ignorando repeticiones en el mismo mes."""
+        # Cliente 1: cohorte mes 10, vuelve en +1 (dos veces) y +3
+        # Cliente 2: cohorte mes 10, no vuelve
+        # Cliente 3: cohorte mes 11, vuelve en +1
+        clientes = np.array([1, 1, 1, 1, 2, 3, 3])
+        meses = np.array([10, 11, 11, 13, 10, 11, 12])
+        primer_mes, matriz = build_cohort_matrix(clientes, meses, horizon=3)
+
+        self.assertEqual(primer_mes, 10)
+        self.assertEqual(matriz.tolist(), [
+            [2, 1, 0, 1],
+            [1, 1, 0, 0],
+        ])
+
+    def test_matriz_vacia(self):
+        primer_mes, matriz = build_cohort_matrix([], [], horizon=12)
+        self.assertIsNone(primer_mes)
+        self.assertEqual(matriz.shape, (0, 13))
+
+
+class CohortReportTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.talleres = [
+            Taller.objects.create(
+                nombre=f'Taller {i}', descripcion='desc', precio=Decimal('10000'),
+                cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1)
+            )
+            for i in range(3)
+        ]
+        self.ana = Cliente.objects.create(nombre_completo='Ana', email='ana@test.com')
+        self.bea = Cliente.objects.create(nombre_completo='Bea', email='bea@test.com')
+
+    def _inscribir(self, cliente, taller, fecha, estado='PAGADO'):
+        ins = Inscripcion.objects.create(cliente=cliente, taller=taller, estado_pago=estado)
+        # fecha_inscripcion es auto_now_add: se fija con update()
+        Inscripcion.objects.filter(pk=ins.pk).update(fecha_inscripcion=fecha)
+
+    def test_reporte_excluye_anuladas_y_usa_cache(self):
+        tz = timezone.get_current_timezone()
+        self._inscribir(self.ana, self.talleres[0], datetime.datetime(2024, 1, 15, 12, tzinfo=tz))
+        self._inscribir(self.ana, self.talleres[1], datetime.datetime(2024, 2, 15, 12, tzinfo=tz))
+        self._inscribir(self.bea, self.talleres[0], datetime.datetime(2024, 1, 20, 12, tzinfo=tz))
+        self._inscribir(self.bea, self.talleres[2], datetime.datetime(2024, 3, 20, 12, tzinfo=tz), estado='ANULADO')
+
+        reporte = get_cohort_report()
+        self.assertEqual(len(reporte['filas']), 1)
+        fila = reporte['filas'][0]
+        self.assertEqual((fila['anio'], fila['mes'], fila['clientes']), (2024, 1, 2))
+        self.assertEqual(fila['retencion'][:3], [50.0, 0.0, 0.0])
+
+        # Una nueva inscripción no se refleja hasta que expira la caché o se fuerza el recálculo
+        self._inscribir(self.bea, self.talleres[1], datetime.datetime(2024, 2, 1, 12, tzinfo=tz))
+        self.assertEqual(get_cohort_report()['filas'][0]['retencion'][0], 50.0)
+        self.assertEqual(get_cohort_report(refresh=True)['filas'][0]['retencion'][0], 100.0)
+
+    def test_panel_reportes_muestra_cohortes(self):
+        User.objects.create_superuser(username='admin_test', email='admin@test.com', password='adminpass')
+        self.client.login(username='admin_test', password='adminpass')
+        self._inscribir(self.ana, self.talleres[0], timezone.now())
+
+        response = self.client.get(reverse('panel_reportes'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['cohorte_filas']), 1)
+        self.assertContains(response, 'Retención por Cohortes')
+
+
+class PuntajeClienteTests(TestCase):
+
+    def setUp(self):
+        self.taller = Taller.objects.create(
+            nombre='Taller RFM', descripcion='desc', precio=Decimal('20000'),
+            cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1)
+        )
+        self.otro_taller = Taller.objects.create(
+            nombre='Taller RFM 2', descripcion='desc', precio=Decimal('20000'),
+            cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1)
+        )
+        self.fiel = Cliente.objects.create(nombre_completo='Fiel', email='fiel@test.com')
+        self.ocasional = Cliente.objects.create(nombre_completo='Ocasional', email='ocasional@test.com')
+        self.inactivo = Cliente.objects.create(nombre_completo='Inactivo', email='inactivo@test.com')
+
+        Inscripcion.objects.create(cliente=self.fiel, taller=self.taller, estado_pago='PAGADO', monto_pagado=Decimal('20000'))
+        Inscripcion.objects.create(cliente=self.fiel, taller=self.otro_taller, estado_pago='ABONADO', monto_pagado=Decimal('5000'))
+        VentaProducto.objects.create(cliente=self.fiel, monto_total=Decimal('15000'), estado_pago='PAGADO')
+        ins = Inscripcion.objects.create(cliente=self.ocasional, taller=self.taller, estado_pago='PENDIENTE')
+        Inscripcion.objects.filter(pk=ins.pk).update(fecha_inscripcion=timezone.now() - datetime.timedelta(days=200))
+
+    def test_quintiles(self):
+        poblacion = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+        self.assertEqual(quintile_scores([1, 10], poblacion).tolist(), [1, 5])
+        self.assertEqual(quintile_scores([1, 10], poblacion, invertir=True).tolist(), [5, 1])
+
+    def test_calculo_completo(self):
+        self.assertEqual(calcular_puntajes(completo=True), 3)
+
+        fiel = PuntajeCliente.objects.get(cliente=self.fiel)
+        self.assertEqual(fiel.frecuencia, 3)
+        self.assertEqual(fiel.monto_total, 40000)
+        self.assertEqual(fiel.recencia_dias, 0)
+        self.assertGreater(fiel.valor_vida, fiel.monto_total)
+
+        ocasional = PuntajeCliente.objects.get(cliente=self.ocasional)
+        self.assertEqual(ocasional.recencia_dias, 200)
+        self.assertLess(ocasional.puntaje_total, fiel.puntaje_total)
+
+        inactivo = PuntajeCliente.objects.get(cliente=self.inactivo)
+        self.assertIsNone(inactivo.recencia_dias)
+        self.assertEqual(inactivo.puntaje_total, 3)
+
+    def test_calculo_incremental_solo_clientes_tocados(self):
+        calcular_puntajes(completo=True)
+        nuevo = Cliente.objects.create(nombre_completo='Nuevo', email='nuevo@test.com')
+        Inscripcion.objects.create(cliente=nuevo, taller=self.otro_taller, estado_pago='PAGADO', monto_pagado=Decimal('20000'))
+
+        self.assertEqual(calcular_puntajes(), 1)
+        self.assertEqual(PuntajeCliente.objects.get(cliente=nuevo).frecuencia, 1)
+
+    def test_calculo_incremental_actualiza_recencia_del_resto(self):
+        calcular_puntajes(completo=True)
+        ocasional = PuntajeCliente.objects.get(cliente=self.ocasional)
+
+        self.assertEqual(calcular_puntajes(ahora=timezone.now() + datetime.timedelta(days=30)), 0)
+        refrescado = PuntajeCliente.objects.get(cliente=self.ocasional)
+        self.assertEqual(refrescado.recencia_dias, 230)
+        self.assertEqual(refrescado.puntaje_total, refrescado.puntaje_r + refrescado.puntaje_f + refrescado.puntaje_m)
+        self.assertEqual(refrescado.calculado_en, ocasional.calculado_en)
+        self.assertIsNone(PuntajeCliente.objects.get(cliente=self.inactivo).recencia_dias)
+
+    def test_listado_clientes_ordena_y_filtra_por_puntaje(self):
+        calcular_puntajes(completo=True)
+        User.objects.create_superuser(username='admin_test', email='admin@test.com', password='adminpass')
+        self.client.login(username='admin_test', password='adminpass')
+
+        response = self.client.get(reverse('listado_clientes'), {'orden': 'valor'})
+        self.assertEqual(list(response.context['clientes'])[0], self.fiel)
+
+        minimo = PuntajeCliente.objects.get(cliente=self.fiel).puntaje_total
+        response = self.client.get(reverse('listado_clientes'), {'puntaje_min': minimo})
+        self.assertEqual(list(response.context['clientes']), [self.fiel])
+
+
+class FactStoreTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        resina = Interes.objects.create(nombre='Resina')
+        self.taller = Taller.objects.create(
+            nombre='Taller Snapshot', descripcion='desc', precio=Decimal('10000'), categoria=resina,
+            cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1), modalidad='ONLINE'
+        )
+        self.sin_categoria = Taller.objects.create(
+            nombre='Taller Libre', descripcion='desc', precio=Decimal('8000'),
+            cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1)
+        )
+        ana = Cliente.objects.create(nombre_completo='Ana', email='ana@test.com')
+        bea = Cliente.objects.create(nombre_completo='Bea', email='bea@test.com')
+        Inscripcion.objects.create(cliente=ana, taller=self.taller, estado_pago='PAGADO', monto_pagado=Decimal('10000'))
+        Inscripcion.objects.create(cliente=bea, taller=self.taller, estado_pago='PENDIENTE')
+        Inscripcion.objects.create(cliente=bea, taller=self.sin_categoria, estado_pago='ABONADO', monto_pagado=Decimal('3000'))
+        producto = Producto.objects.create(nombre='Kit', precio_venta=Decimal('5000'), stock_actual=5)
+        venta = VentaProducto.objects.create(cliente=ana, monto_total=Decimal('10000'))
+        DetalleVenta.objects.create(venta=venta, producto=producto, cantidad=2, precio_unitario=Decimal('5000'))
+
+    def test_snapshot_y_consultas(self):
+        _, filas = create_snapshot(base_dir=self.tmp.name)
+        self.assertEqual(filas, {'inscripciones': 3, 'ventas': 1, 'detalles': 1})
+
+        store = FactStore(base_dir=self.tmp.name)
+        ins = store.table('inscripciones')
+        self.assertIsInstance(ins.column('monto'), np.memmap)
+
+        pagadas = ins.mask(estado_pago__in=['PAGADO', 'ABONADO'])
+        self.assertEqual(int(pagadas.sum()), 2)
+        claves, totales = ins.group_by('taller_id', 'monto', mask=pagadas)
+        self.assertEqual(dict(zip(claves.tolist(), totales.tolist())), {self.taller.id: 10000.0, self.sin_categoria.id: 3000.0})
+        self.assertEqual(int(ins.mask(modalidad='ONLINE', fecha__gte=timezone.localdate()).sum()), 2)
+
+        detalles = store.table('detalles')
+        self.assertEqual(int(detalles.column('cantidad').sum()), 2)
+
+    @override_settings(REPORTES_DESDE_SNAPSHOT=True)
+    def test_panel_reportes_desde_snapshot_coincide_con_orm(self):
+        User.objects.create_superuser(username='admin_test', email='admin@test.com', password='adminpass')
+        self.client.login(username='admin_test', password='adminpass')
+        claves = ['ingresos_totales', 'ingresos_labels', 'ingresos_data', 'categoria_labels', 'categoria_data',
+                  'categoria_ids', 'modalidad_keys', 'modalidad_data', 'ingresos_categoria_labels', 'ingresos_categoria_data']
+
+        with self.settings(FACTSTORE_DIR=self.tmp.name):
+            # Sin snapshot: la vista usa el ORM
+            orm = self.client.get(reverse('panel_reportes')).context
+            self.assertIsNone(orm['snapshot_creado'])
+
+            create_snapshot()
+            with mock.patch('crm.views._series_ingresos_bd') as series_bd:
+                snap = self.client.get(reverse('panel_reportes')).context
+            series_bd.assert_not_called()
+            self.assertIsNotNone(snap['snapshot_creado'])
+
+        for clave in claves:
+            self.assertEqual(list(snap[clave]) if isinstance(snap[clave], list) else snap[clave], orm[clave], clave)
@@ -0,0 +1,242 @@
+# crm/tests/test_segmentos.py
+import datetime
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from crm.models import CambioSegmentacion, Cliente, Inscripcion, Interes, Segmento, Taller
+from crm.utils import segmentos
+from crm.utils.deudores import cambiar_estado_masivo
+from crm.utils.segmentos import Bitmap, ExpresionInvalida, IndiceSegmentos, expresion_a_q, parsear
+from crm.utils.segmentos_guardados import purgar_cambios, refrescar_segmento, registrar_cambio
+
+
+class BitmapTests(TestCase):
+
+    def test_operaciones_entre_bloques(self):
+        a = Bitmap.desde_ids([1, 5, 70000, 140000])
+        b = Bitmap.desde_ids([5, 70000, 9])
+        self.assertEqual((a & b).ids().tolist(), [5, 70000])
+        self.assertEqual((a | b).ids().tolist(), [1, 5, 9, 70000, 140000])
+        self.assertEqual((a - b).ids().tolist(), [1, 140000])
+        self.assertEqual(len(a), 4)
+
+        a.quitar(70000)
+        a.agregar(3)
+        self.assertNotIn(70000, a)
+        self.assertIn(3, a)
+
+    def test_pagina_descendente_salta_bloques(self):
+        bitmap = Bitmap.desde_ids(list(range(1, 11)) + [70001, 70002])
+        self.assertEqual(bitmap.pagina(0, 3), [70002, 70001, 10])
+        self.assertEqual(bitmap.pagina(2, 3), [10, 9, 8])
+        self.assertEqual(bitmap.pagina(11, 5), [1])
+
+
+class ExpresionTests(TestCase):
+
+    def test_precedencia_y_sinonimos(self):
+        self.assertEqual(
+            parsear('interes:3 AND tipo:B2C OR NOT deuda'),
+            ('or', ('and', ('atomo', 'interes', '3'), ('atomo', 'tipo', 'B2C')), ('not', ('atomo', 'deuda', None))),
+        )
+        self.assertEqual(
+            parsear('comuna:"La Florida" y (taller:2 o no deuda)'),
+            ('and', ('atomo', 'comuna', 'La Florida'), ('or', ('atomo', 'taller', '2'), ('not', ('atomo', 'deuda', None)))),
+        )
+
+    def test_errores(self):
+        for texto in ['', '(deuda', 'deuda AND', 'deuda )']:
+            with self.assertRaises(ExpresionInvalida):
+                parsear(texto)
+
+
+class IndiceSegmentosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        segmentos._indice = None
+        self.resina = Interes.objects.create(nombre='Resina')
+        self.acuarela = Interes.objects.create(nombre='Acuarela')
+        self.taller = Taller.objects.create(
+            nombre='Taller Segmentos', descripcion='desc', precio=Decimal('10000'),
+            cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1)
+        )
+        self.ana = Cliente.objects.create(nombre_completo='Ana', email='ana@test.com', comuna_vive='La Florida')
+        self.bea = Cliente.objects.create(nombre_completo='Bea', email='bea@test.com', tipo_cliente='B2B')
+        self.caro = Cliente.objects.create(nombre_completo='Caro', email='caro@test.com')
+        self.ana.intereses_cliente.add(self.resina)
+        self.bea.intereses_cliente.add(self.resina, self.acuarela)
+        Inscripcion.objects.create(cliente=self.ana, taller=self.taller, estado_pago='PENDIENTE')
+        Inscripcion.objects.create(cliente=self.caro, taller=self.taller, estado_pago='PAGADO')
+
+    def _ids(self, indice, expresion):
+        return set(indice.evaluar(expresion).ids().tolist())
+
+    def test_expresiones(self):
+        indice = IndiceSegmentos().construir()
+        self.assertEqual(self._ids(indice, 'interes:Resina AND NOT deuda'), {self.bea.id})
+        self.assertEqual(self._ids(indice, f'taller:{self.taller.id} OR tipo:b2b'), {self.ana.id, self.bea.id, self.caro.id})
+        self.assertEqual(self._ids(indice, 'comuna:"la florida" deuda'), {self.ana.id})
+        self.assertEqual(self._ids(indice, 'NOT todos'), set())
+        with self.assertRaises(ExpresionInvalida):
+            indice.evaluar('color:rojo')
+
+    def test_actualizacion_incremental_por_senales(self):
+        indice = segmentos.obtener_indice()
+        with mock.patch.object(IndiceSegmentos, 'construir') as construir:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.caro.intereses_cliente.add(self.acuarela)
+                Inscripcion.objects.filter(cliente=self.ana).get().delete()
+            nuevo = segmentos.obtener_indice()
+
+            # Deltas aplicados sobre una copia, sin reconstruir; el índice anterior no cambia
+            construir.assert_not_called()
+            self.assertIsNot(nuevo, indice)
+            self.assertEqual(self._ids(nuevo, 'interes:Acuarela'), {self.bea.id, self.caro.id})
+            self.assertEqual(self._ids(nuevo, 'deuda'), set())
+            self.assertEqual(self._ids(indice, 'deuda'), {self.ana.id})
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.bea.delete()
+            self.assertEqual(self._ids(segmentos.obtener_indice(), 'todos'), {self.ana.id, self.caro.id})
+            construir.assert_not_called()
+
+    def test_cambio_masivo_fuerza_reconstruccion(self):
+        indice = segmentos.obtener_indice()
+        segmentos.invalidar_indice()
+        self.assertIsNot(segmentos.obtener_indice(), indice)
+
+    def test_cambio_confirmado_tarde_no_se_pierde(self):
+        indice = segmentos.obtener_indice()
+        # Un cambio con id menor que otro ya aplicado (su transacción confirmó después)
+        tardio = CambioSegmentacion.objects.create(cliente_id=self.caro.id)
+        Cliente.objects.filter(pk=self.caro.pk).update(tipo_cliente='B2B')
+        ultimo = CambioSegmentacion.objects.create(cliente_id=self.ana.id)
+        indice.cambios_aplicados.add(ultimo.id)
+        indice.ultimo_cambio_id = ultimo.id
+        self.assertLess(tardio.id, ultimo.id)
+
+        segmentos.cambios_registrados()
+        self.assertEqual(self._ids(segmentos.obtener_indice(), 'tipo:B2B'), {self.bea.id, self.caro.id})
+
+    def test_demasiados_cambios_reconstruye(self):
+        segmentos.obtener_indice()
+        with mock.patch.object(segmentos, 'DELTA_MAXIMO', 1):
+            CambioSegmentacion.objects.bulk_create([CambioSegmentacion(cliente_id=self.ana.id)] * 2)
+            segmentos.cambios_registrados()
+            with mock.patch.object(IndiceSegmentos, 'construir', autospec=True, side_effect=lambda i: i) as construir:
+                segmentos.obtener_indice()
+        construir.assert_called_once()
+
+    @override_settings(SEGMENTOS_EN_MEMORIA=True)
+    def test_listado_clientes_desde_indice(self):
+        User.objects.create_superuser(username='admin_test', email='admin@test.com', password='adminpass')
+        self.client.login(username='admin_test', password='adminpass')
+
+        response = self.client.get(reverse('listado_clientes'), {'interes': [self.resina.id], 'deudores': 'true'})
+        self.assertEqual(response.context['clientes'], [self.ana])
+        self.assertEqual(response.context['total_clientes'], 1)
+
+        response = self.client.get(reverse('listado_clientes'), {'segmento': 'NOT interes:Resina'})
+        self.assertEqual(response.context['clientes'], [self.caro])
+
+        response = self.client.get(reverse('listado_clientes'), {'segmento': 'color:rojo'})
+        self.assertEqual(response.context['total_clientes'], 3)
+        self.assertIn('Segmento inválido', [str(m) for m in response.context['messages']][0])
+
+        # Con filtros fuera del índice el segmento se resuelve en la BD, sin IN de ids
+        with mock.patch.object(segmentos, 'obtener_indice') as obtener:
+            response = self.client.get(reverse('listado_clientes'), {'segmento': 'NOT interes:Resina', 'orden': 'valor'})
+        obtener.assert_not_called()
+        self.assertEqual(list(response.context['clientes']), [self.caro])
+
+
+class SegmentosGuardadosTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.resina = Interes.objects.create(nombre='Resina')
+        self.taller = Taller.objects.create(
+            nombre='Taller Guardados', descripcion='desc', precio=Decimal('10000'),
+            cupos_totales=10, fecha_taller=datetime.date(2099, 1, 1)
+        )
+        self.ana = Cliente.objects.create(nombre_completo='Ana', email='ana@test.com')
+        self.bea = Cliente.objects.create(nombre_completo='Bea', email='bea@test.com')
+        self.caro = Cliente.objects.create(nombre_completo='Caro', email='caro@test.com', tipo_cliente='B2B')
+        for c in (self.ana, self.bea, self.caro):
+            c.intereses_cliente.add(self.resina)
+        self.insc_ana = Inscripcion.objects.create(cliente=self.ana, taller=self.taller, estado_pago='PENDIENTE')
+        self.segmento = Segmento.objects.create(nombre='B2C Resina con deuda', expresion='tipo:B2C AND interes:Resina AND deuda')
+
+    def _miembros(self):
+        return set(self.segmento.miembros.values_list('cliente_id', flat=True))
+
+    def test_expresion_a_q_coincide_con_indice(self):
+        indice = IndiceSegmentos().construir()
+        for expresion in ['interes:Resina AND NOT deuda', 'tipo:b2b OR deuda', f'taller:{self.taller.id}', 'NOT todos']:
+            esperados = set(indice.evaluar(expresion).ids().tolist())
+            self.assertEqual(set(Cliente.objects.filter(expresion_a_q(expresion)).values_list('id', flat=True)), esperados)
+
+    def test_refresco_incremental_solo_clientes_tocados(self):
+        self.assertEqual(refrescar_segmento(self.segmento), 3)  # primer refresco: completo
+        self.assertEqual(self._miembros(), {self.ana.id})
+
+        Inscripcion.objects.create(cliente=self.bea, taller=self.taller, estado_pago='ABONADO')
+        cambiar_estado_masivo([self.insc_ana.id], 'PAGADO')
+        # La ventana bajo la marca incluye los cambios del setUp: se re-evalúan los 3
+        self.assertEqual(refrescar_segmento(self.segmento), 3)
+        self.assertEqual(self._miembros(), {self.bea.id})
+        self.segmento.refresh_from_db()
+        self.assertEqual(self.segmento.total_miembros, 1)
+
+        # Sin cambios nuevos solo se re-mira la ventana (idempotente) y el registro se
+        # purga cuando queda bajo ella
+        self.assertEqual(refrescar_segmento(self.segmento), 3)
+        self.assertEqual(self._miembros(), {self.bea.id})
+        purgar_cambios()
+        self.assertTrue(CambioSegmentacion.objects.exists())
+        Segmento.objects.update(ultimo_cambio_id=F('ultimo_cambio_id') + segmentos.VENTANA_CAMBIOS)
+        purgar_cambios()
+        self.assertFalse(CambioSegmentacion.objects.exists())
+
+    def test_refresco_incremental_incluye_cambios_confirmados_tarde(self):
+        refrescar_segmento(self.segmento)
+        Inscripcion.objects.create(cliente=self.bea, taller=self.taller, estado_pago='PENDIENTE')
+        tardio = CambioSegmentacion.objects.filter(cliente_id=self.bea.id).latest('id')
+        CambioSegmentacion.objects.filter(cliente_id=self.bea.id).delete()
+        # Otra transacción confirma un id mayor y el refresco avanza la marca sin ver a Bea
+        registrar_cambio([self.caro.id])
+        refrescar_segmento(self.segmento)
+        self.assertEqual(self._miembros(), {self.ana.id})
+
+        CambioSegmentacion.objects.create(id=tardio.id, cliente_id=self.bea.id)
+        refrescar_segmento(self.segmento)
+        self.assertEqual(self._miembros(), {self.ana.id, self.bea.id})
+
+    def test_guardar_listar_y_exportar(self):
+        User.objects.create_superuser(username='admin_test', email='admin@test.com', password='adminpass')
+        self.client.login(username='admin_test', password='adminpass')
+        url = reverse('listado_clientes')
+
+        response = self.client.post(
+            f'{url}?tipo=B2C&deudores=true', {'action': 'guardar_segmento', 'nombre_segmento': 'Deudores B2C'}
+        )
+        guardado = Segmento.objects.get(nombre='Deudores B2C')
+        self.assertEqual(guardado.expresion, 'tipo:B2C AND deuda')
+        self.assertRedirects(response, f'{url}?segmento_guardado={guardado.pk}')
+
+        Inscripcion.objects.create(cliente=self.bea, taller=self.taller, estado_pago='PENDIENTE')
+        response = self.client.get(url, {'segmento_guardado': guardado.pk})
+        self.assertEqual(set(response.context['clientes']), {self.ana, self.bea})
+        self.assertEqual(response.context['total_clientes'], 2)
+
+        response = self.client.get(reverse('exportar_segmento', args=[guardado.pk]))
+        filas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(filas), 3)
+        self.assertIn('ana@test.com', filas[1])
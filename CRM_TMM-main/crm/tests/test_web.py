@@ -1,10 +1,26 @@
 # crm/tests/test_web.py
-from django.test import TestCase, Client
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+
+import numpy as np
+from PIL import Image as PILImage
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.db import connection
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
 from decimal import Decimal
-from datetime import date
-from crm.models import Taller, Interes, Cliente, Inscripcion, Producto, VentaProducto
+from datetime import date, timedelta
+from crm.models import Taller, Interes, Cliente, Inscripcion, Producto, VentaProducto, Empresa
 from crm.forms import RegistroClienteForm
 
 # ====================================================================
@@ -15,6 +31,9 @@ class TestSetup(TestCase):
     """Clase base para configurar datos comunes a varios tests."""
 
     def setUp(self):
+        # Las páginas públicas se cachean: no arrastrar HTML de otros tests
+        cache.clear()
+
         # 1. Crear un interés (categoría) para talleres
         self.interes_resina = Interes.objects.create(nombre='Resina', descripcion='Interés en resina')
         self.interes_encuadernacion = Interes.objects.create(nombre='Encuadernación', descripcion='Interés en encuadernación')
@@ -236,4 +255,1055 @@ class EnrollmentLogicTests(TestSetup):
         
         # 6. Verificar que el stock se descontó
         self.producto_kit.refresh_from_db()
-        self.assertEqual(self.producto_kit.stock_actual, 9) # Originalmente 10 - 1 = 9
\ No newline at end of file
+        self.assertEqual(self.producto_kit.stock_vigente, 9) # Originalmente 10 - 1 = 9
+
+
+# ====================================================================
+# PRUEBAS DE PAGINACIÓN EN GESTIÓN DE DEUDORES
+# ====================================================================
+
+class GestionDeudoresPaginacionTests(TestSetup):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        talleres = [
+            Taller.objects.create(
+                nombre=f'Taller Lote {i}', descripcion='Test', precio=Decimal('10000'),
+                cupos_totales=50, categoria=self.interes_resina, fecha_taller=date(2099, 12, 1)
+            )
+            for i in range(4)
+        ]
+        for i in range(10):
+            cliente = Cliente.objects.create(nombre_completo=f'Cliente {i}', email=f'cliente{i}@test.com')
+            for j, taller in enumerate(talleres):
+                Inscripcion.objects.create(cliente=cliente, taller=taller, estado_pago='PENDIENTE' if j % 2 else 'PAGADO')
+
+    def test_pagina_desde_bd_con_indice_acotado(self):
+        response = self.client_admin_session.get(reverse('gestion_deudores'), {'indice': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['deudores']), 15)
+        self.assertEqual(response.context['total_deudores'], 40)
+        self.assertEqual((response.context['mostrando_inicio'], response.context['mostrando_fin']), (16, 30))
+        self.assertEqual([b['indice'] for b in response.context['batch_meta']], [1, 2, 3])
+
+    def test_conteo_cacheado_e_invalidado(self):
+        url = reverse('gestion_deudores')
+        self.client_admin_session.get(url, {'estado': 'DEUDA'})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_admin_session.get(url, {'estado': 'DEUDA'})
+        self.assertEqual(response.context['total_deudores'], 20)
+        self.assertFalse(any('COUNT(*)' in q['sql'] for q in ctx.captured_queries))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Inscripcion.objects.filter(estado_pago='PENDIENTE').first().delete()
+        # Antes del commit el conteo cacheado sigue vigente
+        self.assertEqual(self.client_admin_session.get(url, {'estado': 'DEUDA'}).context['total_deudores'], 20)
+        for callback in callbacks:
+            callback()
+        response = self.client_admin_session.get(url, {'estado': 'DEUDA'})
+        self.assertEqual(response.context['total_deudores'], 19)
+
+
+
+class SaldoPendienteTests(TestSetup):
+
+    def _inscribir(self, estado, monto, dias):
+        n = Inscripcion.objects.count()
+        cliente = Cliente.objects.create(nombre_completo=f'Deudora {n}', email=f'deudora{n}@test.com')
+        ins = Inscripcion.objects.create(cliente=cliente, taller=self.taller_activo, estado_pago=estado, monto_pagado=Decimal(monto))
+        Inscripcion.objects.filter(pk=ins.pk).update(fecha_inscripcion=timezone.now() - timedelta(days=dias))
+        return ins
+
+    def test_saldo_se_mantiene_en_save_y_cambio_de_precio(self):
+        abonada = self._inscribir('ABONADO', '4000', 0)
+        pagada = self._inscribir('PAGADO', '10000', 0)
+        self.assertEqual(abonada.saldo_pendiente, 6000)
+        self.assertEqual(pagada.saldo_pendiente, 0)
+
+        abonada.monto_pagado = Decimal('7000')
+        abonada.save(update_fields=['monto_pagado'])
+        abonada.refresh_from_db()
+        self.assertEqual(abonada.saldo_pendiente, 3000)
+
+        taller = Taller.objects.get(pk=self.taller_activo.pk)
+        taller.precio = Decimal('12000')
+        taller.save()
+        abonada.refresh_from_db()
+        pagada.refresh_from_db()
+        self.assertEqual((abonada.saldo_pendiente, pagada.saldo_pendiente), (5000, 0))
+
+    def test_reporte_antiguedad_y_orden_por_saldo(self):
+        self._inscribir('PENDIENTE', '0', 10)
+        self._inscribir('ABONADO', '5000', 45)
+        self._inscribir('ABONADO', '8000', 120)
+        self._inscribir('PAGADO', '10000', 200)
+
+        response = self.client_admin_session.get(reverse('gestion_deudores'), {'orden': 'saldo'})
+        tramos = {t['clave']: (t['cantidad'], t['saldo']) for t in response.context['antiguedad']['tramos']}
+        self.assertEqual(tramos, {'0-30': (1, 10000), '31-60': (1, 5000), '61-90': (0, 0), '90+': (1, 2000)})
+        self.assertEqual(response.context['antiguedad']['total_saldo'], 17000)
+        self.assertEqual([i.saldo_pendiente for i in response.context['deudores']][:3], [10000, 5000, 2000])
+
+    def test_exportar_csv(self):
+        self._inscribir('PENDIENTE', '0', 1)
+        response = self.client_admin_session.get(reverse('gestion_deudores'), {'exportar': 'csv', 'estado': 'DEUDA'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lineas = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lineas), 2)
+        self.assertIn('deudora0@test.com', lineas[1])
+        self.assertIn('10000', lineas[1])
+
+
+class CambioEstadoMasivoTests(TestSetup):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.taller_b = Taller.objects.create(
+            nombre='Taller B', descripcion='Test', precio=Decimal('8000'),
+            cupos_totales=5, categoria=self.interes_resina, fecha_taller=date(2099, 12, 1)
+        )
+        self.inscripciones = []
+        for i, taller in enumerate([self.taller_activo, self.taller_activo, self.taller_b]):
+            cliente = Cliente.objects.create(nombre_completo=f'Masivo {i}', email=f'masivo{i}@test.com')
+            self.inscripciones.append(Inscripcion.objects.create(cliente=cliente, taller=taller, estado_pago='PENDIENTE'))
+        # Simular los cupos ocupados por las inscripciones
+        Taller.objects.filter(pk=self.taller_activo.pk).update(cupos_disponibles=0)
+        Taller.objects.filter(pk=self.taller_b.pk).update(cupos_disponibles=4)
+        self.ids = [i.id for i in self.inscripciones]
+
+    def test_pagado_y_abonado_en_un_update(self):
+        url = reverse('gestion_deudores')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client_admin_session.post(url, {'action': 'cambiar_estado_masivo', 'nuevo_estado': 'ABONADO',
+                                                 'monto_abono': '3000', 'inscripcion_seleccionada': self.ids})
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "crm_inscripcion"') for q in ctx.captured_queries), 1)
+        saldos = dict(Inscripcion.objects.values_list('taller_id', 'saldo_pendiente').distinct())
+        self.assertEqual(saldos, {self.taller_activo.id: 7000, self.taller_b.id: 5000})
+
+        self.client_admin_session.post(url, {'action': 'cambiar_estado_masivo', 'nuevo_estado': 'PAGADO',
+                                             'inscripcion_seleccionada': self.ids[:1]})
+        pagada = Inscripcion.objects.get(pk=self.ids[0])
+        self.assertEqual((pagada.estado_pago, pagada.monto_pagado, pagada.saldo_pendiente), ('PAGADO', 10000, 0))
+
+    def test_anular_devuelve_cupos_por_taller(self):
+        response = self.client_admin_session.post(
+            reverse('detalle_taller_admin', args=[self.taller_activo.id]),
+            {'action': 'cambiar_estado_masivo', 'nuevo_estado': 'ANULADO', 'inscripcion_sel': self.ids},
+        )
+        self.assertEqual(response.status_code, 302)
+        # Solo se anulan las del taller de la vista
+        self.assertEqual(Inscripcion.objects.filter(estado_pago='ANULADO').count(), 2)
+        self.taller_activo.refresh_from_db()
+        self.taller_b.refresh_from_db()
+        self.assertEqual((self.taller_activo.cupos_disponibles, self.taller_b.cupos_disponibles), (2, 4))
+
+        # Repetir la anulación no devuelve cupos dos veces
+        self.client_admin_session.post(
+            reverse('detalle_taller_admin', args=[self.taller_activo.id]),
+            {'action': 'cambiar_estado_masivo', 'nuevo_estado': 'ANULADO', 'inscripcion_sel': self.ids},
+        )
+        self.taller_activo.refresh_from_db()
+        self.assertEqual(self.taller_activo.cupos_disponibles, 2)
+
+    def test_estado_individual_devuelve_cupo(self):
+        url = reverse('detalle_taller_admin', args=[self.taller_activo.id])
+        self.client_admin_session.post(url, {'action': 'actualizar_estado_inscripcion', 'nuevo_estado': 'ANULADO',
+                                             'inscripcion_id': self.ids[0]})
+        self.taller_activo.refresh_from_db()
+        self.assertEqual(self.taller_activo.cupos_disponibles, 1)
+
+        self.client_admin_session.post(url, {'action': 'actualizar_estado_inscripcion', 'nuevo_estado': 'ABONADO',
+                                             'monto_abono': '4000', 'inscripcion_id': self.ids[1]})
+        abonada = Inscripcion.objects.get(pk=self.ids[1])
+        self.assertEqual((abonada.estado_pago, abonada.monto_pagado, abonada.saldo_pendiente), ('ABONADO', 4000, 6000))
+
+    def test_abono_mayor_al_precio_rechazado(self):
+        self.client_admin_session.post(reverse('admin:crm_inscripcion_changelist'), {
+            'action': 'marcar_abonado', 'monto_abono': '9000', '_selected_action': self.ids,
+        })
+        # El taller B cuesta 8000: no se aplica a ninguna
+        self.assertFalse(Inscripcion.objects.filter(estado_pago='ABONADO').exists())
+
+    def test_accion_admin_anular(self):
+        self.client_admin_session.post(reverse('admin:crm_inscripcion_changelist'), {
+            'action': 'anular', '_selected_action': [self.ids[2]],
+        })
+        self.taller_b.refresh_from_db()
+        self.assertEqual(self.taller_b.cupos_disponibles, 5)
+        self.assertEqual(Inscripcion.objects.get(pk=self.ids[2]).saldo_pendiente, 0)
+
+
+class BusquedaClientesTests(TestSetup):
+
+    def setUp(self):
+        super().setUp()
+        empresa = Empresa.objects.create(razon_social='Papelería Andina')
+        self.jose = Cliente.objects.create(nombre_completo='José Pérez', email='jperez@test.com', telefono='987654321')
+        self.josefa = Cliente.objects.create(nombre_completo='Josefa Muñoz', email='josefa@test.com', empresa=empresa, tipo_cliente='B2B')
+        Cliente.objects.create(nombre_completo='María Soto', email='msoto@test.com')
+
+    def _buscar(self, texto, **params):
+        response = self.client_admin_session.get(reverse('listado_clientes'), {'q': texto, **params})
+        return list(response.context['clientes'])
+
+    def test_prefijo_sin_tildes(self):
+        self.assertEqual(set(self._buscar('jose')), {self.jose, self.josefa})
+        self.assertEqual(self._buscar('jose perez'), [self.jose])
+        self.assertEqual(self._buscar('MUNOZ'), [self.josefa])
+
+    def test_indice_sigue_cambios_de_cliente_y_empresa(self):
+        self.assertEqual(self._buscar('andina'), [self.josefa])
+        self.josefa.empresa.razon_social = 'Librería Austral'
+        self.josefa.empresa.save()
+        self.assertEqual(self._buscar('austral'), [self.josefa])
+
+        self.jose.delete()
+        self.assertEqual(self._buscar('perez'), [])
+
+    def test_combina_con_filtros(self):
+        self.assertEqual(self._buscar('jose', tipo='B2C'), [self.jose])
+
+    def test_email_se_busca_entero(self):
+        ana = Cliente.objects.create(nombre_completo='Ana Rojas', email='ana@test.com')
+        Cliente.objects.create(nombre_completo='Ana Soto', email='ana.soto@test.com')
+        self.assertEqual(self._buscar('Ana@Test.com'), [ana])
+        self.assertEqual(self._buscar('jperez@test.com'), [self.jose])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Plan de consulta específico de PostgreSQL')
+    def test_ramas_de_busqueda_usan_indices(self):
+        from crm.utils import busqueda
+        with CaptureQueriesContext(connection) as ctx:
+            busqueda.ids_rankeados('jose perez')
+            busqueda.ids_rankeados('jperez@test.com')
+        sqls = [q['sql'] for q in ctx.captured_queries if 'crm_cliente' in q['sql']]
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            planes = []
+            for sql in sqls:
+                cursor.execute(f'EXPLAIN {sql}')
+                planes.append('\n'.join(fila[0] for fila in cursor.fetchall()))
+        self.assertNotIn('Seq Scan on crm_cliente', planes[0])
+        for indice in ('crm_cliente_busqueda_fts', 'crm_cliente_nombre_trgm', 'crm_empresa_busqueda_fts'):
+            self.assertIn(indice, planes[0])
+        self.assertIn('crm_cliente_email_trgm', planes[1])
+
+
+class ListadoClientesPaginacionTests(TestSetup):
+
+    def setUp(self):
+        super().setUp()
+        for i in range(30):
+            cliente = Cliente.objects.create(nombre_completo=f'Paginado {i}', email=f'paginado{i}@test.com')
+            cliente.intereses_cliente.add(self.interes_resina, self.interes_encuadernacion)
+            if i < 3:
+                Inscripcion.objects.create(cliente=cliente, taller=self.taller_activo, estado_pago='PENDIENTE')
+        self.total = Cliente.objects.count()
+
+    def test_pagina_con_consultas_constantes(self):
+        url = reverse('listado_clientes')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_admin_session.get(url, {'pagina': 2})
+        self.assertEqual(response.context['total_clientes'], self.total)
+        self.assertFalse(response.context['total_estimado'])
+        self.assertEqual(len(response.context['clientes']), self.total - 25)
+        self.assertContains(response, 'Encuadernación')
+
+        # Más filas por página no agregan consultas (empresa por JOIN, intereses por prefetch)
+        with CaptureQueriesContext(connection) as ctx_primera:
+            self.client_admin_session.get(url, {'pagina': 1})
+        self.assertEqual(len(ctx_primera.captured_queries), len(ctx.captured_queries))
+
+    def test_filtros_usan_exists_sin_distinct(self):
+        url = reverse('listado_clientes')
+        params = {'interes': [self.interes_resina.id, self.interes_encuadernacion.id], 'deudores': 'true'}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_admin_session.get(url, params)
+        self.assertEqual(response.context['total_clientes'], 3)
+        self.assertEqual(len(response.context['clientes']), 3)
+        sql_clientes = [q['sql'] for q in ctx.captured_queries if 'FROM "crm_cliente"' in q['sql']]
+        self.assertTrue(all('DISTINCT' not in sql for sql in sql_clientes))
+        self.assertTrue(any('EXISTS' in sql for sql in sql_clientes))
+
+
+class CatalogoCacheTests(TestSetup):
+
+    def test_catalogo_anonimo_desde_cache_e_invalidacion(self):
+        url = reverse('catalogo_talleres')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertContains(response, '2 disponibles')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taller_activo.cupos_disponibles = 1
+            self.taller_activo.save()
+        self.assertContains(self.client.get(url), '1 disponibles')
+
+    def test_detalle_producto_inserta_csrf_por_visitante(self):
+        url = reverse('detalle_producto', args=[self.producto_kit.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, '__crm_csrf_token__')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto_kit.nombre = 'Kit Resina Renovado'
+            self.producto_kit.save()
+        self.assertContains(self.client.get(url), 'Kit Resina Renovado')
+
+    def test_autenticado_no_recibe_pagina_anonima(self):
+        url = reverse('detalle_taller', args=[self.taller_activo.id])
+        self.assertContains(self.client.get(url), 'iniciar sesión')
+        response = self.client_auth_session.get(url)
+        self.assertContains(response, 'Usaremos tu cuenta para la inscripción')
+        self.assertTrue(response.context['show_form'])
+
+
+class CuposEnVivoTests(TestSetup):
+
+    def test_json_de_cupos_desde_cache(self):
+        url = reverse('cupos_talleres')
+        self.assertEqual(self.client.get(url).status_code, 400)
+        self.client.get(url, {'ids': str(self.taller_activo.id)})
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {'ids': str(self.taller_activo.id)})
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response.json()['talleres'], {str(self.taller_activo.id): {'disponibles': 2, 'totales': 2}})
+        self.assertEqual(self.client.get(url, {'ids': '999'}).json()['talleres'], {})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taller_activo.cupos_disponibles = 1
+            self.taller_activo.save()
+        response = self.client.get(url, {'ids': str(self.taller_activo.id)})
+        self.assertEqual(response.json()['talleres'][str(self.taller_activo.id)]['disponibles'], 1)
+
+    def test_siembra_no_pisa_un_valor_publicado(self):
+        from crm.utils import cupos
+        leer_bd = Taller.objects.filter
+
+        def publicar_en_medio(*args, **kwargs):
+            # Otro proceso publica después de que este leyó la BD
+            qs = list(leer_bd(*args, **kwargs).values_list('pk', 'cupos_disponibles', 'cupos_totales'))
+            cupos.publicar(self.taller_activo.id, 0, 2)
+            return mock.Mock(values_list=lambda *campos: qs)
+
+        with mock.patch.object(Taller.objects, 'filter', side_effect=publicar_en_medio):
+            resultado = cupos.cupos_de([self.taller_activo.id])
+        self.assertEqual(resultado[self.taller_activo.id]['disponibles'], 0)
+        self.assertEqual(cache.get(cupos.clave_estado(self.taller_activo.id)), [0, 2])
+
+    def test_difusor_reparte_un_feed_a_varios_suscriptores(self):
+        from crm.sse import Difusor
+        from crm.utils import cupos
+
+        async def escenario():
+            difusor = Difusor()
+            interesado = asyncio.Queue()
+            otro = asyncio.Queue()
+            difusor.suscriptores = {interesado: {self.taller_activo.id}, otro: {999}}
+            await difusor.revisar()  # toma el seq vigente como punto de partida
+            await asyncio.to_thread(cupos.publicar, self.taller_activo.id, 1, 2)
+            await asyncio.to_thread(cupos.publicar, self.taller_activo.id, 0, 2)
+            await difusor.revisar()
+            return interesado.get_nowait(), otro.empty()
+
+        cambios, otro_vacio = asyncio.run(escenario())
+        self.assertEqual(cambios, {self.taller_activo.id: {'disponibles': 0, 'totales': 2}})
+        self.assertTrue(otro_vacio)
+
+    def test_stream_envia_estado_inicial(self):
+        from crm.sse import app_cupos
+        from crm.utils.cupos import cupos_de
+        cupos_de([self.taller_activo.id])  # estado en caché: el stream no consulta la BD
+        enviados = []
+
+        async def receive():
+            await asyncio.sleep(0.05)
+            return {'type': 'http.disconnect'}
+
+        async def send(mensaje):
+            enviados.append(mensaje)
+
+        scope = {'type': 'http', 'method': 'GET', 'query_string': f'ids={self.taller_activo.id}'.encode()}
+        asyncio.run(app_cupos(scope, receive, send))
+        self.assertEqual(dict(enviados[0]['headers'])[b'content-type'], b'text/event-stream')
+        evento = enviados[1]['body'].decode()
+        self.assertTrue(evento.startswith('event: cupos'))
+        datos = json.loads(evento.split('data: ')[1])
+        self.assertEqual(datos[str(self.taller_activo.id)]['disponibles'], 2)
+
+
+class ImagenDerivadosTests(TestSetup):
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, IMAGENES_DERIVADOS_ASINCRONO=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _foto(self, nombre='foto.jpg'):
+        # Foto "de teléfono": 1600x1200 con ruido (no comprime trivialmente)
+        ruido = (np.random.default_rng(0).random((1200, 1600, 3)) * 255).astype('uint8')
+        buffer = io.BytesIO()
+        PILImage.fromarray(ruido).save(buffer, 'JPEG', quality=95)
+        return SimpleUploadedFile(nombre, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_derivados_y_srcset_en_catalogo(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taller_activo.imagen = self._foto()
+            self.taller_activo.save()
+        self.taller_activo.refresh_from_db()
+        datos = self.taller_activo.imagen_variantes
+        self.assertEqual(datos['origen'], self.taller_activo.imagen.name)
+        tarjeta_webp = datos['variantes']['tarjeta']['webp']
+        self.assertEqual([ancho for ancho, _ in tarjeta_webp], [300, 600])
+        self.assertTrue(tarjeta_webp[0][1].startswith(f"derivados/taller/{datos['hash']}_"))
+        original = os.path.getsize(self.taller_activo.imagen.path)
+        self.assertLess(os.path.getsize(os.path.join(self.media, tarjeta_webp[0][1])) * 10, original)
+
+        html = self.client.get(reverse('catalogo_talleres')).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('_tarjeta_600.webp 600w', html)
+
+    def test_misma_imagen_reutiliza_derivados(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto_kit.imagen = self._foto('a.jpg')
+            self.producto_kit.save()
+        archivos = sorted(os.listdir(os.path.join(self.media, 'derivados', 'producto')))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto_kit.imagen = self._foto('b.jpg')
+            self.producto_kit.save()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media, 'derivados', 'producto'))), archivos)
+        self.producto_kit.refresh_from_db()
+        self.assertTrue(self.producto_kit.imagen_variantes['origen'].endswith('b.jpg'))
+
+
+class RespuestaCondicionalTests(TestSetup):
+
+    def test_catalogo_responde_304_sin_consultas(self):
+        url = reverse('catalogo_talleres')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        self.assertIn('Cookie', response['Vary'])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.taller_activo.cupos_disponibles = 1
+            self.taller_activo.save(update_fields=['cupos_disponibles'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_updated_at_con_update_fields_y_variante_autenticada(self):
+        antes = self.producto_kit.updated_at
+        self.producto_kit.stock_actual = 9
+        self.producto_kit.save(update_fields=['stock_actual'])
+        self.producto_kit.refresh_from_db()
+        self.assertGreater(self.producto_kit.updated_at, antes)
+
+        url = reverse('detalle_producto', args=[self.producto_kit.id])
+        etag_anonimo = self.client.get(url)['ETag']
+        response = self.client_auth_session.get(url, HTTP_IF_NONE_MATCH=etag_anonimo)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag_anonimo)
+
+
+@override_settings(CARRITO_EN_COOKIE=True)
+class CarritoCookieTests(TestSetup):
+
+    def test_agregar_y_ver_sin_escribir_sesion(self):
+        from django.contrib.sessions.models import Session
+        otro = Producto.objects.create(nombre='Kit Timbres', precio_venta=Decimal('3000'), stock_actual=5)
+        Session.objects.all().delete()
+
+        self.client.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        self.client.post(reverse('agregar_a_carrito', args=[otro.id]))
+        self.client.post(reverse('agregar_a_carrito', args=[otro.id]))
+        self.assertIn('crm_carrito', self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('ver_carrito'))
+        self.assertEqual(len(ctx.captured_queries), 1)  # in_bulk de los productos
+        self.assertEqual(response.context['total_final'], Decimal('11000'))
+
+    def test_cookie_alterada_se_ignora_y_carrito_grande_va_a_sesion(self):
+        self.client.cookies['crm_carrito'] = 'manipulada'
+        self.assertEqual(self.client.get(reverse('ver_carrito')).context['items'], [])
+
+        with mock.patch('crm.utils.carrito.CARRITO_COOKIE_MAX_BYTES', 10):
+            self.client.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        self.assertIn(str(self.producto_kit.id), self.client.session['carrito'])
+        self.assertEqual(self.client.cookies['crm_carrito'].value, '')
+        self.assertEqual(len(self.client.get(reverse('ver_carrito')).context['items']), 1)
+
+
+class CheckoutMasivoTests(TestSetup):
+
+    def _carrito(self, productos, cantidad=1):
+        return {str(p.id): {'cantidad': cantidad, 'precio': str(p.precio_venta)} for p in productos}
+
+    def test_consultas_fijas_sin_importar_tamano_del_carrito(self):
+        from crm.models import DetalleVenta
+        from crm.utils import checkout, stock
+        otros = [
+            Producto.objects.create(nombre=f'Kit {i}', precio_venta=Decimal('1000'), stock_actual=5)
+            for i in range(4)
+        ]
+        with CaptureQueriesContext(connection) as uno:
+            checkout.finalizar_venta(self.cliente_auth, self._carrito([self.producto_kit]))
+        with CaptureQueriesContext(connection) as varios:
+            venta = checkout.finalizar_venta(self.cliente_auth, self._carrito(otros, cantidad=2))
+        self.assertEqual(len(uno.captured_queries), len(varios.captured_queries))
+
+        self.assertEqual(venta.monto_total, Decimal('8000'))
+        self.assertEqual(venta.estado_pago, 'PAGADO')
+        self.assertEqual(DetalleVenta.objects.filter(venta=venta).count(), 4)
+        self.assertEqual(
+            [p.stock_vigente for p in stock.con_stock(Producto.objects.filter(pk__in=[p.pk for p in otros]))],
+            [3, 3, 3, 3],
+        )
+
+    def test_stock_insuficiente_no_registra_nada(self):
+        otro = Producto.objects.create(nombre='Kit Escaso', precio_venta=Decimal('1000'), stock_actual=1)
+        session = self.client_auth_session.session
+        session['carrito'] = {**self._carrito([self.producto_kit]), **self._carrito([otro], cantidad=3)}
+        session.save()
+
+        response = self.client_auth_session.post(reverse('finalizar_compra'))
+        self.assertRedirects(response, reverse('ver_carrito'), fetch_redirect_response=False)
+        self.assertFalse(VentaProducto.objects.exists())
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(self.producto_kit.stock_actual, 10)
+        self.assertIn(str(otro.id), self.client_auth_session.session['carrito'])
+
+
+class ReservasStockTests(TestSetup):
+
+    def test_agregar_reserva_y_el_catalogo_muestra_disponibles(self):
+        from crm.models import ReservaStock
+        self.assertContains(self.client.get(reverse('catalogo_productos')), 'Disponibles:</strong> 10')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_auth_session.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+            self.client_auth_session.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(self.producto_kit.stock_reservado, 2)
+        self.assertEqual(ReservaStock.objects.get().cantidad, 2)
+        self.assertContains(self.client.get(reverse('catalogo_productos')), 'Disponibles:</strong> 8')
+
+    def test_reservar_no_invalida_la_pagina_cacheada(self):
+        url = reverse('catalogo_productos')
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_auth_session.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        with mock.patch('crm.views.tarjetas') as tarjetas:
+            response = self.client.get(url)
+        # Página desde la caché; solo las unidades disponibles se recalculan
+        tarjetas.assert_not_called()
+        self.assertContains(response, 'Disponibles:</strong> 9')
+
+    def test_lineas_descartadas_liberan_su_reserva(self):
+        from crm.models import ReservaStock
+        self.client_auth_session.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        session = self.client_auth_session.session
+        session['carrito'][str(self.producto_kit.id)]['cantidad'] = 'x'  # línea corrupta
+        session.save()
+
+        self.client_auth_session.get(reverse('ver_carrito'))
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(self.producto_kit.stock_reservado, 0)
+        self.assertFalse(ReservaStock.objects.exists())
+
+    def test_no_se_reserva_mas_que_el_stock_libre(self):
+        escaso = Producto.objects.create(nombre='Kit Escaso', precio_venta=Decimal('1000'), stock_actual=1)
+        self.client_auth_session.post(reverse('agregar_a_carrito', args=[escaso.id]))
+        response = self.client.post(reverse('agregar_a_carrito', args=[escaso.id]), follow=True)
+        self.assertIn('Solo quedan 0 unidades', str(list(response.context['messages'])[0]))
+        self.assertEqual(response.context['items'], [])
+
+    def test_compra_consume_su_reserva(self):
+        from crm.models import ReservaStock
+        self.client_auth_session.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        # Otro carrito aparta el resto del stock: la reserva propia sigue disponible para quien la hizo
+        self.client.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        self.client.post(reverse('actualizar_carrito'), {'producto_id': str(self.producto_kit.id), 'cantidad': '9'})
+
+        self.client_auth_session.post(reverse('finalizar_compra'))
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(self.producto_kit.stock_vigente, 9)
+        self.assertEqual(self.producto_kit.stock_reservado, 9)
+        self.assertEqual(list(ReservaStock.objects.values_list('cantidad', flat=True)), [9])
+
+    def test_liberar_reservas_vencidas_en_lote(self):
+        from django.core.management import call_command
+        from crm.models import ReservaStock
+        from crm.utils import reservas
+        otro = Producto.objects.create(nombre='Kit Timbres', precio_venta=Decimal('3000'), stock_actual=5)
+        vencida_1 = reservas.ajustar(self.producto_kit.id, 3)
+        vencida_2 = reservas.ajustar(otro.id, 2)
+        vigente = reservas.ajustar(self.producto_kit.id, 1)
+        ReservaStock.objects.filter(pk__in=[vencida_1, vencida_2]).update(
+            expira_en=timezone.now() - timedelta(minutes=1)
+        )
+
+        call_command('liberar_reservas', lote=1, stdout=io.StringIO())
+        self.assertEqual(list(ReservaStock.objects.values_list('pk', flat=True)), [vigente])
+        self.assertEqual(
+            dict(Producto.objects.filter(pk__in=[self.producto_kit.id, otro.id]).values_list('pk', 'stock_reservado')),
+            {self.producto_kit.id: 1, otro.id: 0},
+        )
+
+
+class LibroStockTests(TestSetup):
+
+    def test_venta_agrega_movimiento_sin_reescribir_el_stock(self):
+        from crm.models import MovimientoStock
+        updated_at = self.producto_kit.updated_at
+        session = self.client_auth_session.session
+        session['carrito'] = {str(self.producto_kit.id): {'cantidad': 2, 'precio': '5000'}}
+        session.save()
+        self.client_auth_session.post(reverse('finalizar_compra'))
+
+        self.producto_kit.refresh_from_db()
+        self.assertEqual((self.producto_kit.stock_actual, self.producto_kit.updated_at), (10, updated_at))
+        self.assertEqual(self.producto_kit.stock_vigente, 8)
+        movimiento = MovimientoStock.objects.get()
+        self.assertEqual((movimiento.tipo, movimiento.cantidad), ('VENTA', -2))
+        self.assertEqual(movimiento.venta, VentaProducto.objects.get())
+
+    def test_consolidar_pliega_movimientos_y_conserva_el_historial(self):
+        from django.core.management import call_command
+        from crm.models import MovimientoStock
+        from crm.utils import stock
+        stock.registrar(self.producto_kit.id, 5, 'REPOSICION')
+        stock.registrar(self.producto_kit.id, -1, 'AJUSTE', 'Unidad dañada')
+        call_command('consolidar_stock', stdout=io.StringIO())
+
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(self.producto_kit.stock_actual, 14)
+        self.assertEqual(self.producto_kit.stock_consolidado_hasta, MovimientoStock.objects.latest('pk').pk)
+        self.assertEqual(MovimientoStock.objects.count(), 2)
+
+        # Solo se leen los movimientos posteriores a la consolidación
+        stock.registrar(self.producto_kit.id, -4, 'AJUSTE')
+        with CaptureQueriesContext(connection) as ctx:
+            producto = stock.con_stock(Producto.objects.filter(pk=self.producto_kit.id)).get()
+            self.assertEqual(producto.stock_vigente, 10)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(stock.consolidar(), 1)
+        self.assertEqual(stock.consolidar(), 0)
+
+    def test_admin_registra_reposicion_en_el_libro(self):
+        from crm.models import MovimientoStock
+        url = reverse('admin:crm_producto_change', args=[self.producto_kit.id])
+        response = self.client_admin_session.post(url, {
+            'nombre': self.producto_kit.nombre,
+            'descripcion': '',
+            'precio_venta': '5000',
+            'esta_disponible': 'on',
+            'movimiento_stock': '7',
+            'tipo_movimiento': 'REPOSICION',
+            'nota_movimiento': 'Llegada de proveedor',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(MovimientoStock.objects.get().nota, 'Llegada de proveedor')
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(self.producto_kit.stock_vigente, 17)
+
+    def test_guardado_completo_no_pisa_los_contadores(self):
+        from crm.utils import stock
+        # El admin carga el producto; entretanto se reserva stock y se consolida el libro
+        editado = Producto.objects.get(pk=self.producto_kit.id)
+        stock.registrar(self.producto_kit.id, 3, 'REPOSICION')
+        stock.consolidar()
+        Producto.objects.filter(pk=self.producto_kit.id).update(stock_reservado=2)
+
+        editado.nombre = 'Kit Renombrado'
+        editado.save()
+        self.producto_kit.refresh_from_db()
+        self.assertEqual(
+            (self.producto_kit.nombre, self.producto_kit.stock_actual, self.producto_kit.stock_reservado),
+            ('Kit Renombrado', 13, 2),
+        )
+        self.assertEqual(self.producto_kit.stock_vigente, 13)
+
+
+class SesionesEnCacheTests(TestSetup):
+
+    def _consultas_de_sesion(self, engine):
+        with self.settings(SESSION_ENGINE=engine):
+            visitante = Client()
+            with CaptureQueriesContext(connection) as ctx:
+                visitante.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+                visitante.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+                response = visitante.get(reverse('ver_carrito'))
+        self.assertEqual(response.context['items'][0]['cantidad'], 2)
+        return sum('django_session' in q['sql'] for q in ctx.captured_queries)
+
+    def test_sesion_anonima_no_toca_la_bd(self):
+        self.assertGreater(self._consultas_de_sesion('django.contrib.sessions.backends.db'), 0)
+        self.assertEqual(self._consultas_de_sesion('crm.sesiones'), 0)
+
+    def test_sesion_autenticada_se_escribe_en_la_bd_y_se_lee_de_cache(self):
+        from django.contrib.sessions.models import Session
+        with self.settings(SESSION_ENGINE='crm.sesiones'):
+            usuario = Client()
+            usuario.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+            self.assertFalse(Session.objects.filter(session_key=usuario.cookies['sessionid'].value).exists())
+            usuario.post(reverse('login'), {'username': 'testuser', 'password': 'password123'})
+            clave = usuario.cookies['sessionid'].value
+            self.assertTrue(Session.objects.filter(session_key=clave).exists())
+
+            with CaptureQueriesContext(connection) as ctx:
+                response = usuario.get(reverse('ver_carrito'))
+            self.assertFalse(any('django_session' in q['sql'] for q in ctx.captured_queries))
+            self.assertEqual(len(response.context['items']), 1)
+
+            # Sin la caché (reinicio/desalojo) la sesión autenticada se recupera de la BD
+            cache.clear()
+            self.assertEqual(usuario.get(reverse('ver_carrito')).context['user'], self.user_auth)
+
+    def test_purgar_sesiones_vencidas_en_lotes(self):
+        from django.contrib.sessions.models import Session
+        from django.core.management import call_command
+        Session.objects.all().delete()
+        ayer = timezone.now() - timedelta(days=1)
+        for i in range(3):
+            Session.objects.create(session_key=f'vencida{i}', session_data='', expire_date=ayer)
+        Session.objects.create(session_key='vigente', session_data='', expire_date=timezone.now() + timedelta(days=1))
+
+        call_command('purgar_sesiones', lote=2, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['vigente'])
+
+
+class JWTMiddlewareTests(TestSetup):
+
+    def _tokens(self):
+        response = self.client.post(
+            reverse('token_obtain_pair'), {'username': 'testuser', 'password': 'password123'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_emitir_y_renovar_tokens(self):
+        tokens = self._tokens()
+        response = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+
+    def test_token_validado_se_recuerda_sin_consultar_usuario(self):
+        api = Client(HTTP_AUTHORIZATION=f'Bearer {self._tokens()["access"]}')
+        self.assertEqual(api.get(reverse('perfil_usuario')).status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            response = api.get(reverse('perfil_usuario'))
+        self.assertEqual(response.context['user'].pk, self.user_auth.pk)
+        self.assertFalse(any('FROM "auth_user"' in q['sql'] for q in ctx.captured_queries))
+
+    def test_rutas_publicas_y_token_invalido(self):
+        api = Client(HTTP_AUTHORIZATION=f'Bearer {self._tokens()["access"]}')
+        with mock.patch('rest_framework_simplejwt.authentication.JWTAuthentication.get_validated_token') as validar:
+            api.get(reverse('catalogo_productos'))
+            api.get('/static/css/estilos.css')
+        validar.assert_not_called()
+
+        invalido = Client(HTTP_AUTHORIZATION='Bearer no.es.un.token')
+        response = invalido.get(reverse('perfil_usuario'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ClienteUsuarioTests(TestSetup):
+
+    def test_backfill_vincula_por_email_en_lotes(self):
+        import importlib
+        from django.apps import apps
+        migracion = importlib.import_module('crm.migrations.0020_cliente_usuario')
+        duplicado = User.objects.create_user(username='otro', email='test@test.com', password='x')
+        invitado = Cliente.objects.create(nombre_completo='Invitado', email='invitado@test.com')
+
+        with mock.patch.object(migracion, 'LOTE', 1):
+            migracion.vincular_por_email(apps, None)
+        self.cliente_auth.refresh_from_db()
+        invitado.refresh_from_db()
+        self.assertEqual(self.cliente_auth.usuario, self.user_auth)  # el de menor id
+        self.assertIsNone(invitado.usuario)
+        self.assertFalse(Cliente.objects.filter(usuario=duplicado).exists())
+
+    def test_request_cliente_se_resuelve_por_id_y_sobrevive_cambio_de_email(self):
+        self.client_auth_session.get(reverse('perfil_usuario'))  # primer acceso: vincula por email
+        self.user_auth.email = 'nuevo@test.com'
+        self.user_auth.save()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client_auth_session.get(reverse('perfil_usuario'))
+        self.assertEqual(response.context['cliente'].pk, self.cliente_auth.pk)
+        consultas_cliente = [
+            q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'FROM "crm_cliente"' in q['sql']
+        ]
+        self.assertEqual(len(consultas_cliente), 1)
+        self.assertIn('"usuario_id" =', consultas_cliente[0])
+
+    def test_primera_compra_crea_cliente_vinculado(self):
+        User.objects.create_user(username='nuevo', email='nuevo@test.com', password='password123')
+        comprador = Client()
+        comprador.login(username='nuevo', password='password123')
+        comprador.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        comprador.post(reverse('finalizar_compra'))
+        self.assertEqual(VentaProducto.objects.get().cliente.usuario.username, 'nuevo')
+
+    def test_usuario_sin_cliente_no_consulta_en_cada_peticion(self):
+        User.objects.create_user(username='sincliente', email='sincliente@test.com', password='password123')
+        navegador = Client()
+        navegador.login(username='sincliente', password='password123')
+        navegador.get(reverse('perfil_usuario'))
+        with CaptureQueriesContext(connection) as ctx:
+            navegador.get(reverse('perfil_usuario'))
+        self.assertFalse([q for q in ctx.captured_queries if 'crm_cliente' in q['sql']])
+
+        # Un cliente invitado creado después se vincula en la compra
+        Cliente.objects.create(nombre_completo='Invitado', email='sincliente@test.com')
+        navegador.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        navegador.post(reverse('finalizar_compra'))
+        self.assertEqual(VentaProducto.objects.get().cliente.usuario.username, 'sincliente')
+
+    def test_compra_no_usa_el_cliente_de_otra_cuenta(self):
+        User.objects.create_user(username='copia', email='test@test.com', password='password123')
+        comprador = Client()
+        comprador.login(username='copia', password='password123')
+        self.cliente_auth.usuario = self.user_auth
+        self.cliente_auth.save()
+        comprador.post(reverse('agregar_a_carrito', args=[self.producto_kit.id]))
+        response = comprador.post(reverse('finalizar_compra'), follow=True)
+        self.assertFalse(VentaProducto.objects.exists())
+        self.assertIn('ya pertenece a otra cuenta', str(list(response.context['messages'])[-1]))
+
+    def test_inscripcion_no_usa_el_cliente_de_otra_cuenta(self):
+        User.objects.create_user(username='copia', email='test@test.com', password='password123')
+        alumno = Client()
+        alumno.login(username='copia', password='password123')
+        self.cliente_auth.usuario = self.user_auth
+        self.cliente_auth.save()
+        response = alumno.post(reverse('detalle_taller', args=[self.taller_activo.id]), follow=True)
+        self.assertFalse(Inscripcion.objects.exists())
+        self.assertIn('ya pertenece a otro cliente', str(list(response.context['messages'])[-1]))
+        self.taller_activo.refresh_from_db()
+        self.assertEqual(self.taller_activo.cupos_disponibles, 2)
+
+    def test_inscripcion_vincula_cliente_invitado(self):
+        response = self.client_auth_session.post(reverse('detalle_taller', args=[self.taller_activo.id]))
+        self.assertEqual(response.status_code, 302)
+        self.cliente_auth.refresh_from_db()
+        self.assertEqual(self.cliente_auth.usuario, self.user_auth)
+        self.assertTrue(Inscripcion.objects.filter(cliente=self.cliente_auth).exists())
+
+
+class LoginAdmisionTests(TestSetup):
+
+    def _intentar(self, password, username='testuser'):
+        return self.client.post(reverse('login'), {'username': username, 'password': password})
+
+    def test_fallos_repetidos_se_rechazan_antes_de_hashear(self):
+        for _ in range(5):
+            self.assertEqual(self._intentar('mala').status_code, 200)
+        with mock.patch('django.contrib.auth.backends.ModelBackend.authenticate') as autenticar:
+            response = self._intentar('password123')
+        autenticar.assert_not_called()
+        self.assertContains(response, 'Demasiados intentos fallidos', status_code=429)
+        self.assertIn('Retry-After', response)
+
+        # Otro usuario desde la misma IP sigue entrando
+        User.objects.create_user(username='legitimo', password='password123')
+        self.assertEqual(self._intentar('password123', username='legitimo').status_code, 302)
+
+    def test_login_correcto_limpia_fallos_del_usuario(self):
+        for _ in range(4):
+            self._intentar('mala')
+        self.assertEqual(self._intentar('password123').status_code, 302)
+        for _ in range(4):
+            self.assertEqual(self._intentar('mala').status_code, 200)
+
+    def test_sin_turno_de_hash_responde_503_y_metricas(self):
+        import threading
+        semaforo = threading.BoundedSemaphore(1)
+        semaforo.acquire()
+        with mock.patch('crm.utils.acceso_login._semaforo', semaforo), \
+                self.settings(LOGIN_ESPERA_HASH=0.01):
+            response = self._intentar('password123')
+        self.assertEqual(response.status_code, 503)
+        self._intentar('mala')
+
+        metricas = self.client_admin_session.get(reverse('metricas_login')).json()
+        self.assertEqual(metricas['rechazados_ocupado'], 1)
+        self.assertEqual((metricas['admitidos'], metricas['fallos']), (1, 1))
+
+    def test_token_jwt_con_admision(self):
+        url = reverse('token_obtain_pair')
+        for _ in range(5):
+            self.assertEqual(self.client.post(url, {'username': 'testuser', 'password': 'mala'}).status_code, 401)
+        with mock.patch('django.contrib.auth.backends.ModelBackend.authenticate') as autenticar:
+            response = self.client.post(url, {'username': 'testuser', 'password': 'password123'})
+        autenticar.assert_not_called()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+        User.objects.create_user(username='api', password='password123')
+        response = self.client.post(url, {'username': 'api', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.json())
+
+    def test_login_admin_con_admision(self):
+        url = reverse('admin:login')
+        self.assertEqual(Client().post(url, {'username': 'admin_test', 'password': 'adminpass'}).status_code, 302)
+        for _ in range(5):
+            self.assertEqual(self.client.post(url, {'username': 'admin_test', 'password': 'mala'}).status_code, 200)
+        response = self.client.post(url, {'username': 'admin_test', 'password': 'adminpass'})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+        import threading
+        semaforo = threading.BoundedSemaphore(1)
+        semaforo.acquire()
+        with mock.patch('crm.utils.acceso_login._semaforo', semaforo), self.settings(LOGIN_ESPERA_HASH=0.01):
+            response = self.client.post(url, {'username': 'otro_admin', 'password': 'x'})
+        self.assertEqual(response.status_code, 503)
+
+
+class UsuariosDePruebaTests(TestCase):
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, True)
+        self.salida = os.path.join(directorio, 'locust_users.csv')
+
+    def _crear(self, **opciones):
+        from django.core.management import call_command
+        call_command('create_test_users', bulk=True, output=self.salida, stdout=io.StringIO(), **opciones)
+        with open(self.salida, encoding='utf-8') as f:
+            return [linea.strip().split(',') for linea in f]
+
+    def test_bulk_con_clientes_reutiliza_hash_y_escribe_csv(self):
+        filas = self._crear(count=5, chunk=2, clientes=True)
+        self.assertEqual(filas, [[f'locust{i}', 'locustpass'] for i in range(1, 6)])
+        self.assertEqual(User.objects.filter(username__startswith='locust').count(), 5)
+        self.assertEqual(Cliente.objects.filter(usuario__username__startswith='locust').count(), 5)
+        self.assertTrue(Client().login(username='locust5', password='locustpass'))
+
+        # Repetir reemplaza usuarios y clientes en lugar de duplicarlos
+        self._crear(count=3, clientes=True)
+        self.assertEqual(Cliente.objects.filter(email__endswith='@example.com').count(), 3)
+
+    def test_bulk_con_contrasenas_distintas_hashea_en_procesos(self):
+        filas = self._crear(count=4, chunk=3, unique_passwords=True, workers=2)
+        self.assertEqual(filas[2], ['locust3', 'locustpass3'])
+        self.assertEqual(len({u.password for u in User.objects.filter(username__startswith='locust')}), 4)
+        self.assertTrue(Client().login(username='locust3', password='locustpass3'))
+
+
+class GenerarDatosTests(TestCase):
+
+    def _generar(self, **opciones):
+        from django.core.management import call_command
+        parametros = dict(clientes=60, talleres=8, ventas=30, productos=4, usuarios=3,
+                          semilla=7, fecha_base=date(2026, 6, 1))
+        parametros.update(opciones)
+        call_command('generate_data', stdout=io.StringIO(), **parametros)
+
+    def _huella(self):
+        return list(Inscripcion.objects.order_by('cliente__email', 'taller__nombre').values_list(
+            'cliente__email', 'taller__nombre', 'estado_pago', 'monto_pagado', 'saldo_pendiente', 'fecha_inscripcion',
+        ))
+
+    def test_misma_semilla_genera_los_mismos_datos(self):
+        self._generar()
+        huella = self._huella()
+        self.assertTrue(huella)
+        self._generar(limpiar=True)
+        self.assertEqual(self._huella(), huella)
+        self._generar(limpiar=True, semilla=8)
+        self.assertNotEqual(self._huella(), huella)
+
+    def test_datos_consistentes_con_las_reglas_del_modelo(self):
+        from django.core.management.base import CommandError
+        from django.db.models import Sum
+        from crm.utils.stock import con_stock
+        self._generar()
+        with self.assertRaises(CommandError):
+            self._generar()
+
+        for ins in Inscripcion.objects.select_related('taller'):
+            self.assertEqual(ins.saldo_pendiente, ins.calcular_saldo())
+            self.assertLessEqual(ins.fecha_inscripcion.date(), date(2026, 6, 1))
+        self.assertGreater(Inscripcion.objects.dates('fecha_inscripcion', 'month').count(), 1)
+        for taller in Taller.objects.all():
+            vigentes = taller.inscripciones.exclude(estado_pago='ANULADO').count()
+            self.assertEqual(taller.cupos_totales - taller.cupos_disponibles, vigentes)
+        for producto in con_stock(Producto.objects.all()):
+            vendidas = sum(producto.detalleventa_set.values_list('cantidad', flat=True))
+            self.assertEqual(producto.stock_actual, producto.stock_vigente)
+            self.assertEqual(-(producto.movimientos_stock.aggregate(s=Sum('cantidad'))['s'] or 0), vendidas)
+        for venta in VentaProducto.objects.prefetch_related('detalles'):
+            self.assertEqual(venta.monto_total, sum(d.cantidad * d.precio_unitario for d in venta.detalles.all()))
+
+        self.assertEqual(Cliente.objects.filter(usuario__isnull=False, tipo_cliente='B2C').count(), 3)
+        self.assertTrue(Client().login(username='usuario_b2c_1', password='password123'))
+
+
+class SnapshotBDTests(TransactionTestCase):
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, True)
+
+    def _generar(self, **opciones):
+        from django.core.management import call_command
+        salida = io.StringIO()
+        parametros = dict(clientes=30, talleres=5, ventas=10, productos=3, usuarios=2,
+                          fecha_base=date(2026, 6, 1), snapshot=True, snapshot_dir=self.directorio)
+        parametros.update(opciones)
+        call_command('generate_data', stdout=salida, **parametros)
+        return salida.getvalue()
+
+    def test_generate_data_guarda_y_luego_restaura_el_snapshot(self):
+        self.assertIn('guardado', self._generar())
+        inscripciones = Inscripcion.objects.count()
+        Cliente.objects.filter(pk__in=Cliente.objects.values('pk')[:10]).delete()
+
+        self.assertIn('restaurado', self._generar(limpiar=True))
+        self.assertEqual(Cliente.objects.count(), 30)
+        self.assertEqual(Inscripcion.objects.count(), inscripciones)
+        self.assertTrue(Client().login(username='usuario_b2c_1', password='password123'))
+
+    def test_no_restaura_sobre_datos_sin_limpiar_ni_sin_fecha_base(self):
+        from django.core.management.base import CommandError
+        self._generar()
+        Cliente.objects.filter(pk__in=Cliente.objects.values('pk')[:10]).delete()
+        with self.assertRaisesMessage(CommandError, 'use --limpiar'):
+            self._generar()
+        self.assertEqual(Cliente.objects.count(), 20)
+        with self.assertRaisesMessage(CommandError, 'requiere --fecha-base'):
+            self._generar(fecha_base=None, limpiar=True)
+        self.assertEqual(Cliente.objects.count(), 20)
+
+    def test_no_restaura_snapshot_de_otro_esquema(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from crm.utils import snapshots_bd
+        self._generar()
+        meta = snapshots_bd.listar(self.directorio)[0]
+        meta['esquema'] = 'otro'
+        with open(os.path.join(self.directorio, f'{meta["nombre"]}.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        with self.assertRaisesMessage(CommandError, 'otra versión del esquema'):
+            call_command('snapshot_bd', 'restaurar', nombre=meta['nombre'], dir=self.directorio, stdout=io.StringIO())
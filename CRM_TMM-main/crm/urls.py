@@ -5,6 +5,8 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('login/', views.CustomLoginView.as_view(), name='login'),
     path('talleres/', views.catalogo_talleres, name='catalogo_talleres'),
+    # El stream SSE /talleres/cupos/stream/ se enruta en tmm_project/asgi.py
+    path('talleres/cupos/', views.cupos_talleres, name='cupos_talleres'),
     path('talleres/<int:taller_id>/', views.detalle_taller_inscripcion, name='detalle_taller'), 
     path('pago/<int:inscripcion_id>/', views.pago_simulado, name='pago_simulado'),
     path('gestion/deudores/', views.gestion_deudores, name='gestion_deudores'),
@@ -13,8 +15,10 @@ urlpatterns = [
     path('gestion/email/preview/', views.email_preview, name='email_preview'),
     path('gestion/reportes/ingresos/', views.desglose_ingresos, name='desglose_ingresos'),
     path('gestion/reportes/', views.panel_reportes, name='panel_reportes'),
+    path('gestion/login/metricas/', views.metricas_login, name='metricas_login'),
     path('cuenta/registro/', views.registro_cliente, name='registro_cliente'),
     path('gestion/clientes/', views.listado_clientes, name='listado_clientes'),
+    path('gestion/segmentos/<int:segmento_id>/exportar/', views.exportar_segmento, name='exportar_segmento'),
     path('gestion/clientes/<int:cliente_id>/', views.detalle_cliente_admin, name='detalle_cliente_admin'),
     path('productos/', views.catalogo_productos, name='catalogo_productos'),
     path('productos/<int:producto_id>/', views.detalle_producto, name='detalle_producto'),
@@ -0,0 +1,191 @@
+import hashlib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+
+# Control de admisión de todo punto de login (cada intento cuesta un hash de contraseña):
+# /login/, /admin/login/ y /api/token/.
+#   1. Contadores de fallos por usuario y por IP en ventana deslizante (caché compartida):
+#      sobre el límite se rechaza con 429 antes de hashear.
+#   2. Semáforo por proceso que acota los hashes simultáneos: si no hay turno a tiempo
+#      se responde 503 en vez de encolar más CPU.
+METRICAS = ('admitidos', 'exitos', 'fallos', 'rechazados_usuario', 'rechazados_ip', 'rechazados_ocupado')
+MENSAJE_BLOQUEO = 'Demasiados intentos fallidos. Espera unos minutos antes de volver a intentarlo.'
+MENSAJE_OCUPADO = 'El servidor está ocupado. Intenta nuevamente en unos segundos.'
+
+_semaforo = None
+_semaforo_lock = threading.Lock()
+
+
+class Rechazado(Exception):
+    """Intento de login rechazado antes de hashear (429 por fallos recientes, 503 sin turno)."""
+
+    def __init__(self, mensaje, status, espera):
+        self.mensaje, self.status, self.espera = mensaje, status, espera
+        super().__init__(mensaje)
+
+
+def _config(nombre, defecto):
+    return getattr(settings, nombre, defecto)
+
+
+def ip_de(request):
+    if _config('LOGIN_CONFIAR_X_FORWARDED_FOR', False):
+        reenviada = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        if reenviada:
+            return reenviada.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _clave(ambito, identificador, ventana):
+    huella = hashlib.md5(identificador.lower().encode()).hexdigest()
+    return f'crm:login:{ambito}:{huella}:{ventana}'
+
+
+def _limites(username, ip):
+    """[(ámbito, identificador, máximo, duración de la ventana)] activos (máximo 0 = sin límite)."""
+    limites = [
+        ('usuario', username, _config('LOGIN_FALLOS_POR_USUARIO', 5), _config('LOGIN_VENTANA_USUARIO', 300)),
+        ('ip', ip, _config('LOGIN_FALLOS_POR_IP', 50), _config('LOGIN_VENTANA_IP', 300)),
+    ]
+    return [limite for limite in limites if limite[1] and limite[2] > 0]
+
+
+def bloqueo(username, ip):
+    """(ámbito, segundos de espera) si el usuario o la IP superan su límite; None si se admite.
+
+    Ventana deslizante aproximada: fallos de la ventana actual más los de la anterior
+    ponderados por la fracción que aún cae dentro (una sola lectura a la caché).
+    """
+    limites = _limites(username, ip)
+    if not limites:
+        return None
+    ahora = time.time()
+    claves = []
+    for ambito, identificador, _, duracion in limites:
+        ventana = int(ahora // duracion)
+        claves.append((_clave(ambito, identificador, ventana), _clave(ambito, identificador, ventana - 1)))
+    valores = cache.get_many([clave for par in claves for clave in par])
+    for (ambito, _, maximo, duracion), (actual, anterior) in zip(limites, claves):
+        peso = 1 - (ahora % duracion) / duracion
+        if valores.get(actual, 0) + valores.get(anterior, 0) * peso >= maximo:
+            return ambito, int(duracion - ahora % duracion) + 1
+    return None
+
+
+def registrar_fallo(username, ip):
+    ahora = time.time()
+    for ambito, identificador, _, duracion in _limites(username, ip):
+        clave = _clave(ambito, identificador, int(ahora // duracion))
+        cache.add(clave, 0, duracion * 2)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            cache.set(clave, 1, duracion * 2)
+    contar('fallos')
+
+
+def registrar_exito(username):
+    """Un login correcto limpia los fallos del usuario (no los de la IP)."""
+    duracion = _config('LOGIN_VENTANA_USUARIO', 300)
+    ventana = int(time.time() // duracion)
+    cache.delete_many([_clave('usuario', username, ventana), _clave('usuario', username, ventana - 1)])
+    contar('exitos')
+
+
+def _obtener_semaforo():
+    global _semaforo
+    if _semaforo is None:
+        with _semaforo_lock:
+            if _semaforo is None:
+                _semaforo = threading.BoundedSemaphore(_config('LOGIN_HASHES_CONCURRENTES', 4))
+    return _semaforo
+
+
+@contextmanager
+def turno_hash():
+    """Entrega True si se obtuvo turno para hashear dentro de LOGIN_ESPERA_HASH segundos."""
+    semaforo = _obtener_semaforo()
+    admitido = semaforo.acquire(timeout=_config('LOGIN_ESPERA_HASH', 2.0))
+    try:
+        yield admitido
+    finally:
+        if admitido:
+            semaforo.release()
+
+
+def contar(metrica):
+    clave = f'crm:login:metrica:{metrica}'
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, 0, None)
+        cache.incr(clave)
+
+
+def metricas():
+    valores = cache.get_many([f'crm:login:metrica:{m}' for m in METRICAS])
+    return {m: valores.get(f'crm:login:metrica:{m}', 0) for m in METRICAS}
+
+
+def rechazo(ambito, username, ip):
+    contar(f'rechazados_{ambito}')
+    logger.warning('Login rechazado (%s) usuario=%r ip=%s', ambito, username, ip)
+
+
+@contextmanager
+def admision(username, ip):
+    """Admite un intento de login: el bloque (que hashea la contraseña) corre con turno.
+
+    El llamador registra el resultado con registrar_exito / registrar_fallo.
+
+    Raises:
+        Rechazado: el usuario o la IP superan su límite, o no hubo turno de hash a tiempo
+            (el bloque no se ejecuta).
+    """
+    bloqueado = bloqueo(username, ip)
+    if bloqueado:
+        ambito, espera = bloqueado
+        rechazo(ambito, username, ip)
+        raise Rechazado(MENSAJE_BLOQUEO, 429, espera)
+    with turno_hash() as admitido:
+        if not admitido:
+            rechazo('ocupado', username, ip)
+            raise Rechazado(MENSAJE_OCUPADO, 503, 1)
+        contar('admitidos')
+        yield
+
+
+def con_admision(vista):
+    """Decorador para vistas de login ajenas (p.ej. admin.site.login).
+
+    El login correcto se reconoce por la redirección con que responde LoginView.
+    """
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        if request.method != 'POST':
+            return vista(request, *args, **kwargs)
+        username = request.POST.get('username', '').strip()
+        ip = ip_de(request)
+        try:
+            with admision(username, ip):
+                response = vista(request, *args, **kwargs)
+        except Rechazado as e:
+            response = HttpResponse(e.mensaje, status=e.status, content_type='text/plain; charset=utf-8')
+            response['Retry-After'] = str(e.espera)
+            return response
+        if response.status_code == 302:
+            registrar_exito(username)
+        else:
+            registrar_fallo(username, ip)
+        return response
+    return envoltura
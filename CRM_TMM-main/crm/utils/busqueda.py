@@ -0,0 +1,190 @@
+import re
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from ..models import Cliente
+
+
+# Máximo de resultados rankeados que devuelve una búsqueda (la vista pagina sobre ellos)
+BUSQUEDA_LIMITE = 500
+MAX_TERMINOS = 8
+FTS_TABLA = 'crm_cliente_fts'
+
+# Expresiones indexadas en PostgreSQL (deben coincidir con la migración 0013)
+_PG_VECTOR = (
+    "to_tsvector('simple', crm_unaccent(coalesce(nombre_completo, '') || ' ' || "
+    "coalesce(email, '') || ' ' || coalesce(telefono, '')))"
+)
+_PG_EMPRESA_VECTOR = "to_tsvector('simple', crm_unaccent(razon_social))"
+_PG_NOMBRE_TRGM = "crm_unaccent(lower(nombre_completo))"
+_PG_EMAIL_TRGM = "lower(email)"  # migración 0021
+
+# Texto con forma de correo: se busca entero sobre el email, sin separarlo en términos
+_EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+
+def terminos(texto):
+    """Separa el texto buscado en términos alfanuméricos (sin operadores del motor)."""
+    return re.findall(r'\w+', (texto or '').lower())[:MAX_TERMINOS]
+
+
+def email_buscado(texto):
+    """El texto normalizado si tiene forma de correo, o None."""
+    texto = (texto or '').strip().lower()
+    return texto if _EMAIL_RE.match(texto) else None
+
+
+def _ids_postgres(tokens, texto, limite):
+    # Prefijo por término (ana:* & per:*) + similitud trigram sobre el nombre para errores de tipeo.
+    # Cada rama del UNION usa su propio índice (tsvector, trigram del nombre, tsvector de empresa);
+    # un OR entre ellas obligaría a recorrer crm_cliente completa.
+    consulta = ' & '.join(f'{t}:*' for t in tokens)
+    tsquery = "to_tsquery('simple', crm_unaccent(%s))"
+    sql = f"""
+        SELECT c.id
+        FROM crm_cliente c
+        JOIN (
+            SELECT id FROM crm_cliente WHERE {_PG_VECTOR} @@ {tsquery}
+            UNION
+            SELECT id FROM crm_cliente WHERE {_PG_NOMBRE_TRGM} %% crm_unaccent(lower(%s))
+            UNION
+            SELECT c2.id FROM crm_cliente c2
+            JOIN crm_empresa e ON e.id = c2.empresa_id
+            WHERE to_tsvector('simple', crm_unaccent(e.razon_social)) @@ {tsquery}
+        ) m ON m.id = c.id
+        ORDER BY ts_rank({_PG_VECTOR}, {tsquery})
+                 + similarity({_PG_NOMBRE_TRGM}, crm_unaccent(lower(%s))) DESC,
+                 c.id DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [consulta, texto, consulta, consulta, texto, limite])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _ids_email_postgres(email, limite):
+    # Igualdad por el índice único y, para correos mal escritos, similitud trigram sobre lower(email)
+    sql = f"""
+        SELECT id FROM (
+            SELECT id, 2.0 AS rank FROM crm_cliente WHERE email = %s
+            UNION
+            SELECT id, similarity({_PG_EMAIL_TRGM}, %s) AS rank FROM crm_cliente
+            WHERE {_PG_EMAIL_TRGM} %% %s
+        ) r
+        GROUP BY id
+        ORDER BY max(rank) DESC, id DESC
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [email, email, email, limite])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _ids_sqlite(tokens, limite):
+    # FTS5 con remove_diacritics: "jose"* coincide con "José", ordenado por bm25
+    consulta = ' '.join(f'"{t}"*' for t in tokens)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLA} WHERE {FTS_TABLA} MATCH %s ORDER BY bm25({FTS_TABLA}) LIMIT %s',
+            [consulta, limite],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def _ids_email_sqlite(email, limite):
+    # Frase sobre la columna email: los tokens del correo, contiguos y en orden
+    frase = ' '.join(re.findall(r'\w+', email))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLA} WHERE {FTS_TABLA} MATCH %s ORDER BY bm25({FTS_TABLA}) LIMIT %s',
+            [f'email : "{frase}"', limite],
+        )
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def ids_rankeados(texto, limite=BUSQUEDA_LIMITE):
+    """Ids de clientes que coinciden con `texto`, del más al menos relevante.
+
+    Usa el índice del motor (tsvector + trigram en PostgreSQL, FTS5 en SQLite). Un texto
+    con forma de correo se busca entero sobre el email.
+    Devuelve None si el motor no tiene índice de búsqueda disponible.
+    """
+    email = email_buscado(texto)
+    tokens = terminos(texto)
+    if not tokens:
+        return []
+    try:
+        # Savepoint: un error del motor no debe invalidar la transacción en curso
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                if email:
+                    return _ids_email_postgres(email, limite)
+                return _ids_postgres(tokens, ' '.join(tokens), limite)
+            if connection.vendor == 'sqlite':
+                if email:
+                    return _ids_email_sqlite(email, limite)
+                return _ids_sqlite(tokens, limite)
+    except DatabaseError:
+        # Índice ausente (p.ej. extensión no instalada): se usa la búsqueda simple
+        return None
+    return None
+
+
+def buscar_clientes(queryset, texto, limite=BUSQUEDA_LIMITE, por_relevancia=True):
+    """Filtra `queryset` por el texto buscado y (opcionalmente) lo ordena por relevancia."""
+    ids = ids_rankeados(texto, limite)
+    if ids is None:
+        email = email_buscado(texto)
+        if email:
+            return queryset.filter(email__iexact=email)
+        filtro = Q()
+        for t in terminos(texto):
+            filtro &= (
+                Q(nombre_completo__icontains=t) | Q(email__icontains=t)
+                | Q(telefono__icontains=t) | Q(empresa__razon_social__icontains=t)
+            )
+        return queryset.filter(filtro)
+    if not ids:
+        return queryset.none()
+    if not por_relevancia:
+        return queryset.filter(id__in=ids)
+    posicion = Case(*[When(id=pk, then=Value(i)) for i, pk in enumerate(ids)], output_field=IntegerField())
+    return queryset.filter(id__in=ids).order_by(posicion)
+
+
+# --- Sincronización del índice FTS5 (solo SQLite; PostgreSQL indexa las columnas directamente) ---
+
+def _usa_fts():
+    return connection.vendor == 'sqlite'
+
+
+def indexar_clientes(ids=None):
+    """Reescribe las filas del índice FTS5 para `ids` (o todos los clientes si es None)."""
+    if not _usa_fts():
+        return 0
+    clientes = Cliente.objects.all()
+    if ids is not None:
+        clientes = clientes.filter(id__in=ids)
+    filas = [
+        (pk, nombre or '', email or '', telefono or '', empresa or '')
+        for pk, nombre, email, telefono, empresa in clientes.values_list(
+            'id', 'nombre_completo', 'email', 'telefono', 'empresa__razon_social'
+        ).iterator()
+    ]
+    with connection.cursor() as cursor:
+        if ids is None:
+            cursor.execute(f'DELETE FROM {FTS_TABLA}')
+        else:
+            cursor.executemany(f'DELETE FROM {FTS_TABLA} WHERE rowid = %s', [(pk,) for pk in ids])
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLA} (rowid, nombre, email, telefono, empresa) VALUES (%s, %s, %s, %s, %s)',
+            filas,
+        )
+    return len(filas)
+
+
+def desindexar_cliente(cliente_id):
+    if not _usa_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLA} WHERE rowid = %s', [cliente_id])
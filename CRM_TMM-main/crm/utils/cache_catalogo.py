@@ -0,0 +1,192 @@
+import hashlib
+import re
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.html import format_html
+from django.utils.http import http_date, quote_etag
+from django.utils.safestring import mark_safe
+
+
+PAGINA_TIMEOUT = 60 * 15  # 15 minutos (las claves cambian de versión al modificar los datos)
+TARJETA_TIMEOUT = 60 * 60
+# Marcador que reemplaza al token CSRF en el HTML cacheado; se sustituye por el token de cada visitante
+CSRF_MARCADOR = '__crm_csrf_token__'
+# Marcador de las unidades disponibles de un producto en el HTML cacheado (ver insertar_disponibles)
+_STOCK_MARCADOR = '__crm_stock_{}__'
+_STOCK_MARCADOR_RE = re.compile(r'__crm_stock_(\d+)__')
+
+# Ámbitos de versión:
+#   'talleres' / 'productos'         -> listados de los catálogos
+#   'taller:<id>' / 'producto:<id>'  -> detalle y tarjeta de un objeto
+#   'categorias'                     -> nombres de Interes mostrados en los talleres
+#   'stock'                          -> unidades disponibles de los productos (reservas, compras,
+#                                       movimientos); no forma parte de la clave de páginas ni tarjetas
+
+
+def _clave_version(ambito):
+    return f'crm:catalogo:version:{ambito}'
+
+
+def versiones(ambitos):
+    """Versión vigente de cada ámbito (una sola ida a la caché)."""
+    claves = [_clave_version(a) for a in ambitos]
+    encontradas = cache.get_many(claves)
+    for clave in claves:
+        if clave not in encontradas:
+            cache.add(clave, 1, None)
+            encontradas[clave] = cache.get(clave, 1)
+    return [encontradas[clave] for clave in claves]
+
+
+def invalidar(*ambitos):
+    for ambito in ambitos:
+        try:
+            cache.incr(_clave_version(ambito))
+        except ValueError:
+            cache.set(_clave_version(ambito), 1, None)
+
+
+def invalidar_talleres(taller_ids):
+    """Invalida el catálogo y el detalle/tarjeta de cada taller tras confirmar la transacción.
+
+    Se hace en on_commit para que ninguna petición concurrente vuelva a cachear
+    los datos anteriores bajo la versión nueva.
+    """
+    ambitos = ['talleres'] + [f'taller:{pk}' for pk in taller_ids]
+    transaction.on_commit(lambda: invalidar(*ambitos))
+
+
+def invalidar_productos(producto_ids):
+    ambitos = ['productos'] + [f'producto:{pk}' for pk in producto_ids]
+    transaction.on_commit(lambda: invalidar(*ambitos))
+
+
+def invalidar_stock():
+    """Cambió el stock disponible de algún producto: las páginas y tarjetas cacheadas siguen valiendo."""
+    transaction.on_commit(lambda: invalidar('stock'))
+
+
+def marcador_stock(producto_id):
+    return _STOCK_MARCADOR.format(producto_id)
+
+
+def _html_disponibles(n):
+    if n:
+        return format_html('<strong>Disponibles:</strong> {}', n)
+    return 'Sin stock disponible'
+
+
+def insertar_disponibles(response, ambitos, calcular):
+    """Reemplaza los marcadores de stock del HTML por las unidades disponibles vigentes.
+
+    `calcular()` devuelve {producto_id: disponibles} y solo se ejecuta una vez por
+    versión de `ambitos`; así agregar al carrito no invalida la página cacheada.
+    """
+    if response.status_code != 200 or response.streaming:
+        return response
+    html = response.content.decode(response.charset)
+    if not _STOCK_MARCADOR_RE.search(html):
+        return response
+    clave = 'crm:disponibles:' + ':'.join(str(v) for v in versiones(ambitos))
+    disponibles = cache.get(clave)
+    if disponibles is None:
+        disponibles = calcular()
+        cache.set(clave, disponibles, PAGINA_TIMEOUT)
+    response.content = _STOCK_MARCADOR_RE.sub(
+        lambda m: _html_disponibles(disponibles.get(int(m.group(1)), 0)), html
+    )
+    return response
+
+
+def pagina_anonima(request, nombre, ambitos, generar):
+    """Sirve desde caché el HTML de un GET anónimo; en otro caso delega en `generar`.
+
+    `generar(contexto_extra)` debe devolver la respuesta renderizada. Para la
+    variante anónima se le pasa el token CSRF como marcador, de modo que la
+    misma página sirve a todos los visitantes sin consultar la BD. Los usuarios
+    autenticados (cabecera y formularios propios) se renderizan siempre, pero
+    reutilizan las tarjetas cacheadas.
+    """
+    if request.method != 'GET' or request.user.is_authenticated:
+        return generar({})
+    clave = f'crm:pagina:{nombre}:' + ':'.join(str(v) for v in versiones(ambitos))
+    html = cache.get(clave)
+    if html is None:
+        response = generar({'csrf_token': CSRF_MARCADOR})
+        if response.status_code != 200:
+            return response
+        html = response.content.decode(response.charset)
+        cache.set(clave, html, PAGINA_TIMEOUT)
+    if CSRF_MARCADOR in html:
+        html = html.replace(CSRF_MARCADOR, get_token(request))
+    return HttpResponse(html)
+
+
+def tarjetas(objetos, tipo, plantilla, ambitos_extra=()):
+    """HTML de la tarjeta de cada objeto, cacheado por su versión (2 idas a la caché en total).
+
+    Solo se re-renderizan las tarjetas de objetos modificados desde la última visita.
+    """
+    objetos = list(objetos)
+    if not objetos:
+        return []
+    extra = ':'.join(str(v) for v in versiones(ambitos_extra))
+    claves = [
+        f'crm:tarjeta:{tipo}:{obj.pk}:{version}:{extra}'
+        for obj, version in zip(objetos, versiones([f'{tipo}:{obj.pk}' for obj in objetos]))
+    ]
+    cacheadas = cache.get_many(claves)
+    nuevas = {}
+    for obj, clave in zip(objetos, claves):
+        if clave not in cacheadas:
+            nuevas[clave] = render_to_string(plantilla, {tipo: obj})
+    if nuevas:
+        cache.set_many(nuevas, TARJETA_TIMEOUT)
+        cacheadas.update(nuevas)
+    return [mark_safe(cacheadas[clave]) for clave in claves]
+
+
+def validadores(nombre, ambitos, calcular):
+    """(última modificación, resumen) de una página, cacheados por versión de sus ámbitos.
+
+    `calcular()` hace la consulta barata (p.ej. MAX(updated_at) y COUNT) y solo
+    se ejecuta la primera vez tras un cambio.
+    """
+    version = ':'.join(str(v) for v in versiones(ambitos))
+    clave = f'crm:validador:{nombre}:{version}'
+    datos = cache.get(clave)
+    if datos is None:
+        ultima, resumen = calcular()
+        datos = (ultima, f'{version}:{resumen}')
+        cache.set(clave, datos, PAGINA_TIMEOUT)
+    return datos
+
+
+def respuesta_condicional(request, nombre, ambitos, calcular, responder):
+    """Agrega ETag/Last-Modified y responde 304 si el cliente ya tiene la versión vigente.
+
+    El ETag distingue la variante anónima de la de cada usuario autenticado
+    (la cabecera muestra su nombre). Los superusuarios ven datos que no
+    reflejan los validadores (inscripciones) y siempre reciben la página completa.
+    """
+    if request.method not in ('GET', 'HEAD') or request.user.is_superuser:
+        return responder()
+    ultima, resumen = validadores(nombre, ambitos, calcular)
+    variante = f'u{request.user.pk}' if request.user.is_authenticated else 'anon'
+    etag = quote_etag(hashlib.md5(f'{variante}:{resumen}'.encode()).hexdigest())
+    last_modified = int(ultima.timestamp()) if ultima else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = responder()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Cookie'])
+    return response
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core import signing
+
+
+# Estructura del carrito: { 'producto_id': {'cantidad': X, 'precio': Y} }
+CARRITO_COOKIE = 'crm_carrito'
+CARRITO_SALT = 'crm.carrito'
+CARRITO_COOKIE_MAX_AGE = 60 * 60 * 24 * 30  # 30 días
+# Límite práctico de una cookie (4096 bytes incluyendo nombre y atributos)
+CARRITO_COOKIE_MAX_BYTES = 3800
+
+
+def en_cookie():
+    return getattr(settings, 'CARRITO_EN_COOKIE', False)
+
+
+def obtener(request):
+    """Carrito del visitante sin escribir nada (ni crear una sesión vacía).
+
+    Orden de lectura: cookie firmada (si el modo cookie está activo) y luego la sesión.
+    """
+    if hasattr(request, '_carrito'):
+        return request._carrito
+    carrito = None
+    if en_cookie() and CARRITO_COOKIE in request.COOKIES:
+        try:
+            carrito = signing.loads(
+                request.COOKIES[CARRITO_COOKIE], salt=CARRITO_SALT, max_age=CARRITO_COOKIE_MAX_AGE
+            )
+        except signing.BadSignature:
+            carrito = None
+    if carrito is None and request.session.session_key:
+        carrito = request.session.get('carrito')
+    request._carrito = dict(carrito or {})
+    return request._carrito
+
+
+def guardar(request, carrito):
+    """Marca el carrito para persistirlo al responder (lo hace CarritoMiddleware)."""
+    request._carrito = carrito
+    request._carrito_modificado = True
+
+
+def vaciar(request):
+    guardar(request, {})
+
+
+def persistir(request, response):
+    """Escribe el carrito modificado en la cookie firmada o, si no cabe o el modo cookie
+    está desactivado, en la sesión."""
+    if not getattr(request, '_carrito_modificado', False):
+        return response
+    carrito = request._carrito
+    if en_cookie():
+        valor = signing.dumps(carrito, salt=CARRITO_SALT, compress=True) if carrito else ''
+        if len(valor) <= CARRITO_COOKIE_MAX_BYTES:
+            if carrito:
+                response.set_cookie(
+                    CARRITO_COOKIE, valor, max_age=CARRITO_COOKIE_MAX_AGE, httponly=True,
+                    samesite='Lax', secure=settings.SESSION_COOKIE_SECURE,
+                )
+            else:
+                response.delete_cookie(CARRITO_COOKIE, samesite='Lax')
+            # Un carrito anterior que había pasado a la sesión deja de ser el vigente
+            if request.session.session_key and 'carrito' in request.session:
+                del request.session['carrito']
+            return response
+        # Carrito demasiado grande para una cookie: se guarda en la sesión
+        response.delete_cookie(CARRITO_COOKIE, samesite='Lax')
+    if carrito:
+        request.session['carrito'] = carrito
+    elif 'carrito' in request.session:
+        del request.session['carrito']
+    return response
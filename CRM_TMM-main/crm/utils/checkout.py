@@ -0,0 +1,109 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, When
+from django.db.models.functions import Now
+from ..models import DetalleVenta, MovimientoStock, Producto, ReservaStock, VentaProducto
+from . import stock
+from .cache_catalogo import invalidar_stock
+
+
+class CarritoInvalido(ValueError):
+    """El carrito no se puede cobrar (producto inexistente o stock insuficiente)."""
+
+
+def lineas_del_carrito(carrito):
+    """{producto_id: (cantidad, precio_unitario, reserva_id)} validado desde el carrito de la sesión/cookie."""
+    lineas = {}
+    for id_str, data in carrito.items():
+        try:
+            cantidad = int(data['cantidad'])
+            precio = Decimal(str(data['precio']))
+            producto_id = int(id_str)
+            reserva_id = int(data['reserva']) if data.get('reserva') else None
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise CarritoInvalido('El carrito contiene datos inválidos.')
+        if cantidad > 0:
+            lineas[producto_id] = (cantidad, precio, reserva_id)
+    return lineas
+
+
+def finalizar_venta(cliente, carrito):
+    """Registra la venta de un carrito con un número fijo de consultas.
+
+    1. Bloquea todos los productos en un solo SELECT ... FOR UPDATE ordenado por id
+       (todas las compras toman los bloqueos en el mismo orden: sin deadlocks).
+    2. Valida el stock con las filas bloqueadas y calcula el total en la misma pasada.
+       Las unidades reservadas por este carrito (utils/reservas.py) cuentan como
+       disponibles para él; las reservadas por otros carritos no.
+    3. Inserta la venta, sus detalles y los movimientos VENTA del libro de stock
+       (bulk_create). stock_actual no se reescribe (queda para la consolidación),
+       pero la fila sigue bloqueada durante toda la compra y el contador de
+       reservas se actualiza si el carrito tenía reservas propias: el libro da
+       trazabilidad, no menos contención.
+
+    Raises:
+        CarritoInvalido: carrito vacío, producto inexistente o stock insuficiente
+            (no se escribe nada).
+
+    Returns:
+        VentaProducto: la venta registrada como PAGADO.
+    """
+    lineas = lineas_del_carrito(carrito)
+    if not lineas:
+        raise CarritoInvalido('El carrito está vacío.')
+
+    with transaction.atomic():
+        productos = list(
+            Producto.objects.select_for_update().filter(pk__in=lineas.keys())
+            .order_by('pk').only('pk', 'nombre', 'stock_actual', 'stock_reservado')
+        )
+        encontrados = {p.pk for p in productos}
+        for producto_id in lineas:
+            if producto_id not in encontrados:
+                raise CarritoInvalido(f'El producto con ID {producto_id} ya no existe.')
+
+        # Reservas propias que siguen sin liberar (se leen después de bloquear los productos)
+        reserva_ids = [linea[2] for linea in lineas.values() if linea[2]]
+        propias = {}
+        if reserva_ids:
+            for producto_id, cantidad in ReservaStock.objects.filter(pk__in=reserva_ids).values_list('producto_id', 'cantidad'):
+                propias[producto_id] = propias.get(producto_id, 0) + cantidad
+
+        movidos = stock.movidos(encontrados)
+
+        total = Decimal(0)
+        detalles = []
+        for producto in productos:
+            cantidad, precio, _ = lineas[producto.pk]
+            vigente = producto.stock_actual + movidos.get(producto.pk, 0)
+            disponibles = vigente - producto.stock_reservado + propias.get(producto.pk, 0)
+            if disponibles < cantidad:
+                raise CarritoInvalido(
+                    f'¡Stock insuficiente! Solo quedan {max(disponibles, 0)} unidades de "{producto.nombre}".'
+                )
+            total += precio * cantidad
+            detalles.append(DetalleVenta(producto_id=producto.pk, cantidad=cantidad, precio_unitario=precio))
+
+        venta = VentaProducto.objects.create(cliente=cliente, monto_total=total, estado_pago='PAGADO')
+        for detalle in detalles:
+            detalle.venta = venta
+        DetalleVenta.objects.bulk_create(detalles)
+        MovimientoStock.objects.bulk_create([
+            MovimientoStock(producto_id=d.producto_id, tipo='VENTA', cantidad=-d.cantidad, venta=venta)
+            for d in detalles
+        ])
+
+        if propias:
+            Producto.objects.filter(pk__in=propias).update(
+                stock_reservado=Case(
+                    *[When(pk=pk, then=F('stock_reservado') - cantidad) for pk, cantidad in propias.items()],
+                    output_field=IntegerField(),
+                ),
+                updated_at=Now(),
+            )
+        if reserva_ids:
+            ReservaStock.objects.filter(pk__in=reserva_ids).delete()
+        # update() no dispara señales: invalidar explícitamente el stock mostrado en el catálogo
+        invalidar_stock()
+    return venta
@@ -0,0 +1,97 @@
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from ..models import Cliente, Inscripcion
+
+
+CLIENTES_POR_PAGINA = 25
+# Bajo este tamaño se cuenta exacto; sobre él, el total sin filtros se estima desde el catálogo
+CONTEO_EXACTO_HASTA = 100000
+# Usuarios sin Cliente (staff, cuentas que aún no compran): se recuerda la ausencia para no
+# repetir el SELECT + UPDATE en cada petición. Crear o vincular un Cliente la olvida (signals.py).
+SIN_CLIENTE_TIMEOUT = 60 * 10
+
+ClienteInteres = Cliente.intereses_cliente.through
+
+
+def filtrar_clientes(queryset, tipo=None, interes_ids=None, taller_id=None, deudores=False, puntaje_min=None):
+    """Aplica los filtros de listado_clientes con subconsultas EXISTS (sin JOIN + DISTINCT).
+
+    Cada cliente aparece una sola vez aunque tenga varios intereses o inscripciones,
+    y el motor puede detenerse en la primera fila que cumpla la condición.
+    """
+    if tipo:
+        queryset = queryset.filter(tipo_cliente=tipo)
+    if interes_ids:
+        queryset = queryset.filter(Exists(
+            ClienteInteres.objects.filter(cliente_id=OuterRef('pk'), interes_id__in=interes_ids)
+        ))
+    if taller_id:
+        queryset = queryset.filter(Exists(
+            Inscripcion.objects.filter(
+                cliente_id=OuterRef('pk'), taller_id=taller_id,
+                estado_pago__in=['PENDIENTE', 'ABONADO', 'PAGADO'],
+            )
+        ))
+    if deudores:
+        queryset = queryset.filter(Exists(
+            Inscripcion.objects.filter(cliente_id=OuterRef('pk'), estado_pago__in=['PENDIENTE', 'ABONADO'])
+        ))
+    if puntaje_min:
+        queryset = queryset.filter(puntaje__puntaje_total__gte=puntaje_min)
+    return queryset
+
+
+def _estimacion_catalogo(tabla):
+    """Filas estimadas por las estadísticas de PostgreSQL (None en otros motores o sin ANALYZE)."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [tabla])
+        fila = cursor.fetchone()
+    if not fila or fila[0] is None or fila[0] < 0:
+        return None
+    return int(fila[0])
+
+
+def contar_clientes(queryset, filtrado):
+    """Total para la paginación: estimado si no hay filtros y la tabla es grande.
+
+    Returns:
+        tuple: (total, es_estimado)
+    """
+    if not filtrado:
+        estimado = _estimacion_catalogo(Cliente._meta.db_table)
+        if estimado is not None and estimado > CONTEO_EXACTO_HASTA:
+            return estimado, True
+    return queryset.count(), False
+
+
+def _clave_sin_cliente(user_id):
+    return f'crm:sin_cliente:{user_id}'
+
+
+def olvidar_sin_cliente(user_id):
+    cache.delete(_clave_sin_cliente(user_id))
+
+
+def cliente_de_usuario(user, recordar_ausencia=True):
+    """Cliente vinculado al usuario, buscado por usuario_id (una consulta por entero).
+
+    Si el usuario aún no tiene vínculo (cuentas creadas después del backfill a partir
+    de un cliente invitado), se busca una única vez por email y se vincula. Si tampoco
+    hay cliente invitado, la ausencia se recuerda SIN_CLIENTE_TIMEOUT segundos
+    (`recordar_ausencia=False` la ignora y vuelve a consultar).
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return None
+    clave = _clave_sin_cliente(user.pk)
+    if recordar_ausencia and cache.get(clave):
+        return None
+    cliente = Cliente.objects.filter(usuario_id=user.pk).first()
+    if cliente is None and user.email:
+        if Cliente.objects.filter(email=user.email, usuario__isnull=True).update(usuario_id=user.pk):
+            cliente = Cliente.objects.filter(usuario_id=user.pk).first()
+    if cliente is None:
+        cache.set(clave, True, SIN_CLIENTE_TIMEOUT)
+    return cliente
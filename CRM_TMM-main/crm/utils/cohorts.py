@@ -0,0 +1,108 @@
+import numpy as np
+from django.core.cache import cache
+from django.db.models.functions import ExtractMonth, ExtractYear
+from ..models import Inscripcion
+
+
+COHORT_CACHE_KEY = 'crm:reportes:cohortes:v1'
+COHORT_CACHE_TIMEOUT = 60 * 15  # 15 minutos
+COHORT_HORIZON = 12
+COHORT_CHUNK_SIZE = 20000
+
+MESES_CORTOS = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+
+def build_cohort_matrix(cliente_ids, meses, horizon=COHORT_HORIZON):
+    """Construye la matriz de retención por cohortes de forma vectorizada.
+
+    Args:
+        cliente_ids (np.ndarray): id del cliente por inscripción.
+        meses (np.ndarray): mes absoluto de la inscripción (anio * 12 + mes - 1).
+        horizon (int): cantidad de meses posteriores a la cohorte a medir.
+
+    Returns:
+        tuple: (primer_mes, matriz)
+          - primer_mes: mes absoluto de la primera cohorte (o None si no hay datos)
+          - matriz: np.ndarray (num_cohortes, horizon + 1) con clientes distintos
+            activos en el mes M+k; la columna 0 es el tamaño de la cohorte.
+    """
+    cliente_ids = np.asarray(cliente_ids, dtype=np.int64)
+    meses = np.asarray(meses, dtype=np.int64)
+    if cliente_ids.size == 0:
+        return None, np.zeros((0, horizon + 1), dtype=np.int64)
+
+    # Ordenar por (cliente, mes): el primer registro de cada cliente es su cohorte
+    orden = np.lexsort((meses, cliente_ids))
+    cliente_ids = cliente_ids[orden]
+    meses = meses[orden]
+
+    _, inicio, inversa = np.unique(cliente_ids, return_index=True, return_inverse=True)
+    cohorte_cliente = meses[inicio]
+    desfase = meses - cohorte_cliente[inversa]
+
+    # Un cliente cuenta una sola vez por mes de desfase dentro del horizonte
+    en_horizonte = desfase <= horizon
+    claves = np.unique(inversa[en_horizonte] * (horizon + 1) + desfase[en_horizonte])
+    cliente_idx = claves // (horizon + 1)
+    desfase = claves % (horizon + 1)
+
+    primer_mes = int(cohorte_cliente.min())
+    num_cohortes = int(cohorte_cliente.max()) - primer_mes + 1
+    celda = (cohorte_cliente[cliente_idx] - primer_mes) * (horizon + 1) + desfase
+    matriz = np.bincount(celda, minlength=num_cohortes * (horizon + 1))
+    return primer_mes, matriz.reshape(num_cohortes, horizon + 1)
+
+
+def _fetch_inscripciones():
+    """Lee los pares (cliente_id, mes absoluto) en un único stream hacia arreglos NumPy."""
+    filas = (
+        Inscripcion.objects.exclude(estado_pago='ANULADO')
+        .annotate(anio=ExtractYear('fecha_inscripcion'), mes=ExtractMonth('fecha_inscripcion'))
+        .values_list('cliente_id', 'anio', 'mes')
+        .order_by()
+        .iterator(chunk_size=COHORT_CHUNK_SIZE)
+    )
+    plano = np.fromiter(
+        (valor for fila in filas for valor in fila),
+        dtype=np.int64,
+    ).reshape(-1, 3)
+    return plano[:, 0], plano[:, 1] * 12 + plano[:, 2] - 1
+
+
+def compute_cohort_report(horizon=COHORT_HORIZON):
+    """Calcula el reporte de retención por cohortes listo para la plantilla."""
+    cliente_ids, meses = _fetch_inscripciones()
+    primer_mes, matriz = build_cohort_matrix(cliente_ids, meses, horizon=horizon)
+
+    filas = []
+    for i, conteos in enumerate(matriz):
+        tamano = int(conteos[0])
+        if not tamano:
+            continue
+        mes_abs = primer_mes + i
+        anio, mes = divmod(mes_abs, 12)
+        retencion = [round(100.0 * int(c) / tamano, 1) for c in conteos[1:]]
+        filas.append({
+            'cohorte': f'{MESES_CORTOS[mes]} {anio}',
+            'anio': anio,
+            'mes': mes + 1,
+            'clientes': tamano,
+            'retorno': [int(c) for c in conteos[1:]],
+            'retencion': retencion,
+        })
+
+    return {
+        'horizonte': list(range(1, horizon + 1)),
+        'filas': filas,
+        'total_inscripciones': int(cliente_ids.size),
+    }
+
+
+def get_cohort_report(horizon=COHORT_HORIZON, refresh=False):
+    """Devuelve el reporte de cohortes desde caché, recalculándolo si expiró."""
+    key = f'{COHORT_CACHE_KEY}:{horizon}'
+    reporte = None if refresh else cache.get(key)
+    if reporte is None:
+        reporte = compute_cohort_report(horizon=horizon)
+        cache.set(key, reporte, COHORT_CACHE_TIMEOUT)
+    return reporte
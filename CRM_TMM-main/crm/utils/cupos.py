@@ -0,0 +1,90 @@
+from django.core.cache import cache
+from django.db import transaction
+from ..models import Taller
+
+
+# Estado vigente de cada taller: crm:cupos:estado:<id> -> [disponibles, totales]
+# Feed de cambios: crm:cupos:seq (contador) + crm:cupos:evento:<seq> -> [id, disponibles, totales]
+# El feed lo lee un único difusor por proceso (crm/sse.py); con varios procesos o
+# servidores la caché debe ser compartida (Redis/Memcached).
+_SEQ_KEY = 'crm:cupos:seq'
+EVENTO_TIMEOUT = 60 * 5
+# Estado sembrado desde la BD por un lector: caduca por si una publicación se perdiera
+SEMILLA_TIMEOUT = 60 * 10
+MAX_IDS = 50
+
+
+def clave_estado(taller_id):
+    return f'crm:cupos:estado:{taller_id}'
+
+
+def clave_evento(seq):
+    return f'crm:cupos:evento:{seq}'
+
+
+def parsear_ids(texto):
+    """'1,2,3' -> [1, 2, 3] (ignora valores no numéricos, máximo MAX_IDS)."""
+    ids = []
+    for parte in (texto or '').split(','):
+        parte = parte.strip()
+        if parte.isdigit() and int(parte) not in ids:
+            ids.append(int(parte))
+    return ids[:MAX_IDS]
+
+
+def cupos_de(taller_ids):
+    """{id: {'disponibles': n, 'totales': m}} desde la caché; solo los faltantes van a la BD.
+
+    La siembra usa cache.add: si publicar() escribió entre la lectura de la BD y
+    la siembra, se conserva el valor publicado (más nuevo) en vez de pisarlo.
+    """
+    claves = {clave_estado(pk): pk for pk in taller_ids}
+    encontrados = cache.get_many(claves)
+    faltantes = [pk for clave, pk in claves.items() if clave not in encontrados]
+    if faltantes:
+        for pk, disponibles, totales in Taller.objects.filter(pk__in=faltantes).values_list(
+            'pk', 'cupos_disponibles', 'cupos_totales'
+        ):
+            clave = clave_estado(pk)
+            valor = [disponibles, totales]
+            if not cache.add(clave, valor, SEMILLA_TIMEOUT):
+                valor = cache.get(clave, valor)
+            encontrados[clave] = valor
+    return {
+        pk: {'disponibles': encontrados[clave][0], 'totales': encontrados[clave][1]}
+        for clave, pk in claves.items() if clave in encontrados
+    }
+
+
+def seq_actual():
+    return cache.get(_SEQ_KEY, 0)
+
+
+def _siguiente_seq():
+    try:
+        return cache.incr(_SEQ_KEY)
+    except ValueError:
+        cache.add(_SEQ_KEY, 0, None)
+        return cache.incr(_SEQ_KEY)
+
+
+def publicar(taller_id, disponibles, totales):
+    """Actualiza el estado del taller y agrega el cambio al feed (llamar tras el commit)."""
+    cache.set(clave_estado(taller_id), [disponibles, totales], None)
+    cache.set(clave_evento(_siguiente_seq()), [taller_id, disponibles, totales], EVENTO_TIMEOUT)
+
+
+def retirar(taller_id):
+    """Taller eliminado: se publica con 0 cupos y se olvida su estado."""
+    cache.set(clave_evento(_siguiente_seq()), [taller_id, 0, 0], EVENTO_TIMEOUT)
+    cache.delete(clave_estado(taller_id))
+
+
+def publicar_desde_bd(taller_ids):
+    """Para cambios hechos con update(): lee los cupos confirmados y los publica."""
+    def _publicar():
+        for pk, disponibles, totales in Taller.objects.filter(pk__in=taller_ids).values_list(
+            'pk', 'cupos_disponibles', 'cupos_totales'
+        ):
+            publicar(pk, disponibles, totales)
+    transaction.on_commit(_publicar)
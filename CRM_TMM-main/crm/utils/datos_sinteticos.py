@@ -0,0 +1,339 @@
+"""Generador de datos sintéticos a escala (comando `generate_data`).
+
+Todas las columnas (fechas, montos, estados, asignaciones) se generan de forma
+vectorizada con numpy a partir de una semilla y una fecha base fijas: los mismos
+parámetros producen siempre los mismos datos. La escritura es con `bulk_create`
+por lotes, una transacción por lote.
+
+Distribuciones:
+  - inscripciones por cliente: binomial negativa (muchos clientes con 0-1, cola larga)
+  - popularidad de talleres, productos y compradores: log-normal
+  - fecha de inscripción: exponencial hacia atrás desde la fecha del taller
+  - estado de pago: según si el taller ya ocurrió (los futuros tienen más deuda)
+
+`bulk_create` no dispara señales: al final se reconstruyen el índice de búsqueda,
+la segmentación, los conteos de deudores y las versiones del catálogo.
+"""
+import datetime
+from contextlib import contextmanager
+
+import numpy as np
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import (
+    Cliente, DetalleVenta, Empresa, Inscripcion, Interes, MovimientoStock, Producto, Taller, VentaProducto,
+)
+from . import cache_catalogo, segmentos, stock
+from .busqueda import indexar_clientes
+from .deudores import invalidar_conteos
+
+
+LOTE = 10000
+DIA = 86400
+
+NOMBRES = ["Jessica", "Pamela", "Angélica", "Daniela", "Cynthia", "Marisol", "Nataly", "Fernanda", "Sara",
+           "Gloria", "Carla", "Maleni", "Noemi", "Rosa", "Andrea", "Javier", "Marcela", "Camila", "Felipe"]
+APELLIDOS = ["Vargas", "López", "Gómez", "Díaz", "Escobar", "Ibaeta", "Barrera", "González", "Sánchez", "Muñoz"]
+COMUNAS = ["Valparaíso", "Viña del Mar", "Quilpué", "Villa Alemana", "Concón", "Santiago"]
+PESOS_COMUNAS = [0.3, 0.3, 0.15, 0.1, 0.05, 0.1]
+# (nombre, precio base CLP); el último es el interés de los talleres corporativos (B2B)
+INTERESES = [
+    ('Resina', 50000),
+    ('Encuadernación', 40000),
+    ('Timbres y Estampados', 25000),
+    ('Cajas y Regalo', 30000),
+    ('Bienestar Corporativo', 250000),
+]
+PRODUCTOS = ['Kit Resina', 'Kit Encuadernación', 'Goma y Base Timbres', 'Kit Cajas', 'Set Pinceles', 'Papel Premium']
+
+ESTADOS = np.array(['PAGADO', 'ABONADO', 'PENDIENTE', 'ANULADO'])
+# Probabilidades acumuladas de ESTADOS para talleres pasados y futuros
+ACUMULADAS_PASADO = np.cumsum([0.82, 0.06, 0.07, 0.05])
+ACUMULADAS_FUTURO = np.cumsum([0.55, 0.15, 0.25, 0.05])
+
+@contextmanager
+def _fechas_explicitas(*campos):
+    """Desactiva auto_now_add en `campos` para que bulk_create conserve las fechas generadas."""
+    originales = [campo.auto_now_add for campo in campos]
+    for campo in campos:
+        campo.auto_now_add = False
+    try:
+        yield
+    finally:
+        for campo, original in zip(campos, originales):
+            campo.auto_now_add = original
+
+
+def _insertar(modelo, n, lote, construir):
+    """Inserta `n` filas con bulk_create, una transacción por lote.
+
+    `construir(tramo)` recibe un slice de índices y devuelve las instancias de ese lote,
+    así nunca hay más de `lote` objetos en memoria.
+
+    Returns:
+        np.ndarray: ids asignados, en el orden de generación.
+    """
+    ids = []
+    for desde in range(0, n, lote):
+        with transaction.atomic():
+            creados = modelo.objects.bulk_create(list(construir(slice(desde, desde + lote))))
+        ids.append(np.array([obj.pk for obj in creados], dtype=np.int64))
+    return np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+
+
+def _a_datetimes(segundos):
+    return [datetime.datetime.fromtimestamp(s, tz=datetime.timezone.utc) for s in segundos.tolist()]
+
+
+def _a_dates(dias):
+    ordinal_epoch = datetime.date(1970, 1, 1).toordinal()
+    return [datetime.date.fromordinal(ordinal_epoch + d) for d in dias.tolist()]
+
+
+def _pesos(rng, n, dispersion=1.0):
+    pesos = rng.lognormal(0.0, dispersion, n)
+    return pesos / pesos.sum()
+
+
+def limpiar():
+    """Vacía todas las tablas de la app crm y borra los usuarios que no son superusuarios.
+
+    Se usa el mismo SQL que `manage.py flush` (TRUNCATE en PostgreSQL): borrar con el
+    ORM cargaría cada fila y dispararía sus señales, inviable con millones de filas.
+    """
+    tablas = [modelo._meta.db_table for modelo in apps.get_app_config('crm').get_models(include_auto_created=True)]
+    connection.ops.execute_sql_flush(
+        connection.ops.sql_flush(no_style(), tablas, reset_sequences=True, allow_cascade=True)
+    )
+    User.objects.filter(is_superuser=False).delete()
+
+
+def generar(clientes=200, empresas=5, talleres=40, inscripciones_por_cliente=2.0, ventas=100,
+            productos=10, meses=12, usuarios=20, semilla=42, fecha_base=None, lote=LOTE, avisar=None):
+    """Genera el conjunto de datos completo. Supone tablas de negocio vacías (ver `limpiar`).
+
+    Args:
+        fecha_base: date "de hoy" para el conjunto (por defecto la fecha actual);
+            fijarla hace que la salida sea idéntica entre ejecuciones.
+        usuarios: cuántos clientes B2C reciben una cuenta (`usuario_b2c_<i>` / password123).
+        avisar: callable opcional que recibe mensajes de progreso.
+
+    Returns:
+        dict: filas creadas por tabla.
+    """
+    avisar = avisar or (lambda mensaje: None)
+    rng = np.random.default_rng(semilla)
+    fecha_base = fecha_base or timezone.localdate()
+    hoy = int(datetime.datetime.combine(fecha_base, datetime.time(12), tzinfo=datetime.timezone.utc).timestamp())
+    inicio = hoy - int(meses * 30.4 * DIA)
+    if not talleres:
+        inscripciones_por_cliente = 0
+    if not (clientes and productos):
+        ventas = 0
+
+    # ===================== Columnas (vectorizado) =====================
+
+    # Talleres: fechas repartidas en la historia y hasta 60 días hacia adelante
+    n_b2c = len(INTERESES) - 1
+    precios_base = np.array([precio for _, precio in INTERESES])
+    fecha_taller = rng.integers(inicio // DIA, hoy // DIA + 60, talleres)
+    categoria = np.where(rng.random(talleres) < 0.05, n_b2c, rng.integers(0, n_b2c, talleres))
+    precio_taller = np.round(precios_base[categoria] * rng.lognormal(0.0, 0.15, talleres), -3).astype(np.int64)
+    online = rng.random(talleres) < 0.3
+
+    # Clientes: 5% contactos B2B de alguna empresa
+    b2b = (rng.random(clientes) < 0.05) & (empresas > 0)
+    empresa_de = rng.choice(empresas, clientes, p=_pesos(rng, empresas)) if empresas else np.zeros(clientes, dtype=np.int64)
+    nombre = rng.integers(0, len(NOMBRES), clientes)
+    apellido = rng.integers(0, len(APELLIDOS), clientes)
+    comuna = rng.choice(len(COMUNAS), clientes, p=PESOS_COMUNAS)
+    edad = np.clip(rng.normal(38, 10, clientes), 18, 80).astype(np.int64)
+    nacimiento = hoy // DIA - edad * 365 - rng.integers(0, 365, clientes)
+
+    # Inscripciones: pares cliente/taller únicos
+    por_cliente = rng.negative_binomial(1, 1.0 / (1.0 + inscripciones_por_cliente), clientes)
+    ins_cliente = np.repeat(np.arange(clientes), por_cliente)
+    ins_taller = rng.choice(talleres, ins_cliente.size, p=_pesos(rng, talleres)) if talleres else ins_cliente
+    _, unicos = np.unique(ins_cliente * max(talleres, 1) + ins_taller, return_index=True)
+    ins_cliente, ins_taller = ins_cliente[unicos], ins_taller[unicos]
+    n_ins = ins_cliente.size
+    evento = fecha_taller[ins_taller] * DIA + 12 * 3600
+    fecha_ins = np.clip(evento - (rng.exponential(14.0, n_ins) * DIA).astype(np.int64), inicio, hoy)
+
+    acumuladas = np.where((evento < hoy)[:, None], ACUMULADAS_PASADO, ACUMULADAS_FUTURO)
+    codigo = np.minimum((rng.random(n_ins)[:, None] >= acumuladas).sum(axis=1), len(ESTADOS) - 1)
+    estado = ESTADOS[codigo]
+    precio_ins = precio_taller[ins_taller]
+    abono = np.round(precio_ins * rng.uniform(0.3, 0.7, n_ins), -3).astype(np.int64)
+    monto = np.select([estado == 'PAGADO', estado == 'ABONADO'], [precio_ins, abono], 0)
+    saldo = np.where(np.isin(estado, Inscripcion.ESTADOS_SIN_SALDO), 0, np.maximum(precio_ins - monto, 0))
+
+    # Cupos: los totales cubren siempre a los inscritos vigentes
+    ocupados = np.bincount(ins_taller[estado != 'ANULADO'], minlength=talleres)
+    cupos_totales = np.maximum(ocupados, 10) + rng.integers(0, 10, talleres)
+
+    # Registro del cliente: antes de su primera inscripción (o en cualquier momento si no tiene)
+    primera = np.full(clientes, hoy, dtype=np.int64)
+    np.minimum.at(primera, ins_cliente, fecha_ins)
+    registro = np.where(
+        por_cliente > 0,
+        primera - (rng.exponential(30.0, clientes) * DIA).astype(np.int64),
+        rng.integers(inicio, hoy, clientes),
+    )
+
+    # Intereses del cliente: 1-2 al azar (B2B: el corporativo) más las categorías de sus talleres
+    elegidos = rng.integers(0, n_b2c, (clientes, 2))
+    elegidos[:, 1] = np.where(rng.random(clientes) < 0.4, elegidos[:, 1], elegidos[:, 0])
+    elegidos[b2b] = n_b2c
+    pares_interes = np.unique(np.concatenate([
+        np.column_stack([np.repeat(np.arange(clientes), 2), elegidos.ravel()]),
+        np.column_stack([ins_cliente, categoria[ins_taller]]),
+    ]), axis=0)
+
+    # Ventas: 1-3 líneas, compradores y productos con popularidad log-normal
+    precio_producto = np.round(rng.lognormal(np.log(12000), 0.4, productos), -2).astype(np.int64)
+    lineas = np.minimum(1 + rng.poisson(0.6, ventas), max(productos, 1))
+    det_venta = np.repeat(np.arange(ventas), lineas)
+    det_producto = rng.choice(productos, det_venta.size, p=_pesos(rng, productos)) if ventas else det_venta
+    det_cantidad = rng.geometric(0.7, det_venta.size)
+    det_precio = precio_producto[det_producto]
+    monto_venta = np.bincount(det_venta, weights=det_cantidad * det_precio, minlength=ventas).astype(np.int64)
+    vendido = np.bincount(det_producto, weights=det_cantidad, minlength=productos).astype(np.int64)
+    stock_inicial = vendido + rng.integers(20, 200, productos)
+    comprador = rng.choice(clientes, ventas, p=_pesos(rng, clientes, 1.5)) if ventas else np.zeros(0, dtype=np.int64)
+    fecha_venta = np.maximum(rng.integers(inicio, hoy, ventas), registro[comprador])
+
+    # ===================== Escritura por lotes =====================
+    totales = {}
+
+    interes_ids = _insertar(Interes, len(INTERESES), lote, lambda t: (
+        Interes(nombre=n, descripcion=f'Interés principal en {n}.') for n, _ in INTERESES[t]
+    ))
+    totales['intereses'] = len(interes_ids)
+
+    avisar(f'Empresas: {empresas}')
+    empresa_ids = _insertar(Empresa, empresas, lote, lambda t: (
+        Empresa(
+            razon_social=f'Empresa de Prueba #{i + 1} SPA', rut=f'{76000000 + i}-{i % 10}',
+            telefono_empresa=f'+562{20000000 + i}', direccion=f'Calle Ficticia {100 + i % 900}',
+        )
+        for i in range(empresas)[t]
+    ))
+    totales['empresas'] = len(empresa_ids)
+
+    avisar(f'Talleres: {talleres}')
+    taller_ids = _insertar(Taller, talleres, lote, lambda t: (
+        Taller(
+            nombre=f'{INTERESES[c][0]} #{i + 1}', descripcion=f'Taller de {INTERESES[c][0]}.',
+            categoria_id=int(interes_ids[c]), fecha_taller=fecha, precio=precio,
+            modalidad='ONLINE' if en_linea else 'PRESENCIAL', esta_activo=fecha >= fecha_base,
+            cupos_totales=total, cupos_disponibles=total - ocupado,
+        )
+        for i, c, fecha, precio, en_linea, total, ocupado in zip(
+            range(talleres)[t], categoria[t].tolist(), _a_dates(fecha_taller[t]), precio_taller[t].tolist(),
+            online[t].tolist(), cupos_totales[t].tolist(), ocupados[t].tolist(),
+        )
+    ))
+    totales['talleres'] = len(taller_ids)
+
+    avisar(f'Clientes: {clientes}')
+    with _fechas_explicitas(Cliente._meta.get_field('fecha_registro')):
+        cliente_ids = _insertar(Cliente, clientes, lote, lambda t: (
+            Cliente(
+                nombre_completo=f'{NOMBRES[n]} {APELLIDOS[a]}', email=f'cliente{i + 1}@example.test',
+                telefono=f'+569{10000000 + i}', comuna_vive=COMUNAS[c], fecha_registro=registrado,
+                tipo_cliente='B2B' if es_b2b else 'B2C', empresa_id=int(empresa_ids[e]) if es_b2b else None,
+                fecha_nacimiento=None if es_b2b else nacido,
+            )
+            for i, n, a, c, es_b2b, e, nacido, registrado in zip(
+                range(clientes)[t], nombre[t].tolist(), apellido[t].tolist(), comuna[t].tolist(),
+                b2b[t].tolist(), empresa_de[t].tolist(), _a_dates(nacimiento[t]), _a_datetimes(registro[t]),
+            )
+        ))
+    totales['clientes'] = len(cliente_ids)
+
+    m2m = Cliente.intereses_cliente.through
+    totales['intereses_cliente'] = len(_insertar(m2m, len(pares_interes), lote, lambda t: (
+        m2m(cliente_id=int(cliente_ids[c]), interes_id=int(interes_ids[i])) for c, i in pares_interes[t].tolist()
+    )))
+
+    avisar(f'Inscripciones: {n_ins}')
+    with _fechas_explicitas(Inscripcion._meta.get_field('fecha_inscripcion')):
+        totales['inscripciones'] = len(_insertar(Inscripcion, n_ins, lote, lambda t: (
+            Inscripcion(cliente_id=c, taller_id=ta, estado_pago=e, monto_pagado=m, saldo_pendiente=s, fecha_inscripcion=f)
+            for c, ta, e, m, s, f in zip(
+                cliente_ids[ins_cliente[t]].tolist(), taller_ids[ins_taller[t]].tolist(), estado[t].tolist(),
+                monto[t].tolist(), saldo[t].tolist(), _a_datetimes(fecha_ins[t]),
+            )
+        )))
+
+    avisar(f'Productos: {productos}, ventas: {ventas}')
+    producto_ids = _insertar(Producto, productos, lote, lambda t: (
+        Producto(
+            nombre=f'{PRODUCTOS[i % len(PRODUCTOS)]} #{i + 1}', descripcion='Insumos para talleres.',
+            precio_venta=precio, stock_actual=inicial,
+        )
+        for i, precio, inicial in zip(range(productos)[t], precio_producto[t].tolist(), stock_inicial[t].tolist())
+    ))
+    totales['productos'] = len(producto_ids)
+
+    with _fechas_explicitas(VentaProducto._meta.get_field('fecha_venta'), MovimientoStock._meta.get_field('creado_en')):
+        venta_ids = _insertar(VentaProducto, ventas, lote, lambda t: (
+            VentaProducto(cliente_id=c, monto_total=m, estado_pago='PAGADO', fecha_venta=f)
+            for c, m, f in zip(cliente_ids[comprador[t]].tolist(), monto_venta[t].tolist(), _a_datetimes(fecha_venta[t]))
+        ))
+        totales['ventas'] = len(venta_ids)
+        totales['detalles'] = len(_insertar(DetalleVenta, det_venta.size, lote, lambda t: (
+            DetalleVenta(venta_id=v, producto_id=p, cantidad=c, precio_unitario=precio)
+            for v, p, c, precio in zip(
+                venta_ids[det_venta[t]].tolist(), producto_ids[det_producto[t]].tolist(),
+                det_cantidad[t].tolist(), det_precio[t].tolist(),
+            )
+        )))
+        # Cada línea vendida es un movimiento VENTA del libro; al final se consolida el stock
+        _insertar(MovimientoStock, det_venta.size, lote, lambda t: (
+            MovimientoStock(producto_id=p, tipo='VENTA', cantidad=-c, venta_id=v, creado_en=f)
+            for v, p, c, f in zip(
+                venta_ids[det_venta[t]].tolist(), producto_ids[det_producto[t]].tolist(),
+                det_cantidad[t].tolist(), _a_datetimes(fecha_venta[det_venta[t]]),
+            )
+        ))
+    stock.consolidar()
+
+    # Cuentas de usuario para los primeros clientes B2C (un solo hash compartido)
+    con_cuenta = np.flatnonzero(~b2b)[:usuarios]
+    clave = make_password('password123') if con_cuenta.size else None
+    usuario_ids = _insertar(User, con_cuenta.size, lote, lambda t: (
+        User(username=f'usuario_b2c_{n + 1}', email=f'cliente{i + 1}@example.test', password=clave)
+        for n, i in zip(range(con_cuenta.size)[t], con_cuenta[t].tolist())
+    ))
+    with transaction.atomic():
+        Cliente.objects.bulk_update(
+            [Cliente(pk=c, usuario_id=u) for c, u in zip(cliente_ids[con_cuenta].tolist(), usuario_ids.tolist())],
+            ['usuario'], batch_size=lote,
+        )
+    totales['usuarios'] = len(usuario_ids)
+
+    # bulk_create no dispara señales: reconstruir índices y cachés derivados
+    avisar('Reconstruyendo índices y cachés...')
+    with transaction.atomic():
+        # En autocommit cada INSERT del executemany sería su propia transacción
+        indexar_clientes()
+    invalidar_caches()
+    return totales
+
+
+def invalidar_caches():
+    """Invalida los cachés derivados de toda la base (tras cargas masivas o restauraciones)."""
+    segmentos.invalidar_indice()
+    invalidar_conteos()
+    cache_catalogo.invalidar(
+        'talleres', 'productos', 'categorias',
+        *[f'taller:{pk}' for pk in Taller.objects.values_list('pk', flat=True).iterator()],
+        *[f'producto:{pk}' for pk in Producto.objects.values_list('pk', flat=True).iterator()],
+    )
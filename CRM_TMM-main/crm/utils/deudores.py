@@ -0,0 +1,204 @@
+import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Greatest, Least, Now
+from django.utils import timezone
+from ..models import Inscripcion, Taller
+from .cache_catalogo import invalidar_talleres
+from .cupos import publicar_desde_bd
+from .segmentos import cambios_registrados
+from .segmentos_guardados import registrar_cambio
+
+
+COUNT_CACHE_TIMEOUT = 60 * 5  # 5 minutos
+_VERSION_KEY = 'crm:deudores:conteos:version'
+
+# Filtros de la vista gestion_deudores -> estados de pago incluidos (None = todos)
+FILTROS_ESTADO = {
+    None: None,
+    'DEUDA': ['PENDIENTE'],
+    'ABONADO': ['ABONADO'],
+    'PAGADO': ['PAGADO'],
+}
+
+# Ordenamientos disponibles en gestion_deudores (todos cubiertos por un índice)
+ORDENES = {
+    None: ('-fecha_inscripcion', '-id'),
+    'saldo': ('-saldo_pendiente', 'fecha_inscripcion', 'id'),
+}
+
+# Tramos del reporte de antigüedad de deuda: (clave, etiqueta, días máximos)
+TRAMOS_ANTIGUEDAD = [
+    ('0-30', '0–30 días', 30),
+    ('31-60', '31–60 días', 60),
+    ('61-90', '61–90 días', 90),
+    ('90+', 'Más de 90 días', None),
+]
+
+# Estados que se pueden asignar en lote desde gestion_deudores, detalle_taller_admin y el admin
+ESTADOS_MASIVOS = ['PAGADO', 'ABONADO', 'ANULADO']
+
+
+def inscripciones_por_filtro(filtro_estado, orden=None):
+    """QuerySet base (sin evaluar) de gestion_deudores para un filtro de estado."""
+    qs = Inscripcion.objects.order_by(*ORDENES.get(orden, ORDENES[None]))
+    estados = FILTROS_ESTADO.get(filtro_estado)
+    if estados:
+        qs = qs.filter(estado_pago__in=estados)
+    return qs
+
+
+def _version():
+    version = cache.get(_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(_VERSION_KEY, version, None)
+    return version
+
+
+def invalidar_conteos():
+    """Invalida todos los conteos cacheados (se llama al guardar/borrar inscripciones)."""
+    try:
+        cache.incr(_VERSION_KEY)
+    except ValueError:
+        cache.set(_VERSION_KEY, 1, None)
+
+
+def contar_inscripciones(filtro_estado):
+    """COUNT(*) del filtro servido desde caché; se recalcula al cambiar alguna inscripción."""
+    if filtro_estado not in FILTROS_ESTADO:
+        filtro_estado = None
+    key = f'crm:deudores:conteo:{_version()}:{filtro_estado or "TODOS"}'
+    total = cache.get(key)
+    if total is None:
+        total = inscripciones_por_filtro(filtro_estado).count()
+        cache.set(key, total, COUNT_CACHE_TIMEOUT)
+    return total
+
+
+def ventana_paginas(indice, num_paginas, per_page, total, radio=3):
+    """Índice de páginas acotado: primera, última y `radio` páginas alrededor de la actual.
+
+    Los saltos se representan con None (la plantilla muestra "…").
+    """
+    visibles = {1, num_paginas} | set(range(max(1, indice - radio), min(num_paginas, indice + radio) + 1))
+    paginas = []
+    anterior = 0
+    for i in sorted(visibles):
+        if i - anterior > 1:
+            paginas.append(None)
+        s = (i - 1) * per_page + 1
+        e = min(i * per_page, total)
+        paginas.append({'indice': i, 'range': f'{s}-{e}', 'count': e - s + 1 if total > 0 else 0})
+        anterior = i
+    return paginas
+
+
+def reporte_antiguedad(ahora=None):
+    """Deuda vigente agrupada por antigüedad de la inscripción, en una sola consulta.
+
+    Returns:
+        dict: {'tramos': [{'clave', 'etiqueta', 'cantidad', 'saldo'}, ...],
+               'total_saldo', 'total_cantidad'}
+    """
+    ahora = ahora or timezone.now()
+    casos = [
+        When(fecha_inscripcion__gte=ahora - datetime.timedelta(days=dias), then=Value(clave))
+        for clave, _, dias in TRAMOS_ANTIGUEDAD if dias is not None
+    ]
+    filas = (
+        Inscripcion.objects.filter(saldo_pendiente__gt=0)
+        .annotate(tramo=Case(*casos, default=Value(TRAMOS_ANTIGUEDAD[-1][0]), output_field=CharField()))
+        .values('tramo')
+        .annotate(cantidad=Count('id'), saldo=Sum('saldo_pendiente'))
+        .order_by()
+    )
+    por_tramo = {f['tramo']: f for f in filas}
+
+    tramos = []
+    for clave, etiqueta, _ in TRAMOS_ANTIGUEDAD:
+        fila = por_tramo.get(clave, {})
+        tramos.append({
+            'clave': clave,
+            'etiqueta': etiqueta,
+            'cantidad': fila.get('cantidad', 0),
+            'saldo': fila.get('saldo') or 0,
+        })
+    return {
+        'tramos': tramos,
+        'total_saldo': sum(t['saldo'] for t in tramos),
+        'total_cantidad': sum(t['cantidad'] for t in tramos),
+    }
+
+
+def filas_exportacion(filtro_estado, orden=None, chunk_size=2000):
+    """Genera las filas CSV de gestion_deudores leyendo la BD por bloques."""
+    yield ['ID', 'Cliente', 'Email', 'Taller', 'Precio', 'Monto Pagado', 'Saldo Pendiente', 'Estado', 'Fecha Inscripción']
+    filas = (
+        inscripciones_por_filtro(filtro_estado, orden)
+        .values_list(
+            'id', 'cliente__nombre_completo', 'cliente__email', 'taller__nombre', 'taller__precio',
+            'monto_pagado', 'saldo_pendiente', 'estado_pago', 'fecha_inscripcion',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    for *valores, fecha in filas:
+        yield valores + [timezone.localtime(fecha).strftime('%Y-%m-%d %H:%M')]
+
+
+def cambiar_estado_masivo(ids, nuevo_estado, monto=None, taller_id=None):
+    """Cambia el estado de pago de varias inscripciones con un único UPDATE.
+
+    - PAGADO: monto_pagado = precio del taller, saldo 0.
+    - ABONADO: monto_pagado = `monto` (total abonado), saldo = precio - monto. Se
+      rechaza si `monto` supera el precio de alguno de los talleres.
+    - ANULADO: saldo 0 y devuelve los cupos con un UPDATE agrupado por taller.
+
+    Las inscripciones ya anuladas se ignoran (su cupo ya fue devuelto). Todo
+    ocurre en una transacción y los conteos cacheados se invalidan al confirmar.
+
+    Returns:
+        int: cantidad de inscripciones actualizadas.
+    """
+    if nuevo_estado not in ESTADOS_MASIVOS:
+        raise ValueError(f'Estado no permitido: {nuevo_estado}')
+    if nuevo_estado == 'ABONADO' and (monto is None or monto <= 0):
+        raise ValueError('Debes indicar un monto abonado mayor a cero.')
+
+    precio = Subquery(Taller.objects.filter(pk=OuterRef('taller_id')).values('precio')[:1])
+    with transaction.atomic():
+        qs = Inscripcion.objects.filter(id__in=ids).exclude(estado_pago='ANULADO')
+        if taller_id is not None:
+            qs = qs.filter(taller_id=taller_id)
+        # Bloquear las filas afectadas antes de contar/actualizar
+        bloqueadas = list(qs.select_for_update().values_list('id', flat=True))
+        if not bloqueadas:
+            return 0
+        qs = Inscripcion.objects.filter(id__in=bloqueadas)
+        if nuevo_estado == 'ABONADO' and qs.filter(taller__precio__lt=monto).exists():
+            raise ValueError('El monto abonado no puede superar el precio del taller.')
+
+        if nuevo_estado == 'PAGADO':
+            actualizadas = qs.update(estado_pago='PAGADO', monto_pagado=precio, saldo_pendiente=0)
+        elif nuevo_estado == 'ABONADO':
+            actualizadas = qs.update(
+                estado_pago='ABONADO', monto_pagado=monto, saldo_pendiente=Greatest(precio - monto, 0)
+            )
+        else:
+            cupos_por_taller = list(qs.values('taller_id').annotate(n=Count('id')).order_by('taller_id'))
+            actualizadas = qs.update(estado_pago='ANULADO', saldo_pendiente=0)
+            for fila in cupos_por_taller:
+                Taller.objects.filter(pk=fila['taller_id']).update(
+                    cupos_disponibles=Least(F('cupos_disponibles') + fila['n'], F('cupos_totales')),
+                    updated_at=Now(),
+                )
+            invalidar_talleres([fila['taller_id'] for fila in cupos_por_taller])
+            publicar_desde_bd([fila['taller_id'] for fila in cupos_por_taller])
+
+        # update() no dispara señales: registrar los clientes e invalidar conteos e índice explícitamente
+        registrar_cambio(qs.values_list('cliente_id', flat=True).distinct())
+        transaction.on_commit(invalidar_conteos)
+        transaction.on_commit(cambios_registrados)
+    return actualizadas
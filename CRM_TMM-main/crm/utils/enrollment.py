@@ -2,9 +2,10 @@ from django.db import transaction, IntegrityError
 from django.db.models import F
 from django.shortcuts import get_object_or_404
 from ..models import Cliente, Inscripcion, Taller
+from .clientes import cliente_de_usuario
 
 
-def enroll_cliente_en_taller(taller_id, nombre, email, telefono=None, usuario=None):
+def enroll_cliente_en_taller(taller_id, nombre, email, telefono=None, usuario=None, cliente=None):
     """Crear una inscripción para un cliente (posible invitado) en un taller.
 
     Args:
@@ -12,6 +13,9 @@ def enroll_cliente_en_taller(taller_id, nombre, email, telefono=None, usuario=No
         nombre (str): nombre del cliente.
         email (str): email del cliente.
         usuario (django.contrib.auth.models.User|None): usuario autenticado opcional.
+        cliente (Cliente|None): cliente ya resuelto del usuario (request.cliente); si
+            no se indica se vincula el cliente invitado con el email del usuario o se
+            crea uno nuevo; un email que ya pertenece a otra cuenta se rechaza.
 
     Returns:
         tuple: (inscripcion, created_flag, message)
@@ -45,10 +49,27 @@ def enroll_cliente_en_taller(taller_id, nombre, email, telefono=None, usuario=No
                 return (None, False, 'No hay cupos disponibles')
 
             # 3. Obtener o crear cliente
-            cliente, created_cliente = Cliente.objects.get_or_create(
-                email=cliente_email,
-                defaults={'nombre_completo': cliente_nombre, 'telefono': cliente_telefono}
-            )
+            if cliente is None and usuario and getattr(usuario, 'is_authenticated', False):
+                # Igual que en el checkout: vincular un cliente invitado con su email, pero
+                # nunca inscribir con el cliente que ya pertenece a otra cuenta.
+                cliente = cliente_de_usuario(usuario, recordar_ausencia=False)
+                if cliente is None:
+                    if not cliente_email or Cliente.objects.filter(email=cliente_email).exists():
+                        return (None, False, 'El email de tu cuenta falta o ya pertenece a otro cliente')
+                    cliente = Cliente.objects.create(
+                        email=cliente_email, nombre_completo=cliente_nombre,
+                        telefono=cliente_telefono, usuario=usuario,
+                    )
+                    created_cliente = True
+                else:
+                    created_cliente = False
+            elif cliente is not None:
+                created_cliente = False
+            else:
+                cliente, created_cliente = Cliente.objects.get_or_create(
+                    email=cliente_email,
+                    defaults={'nombre_completo': cliente_nombre, 'telefono': cliente_telefono},
+                )
             # Si el cliente existe pero se pasó un teléfono nuevo, actualizarlo
             if not created_cliente and cliente_telefono:
                 if not cliente.telefono or cliente.telefono != cliente_telefono:
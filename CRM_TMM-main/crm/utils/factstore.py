@@ -0,0 +1,332 @@
+"""Snapshot columnar de hechos (inscripciones y ventas) para análisis ad-hoc.
+
+El comando `snapshot_hechos` exporta Inscripcion, VentaProducto y DetalleVenta
+a archivos `.npy` (una columna por archivo) dentro de un directorio versionado.
+`FactStore` los abre con `mmap_mode='r'` (sin copiar a memoria) y permite
+filtrar y agrupar de forma vectorizada sin consultar la base de datos OLTP.
+
+Convenciones de columnas:
+  - ids: int64
+  - fechas: días desde 1970-01-01 en la zona horaria del proyecto (int32)
+  - montos: CLP enteros (int64)
+  - categorías de texto: códigos uint8 + diccionario en meta.json
+"""
+import datetime
+import json
+import os
+import shutil
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from ..models import Inscripcion, VentaProducto, DetalleVenta, Taller, Interes
+
+
+SNAPSHOT_CHUNK_SIZE = 50000
+CURRENT_FILE = 'CURRENT'
+META_FILE = 'meta.json'
+EPOCH = datetime.date(1970, 1, 1)
+
+# Columnas de texto codificadas con diccionario (el orden define el código)
+DICCIONARIOS = {
+    'estado_pago': [c for c, _ in Inscripcion.ESTADO_PAGO_CHOICES],
+    'estado_venta': [c for c, _ in VentaProducto.ESTADO_PAGO_CHOICES],
+    'modalidad': [c for c, _ in Taller.MODALIDAD_CHOICES],
+}
+
+# tabla -> (queryset, [(columna, campo ORM, dtype, tipo)])
+# tipo: 'num' (tal cual), 'fecha' (datetime -> días epoch), o nombre de diccionario
+TABLAS = {
+    'inscripciones': (
+        lambda: Inscripcion.objects.order_by(),
+        [
+            ('id', 'id', np.int64, 'num'),
+            ('cliente_id', 'cliente_id', np.int64, 'num'),
+            ('taller_id', 'taller_id', np.int64, 'num'),
+            ('categoria_id', 'taller__categoria_id', np.int64, 'num'),
+            ('modalidad', 'taller__modalidad', np.uint8, 'modalidad'),
+            ('fecha', 'fecha_inscripcion', np.int32, 'fecha'),
+            ('monto', 'monto_pagado', np.int64, 'num'),
+            ('estado_pago', 'estado_pago', np.uint8, 'estado_pago'),
+        ],
+    ),
+    'ventas': (
+        lambda: VentaProducto.objects.order_by(),
+        [
+            ('id', 'id', np.int64, 'num'),
+            ('cliente_id', 'cliente_id', np.int64, 'num'),
+            ('fecha', 'fecha_venta', np.int32, 'fecha'),
+            ('monto', 'monto_total', np.int64, 'num'),
+            ('estado_pago', 'estado_pago', np.uint8, 'estado_venta'),
+        ],
+    ),
+    'detalles': (
+        lambda: DetalleVenta.objects.order_by(),
+        [
+            ('id', 'id', np.int64, 'num'),
+            ('venta_id', 'venta_id', np.int64, 'num'),
+            ('producto_id', 'producto_id', np.int64, 'num'),
+            ('cliente_id', 'venta__cliente_id', np.int64, 'num'),
+            ('fecha', 'venta__fecha_venta', np.int32, 'fecha'),
+            ('cantidad', 'cantidad', np.int64, 'num'),
+            ('precio_unitario', 'precio_unitario', np.int64, 'num'),
+            ('estado_pago', 'venta__estado_pago', np.uint8, 'estado_venta'),
+        ],
+    ),
+}
+
+
+def get_factstore_dir():
+    return str(getattr(settings, 'FACTSTORE_DIR', os.path.join(settings.BASE_DIR, 'factstore')))
+
+
+def _convertidor(tipo):
+    if tipo == 'num':
+        return lambda v: 0 if v is None else int(v)
+    if tipo == 'fecha':
+        return lambda v: (timezone.localtime(v).date() - EPOCH).days
+    codigos = {valor: i for i, valor in enumerate(DICCIONARIOS[tipo])}
+    return lambda v: codigos.get(v, 255)
+
+
+def _exportar_tabla(directorio, queryset, columnas, chunk_size):
+    """Escribe una tabla como un .npy por columna, leyendo la BD en un único stream."""
+    campos = [campo for _, campo, _, _ in columnas]
+    convertidores = [_convertidor(tipo) for _, _, _, tipo in columnas]
+    total = queryset.count()
+    arreglos = [np.empty(total, dtype=dtype) for _, _, dtype, _ in columnas]
+
+    n = 0
+    for fila in queryset.values_list(*campos).iterator(chunk_size=chunk_size):
+        if n >= total:
+            # Filas insertadas durante la exportación: quedan para el siguiente snapshot
+            break
+        for arr, conv, valor in zip(arreglos, convertidores, fila):
+            arr[n] = conv(valor)
+        n += 1
+
+    for (nombre, _, _, _), arr in zip(columnas, arreglos):
+        np.save(os.path.join(directorio, f'{nombre}.npy'), arr[:n])
+    return n
+
+
+def create_snapshot(base_dir=None, chunk_size=SNAPSHOT_CHUNK_SIZE, conservar=2):
+    """Exporta un snapshot nuevo y lo marca como vigente de forma atómica.
+
+    Returns:
+        tuple: (ruta del snapshot, dict con filas por tabla)
+    """
+    base_dir = base_dir or get_factstore_dir()
+    os.makedirs(base_dir, exist_ok=True)
+    creado = timezone.now()
+    nombre = creado.strftime('snap-%Y%m%dT%H%M%S%f')
+    destino = os.path.join(base_dir, nombre)
+    temporal = destino + '.tmp'
+    os.makedirs(temporal)
+
+    filas = {}
+    for tabla, (queryset, columnas) in TABLAS.items():
+        os.makedirs(os.path.join(temporal, tabla))
+        filas[tabla] = _exportar_tabla(os.path.join(temporal, tabla), queryset(), columnas, chunk_size)
+
+    meta = {
+        'creado': creado.isoformat(),
+        'filas': filas,
+        'diccionarios': DICCIONARIOS,
+        'categorias': {str(i): n for i, n in Interes.objects.values_list('id', 'nombre')},
+    }
+    with open(os.path.join(temporal, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(temporal, destino)
+
+    # Publicar el snapshot: reemplazo atómico del puntero CURRENT
+    puntero_tmp = os.path.join(base_dir, CURRENT_FILE + '.tmp')
+    with open(puntero_tmp, 'w', encoding='utf-8') as f:
+        f.write(nombre)
+    os.replace(puntero_tmp, os.path.join(base_dir, CURRENT_FILE))
+
+    # Limpiar snapshots antiguos (los lectores con mmap abierto siguen funcionando en POSIX)
+    antiguos = sorted(d for d in os.listdir(base_dir) if d.startswith('snap-') and not d.endswith('.tmp'))
+    for viejo in antiguos[:-conservar] if conservar else []:
+        shutil.rmtree(os.path.join(base_dir, viejo), ignore_errors=True)
+    return destino, filas
+
+
+def to_epoch_days(fecha):
+    return (fecha - EPOCH).days
+
+
+def epoch_days_to_months(dias):
+    """Convierte días epoch a meses absolutos (anio * 12 + mes - 1)."""
+    meses_1970 = np.asarray(dias).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return meses_1970 + 1970 * 12
+
+
+def date_from_month(mes_abs):
+    anio, mes = divmod(int(mes_abs), 12)
+    return datetime.date(anio, mes + 1, 1)
+
+
+class FactTable:
+    """Tabla columnar abierta en modo memory-map (lectura, copia cero)."""
+
+    def __init__(self, directorio, diccionarios, columnas):
+        self.directorio = directorio
+        self._diccionarios = diccionarios
+        self._tipos = {nombre: tipo for nombre, _, _, tipo in columnas}
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.column('id'))
+
+    def column(self, nombre):
+        if nombre not in self._cache:
+            self._cache[nombre] = np.load(os.path.join(self.directorio, f'{nombre}.npy'), mmap_mode='r')
+        return self._cache[nombre]
+
+    def encode(self, nombre, valores):
+        """Traduce valores de texto a los códigos del diccionario de la columna."""
+        dicc = self._diccionarios[self._tipos[nombre]]
+        return [dicc.index(v) for v in valores if v in dicc]
+
+    def decode(self, nombre, codigos):
+        dicc = self._diccionarios[self._tipos[nombre]]
+        return [dicc[int(c)] for c in codigos]
+
+    def mask(self, **filtros):
+        """Máscara booleana a partir de filtros estilo ORM.
+
+        Soporta `col=valor`, `col__in=[...]`, `col__gte`, `col__gt`, `col__lte`, `col__lt`.
+        Las columnas con diccionario aceptan los valores de texto; las fechas
+        aceptan objetos `date`.
+        """
+        resultado = np.ones(len(self), dtype=bool)
+        for clave, valor in filtros.items():
+            nombre, _, op = clave.partition('__')
+            col = self.column(nombre)
+            tipo = self._tipos[nombre]
+            if tipo == 'fecha' and isinstance(valor, datetime.date):
+                valor = to_epoch_days(valor)
+            elif tipo not in ('num', 'fecha'):
+                valor = self.encode(nombre, valor if op == 'in' else [valor])
+                if op != 'in':
+                    valor = valor[0] if valor else -1
+            if op == 'in':
+                resultado &= np.isin(col, np.asarray(valor))
+            elif op == 'gte':
+                resultado &= col >= valor
+            elif op == 'gt':
+                resultado &= col > valor
+            elif op == 'lte':
+                resultado &= col <= valor
+            elif op == 'lt':
+                resultado &= col < valor
+            elif op == '':
+                resultado &= col == valor
+            else:
+                raise ValueError(f'Operador de filtro no soportado: {op}')
+        return resultado
+
+    def group_by(self, por, valor=None, mask=None):
+        """Agrupa por una columna (o un arreglo ya calculado) y suma `valor` (o cuenta filas).
+
+        Returns:
+            tuple: (claves únicas, totales) como arreglos NumPy.
+        """
+        claves = self.column(por) if isinstance(por, str) else np.asarray(por)
+        pesos = self.column(valor) if isinstance(valor, str) else valor
+        if mask is not None:
+            claves = claves[mask]
+            pesos = pesos[mask] if pesos is not None else None
+        unicas, inversa = np.unique(claves, return_inverse=True)
+        if pesos is None:
+            totales = np.bincount(inversa, minlength=len(unicas))
+        else:
+            totales = np.bincount(inversa, weights=pesos, minlength=len(unicas))
+        return unicas, totales
+
+
+class FactStore:
+    """Punto de entrada de lectura: abre el snapshot vigente (o uno específico)."""
+
+    def __init__(self, base_dir=None, snapshot=None):
+        base_dir = base_dir or get_factstore_dir()
+        if snapshot is None:
+            with open(os.path.join(base_dir, CURRENT_FILE), encoding='utf-8') as f:
+                snapshot = f.read().strip()
+        self.directorio = os.path.join(base_dir, snapshot)
+        with open(os.path.join(self.directorio, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self._tablas = {}
+
+    @classmethod
+    def open_current(cls, base_dir=None):
+        """Devuelve el FactStore vigente o None si aún no hay snapshot."""
+        try:
+            return cls(base_dir=base_dir)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @property
+    def creado(self):
+        return datetime.datetime.fromisoformat(self.meta['creado'])
+
+    def categoria_nombre(self, categoria_id):
+        return self.meta['categorias'].get(str(int(categoria_id)))
+
+    def table(self, nombre):
+        if nombre not in self._tablas:
+            self._tablas[nombre] = FactTable(
+                os.path.join(self.directorio, nombre),
+                self.meta['diccionarios'],
+                TABLAS[nombre][1],
+            )
+        return self._tablas[nombre]
+
+
+def resumen_ingresos(store):
+    """Series de ingresos de panel_reportes calculadas desde el snapshot.
+
+    Devuelve las mismas claves de contexto que la versión ORM de la vista
+    (ingresos mensuales y desgloses por categoría/modalidad).
+    """
+    ins = store.table('inscripciones')
+    pagadas = ins.mask(estado_pago__in=['PAGADO', 'ABONADO'])
+
+    meses_abs = epoch_days_to_months(ins.column('fecha'))
+    totales_mes = {}
+    if len(ins):
+        meses, montos = ins.group_by(meses_abs, 'monto', mask=pagadas)
+        totales_mes = {int(m): float(t) for m, t in zip(meses, montos)}
+        rango = (int(meses_abs.min()), int(meses_abs.max()))
+    else:
+        hoy = timezone.localdate()
+        rango = (hoy.year * 12 + hoy.month - 1,) * 2
+
+    meses_serie = [date_from_month(m) for m in range(rango[0], rango[1] + 1)]
+
+    cat_ids, conteos = ins.group_by('categoria_id', mask=pagadas)
+    orden_conteo = np.argsort(-conteos, kind='stable')
+    cat_ids_m, montos_cat = ins.group_by('categoria_id', 'monto', mask=pagadas)
+    orden_monto = np.argsort(-montos_cat, kind='stable')
+    mod_codes, conteos_mod = ins.group_by('modalidad', mask=pagadas)
+    orden_mod = np.argsort(-conteos_mod, kind='stable')
+
+    def _cat(cid):
+        return int(cid) or None
+
+    return {
+        'ingresos_totales': int(ins.column('monto')[pagadas].sum()),
+        'ingresos_labels': [m.strftime('%b %Y') for m in meses_serie],
+        'ingresos_data': [totales_mes.get(m.year * 12 + m.month - 1, 0.0) for m in meses_serie],
+        'ingresos_meta': [{'mes': m.month, 'anio': m.year} for m in meses_serie],
+        'categoria_labels': [store.categoria_nombre(cat_ids[i]) or 'Sin Categoría' for i in orden_conteo],
+        'categoria_data': [int(conteos[i]) for i in orden_conteo],
+        'categoria_ids': [_cat(cat_ids[i]) for i in orden_conteo],
+        'modalidad_labels': ins.decode('modalidad', mod_codes[orden_mod]),
+        'modalidad_data': [int(conteos_mod[i]) for i in orden_mod],
+        'modalidad_keys': ins.decode('modalidad', mod_codes[orden_mod]),
+        'ingresos_categoria_labels': [store.categoria_nombre(cat_ids_m[i]) or 'Sin Categoría' for i in orden_monto],
+        'ingresos_categoria_data': [float(montos_cat[i]) for i in orden_monto],
+        'ingresos_categoria_ids': [_cat(cat_ids_m[i]) for i in orden_monto],
+    }
@@ -0,0 +1,132 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+# Anchos por variante (1x y 2x para pantallas de alta densidad)
+VARIANTES = {
+    'miniatura': [160, 320],
+    'tarjeta': [300, 600],
+    'detalle': [800, 1200, 1600],
+}
+# (extensión, formato Pillow, opciones de guardado)
+FORMATOS = [
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+]
+DIRECTORIO = 'derivados'
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='crm-imagenes')
+
+
+def _huella(contenido):
+    return hashlib.sha256(contenido).hexdigest()[:16]
+
+
+def generar_variantes(nombre_imagen, carpeta):
+    """Genera los derivados de una imagen del storage.
+
+    Los archivos se nombran por hash del contenido original, así que volver a
+    procesar la misma imagen no escribe nada nuevo y dos objetos con la misma
+    foto comparten derivados.
+
+    Returns:
+        dict: {'origen': nombre, 'hash': ..., 'variantes': {variante: {ext: [[ancho, nombre], ...]}}}
+    """
+    with default_storage.open(nombre_imagen, 'rb') as archivo:
+        contenido = archivo.read()
+    huella = _huella(contenido)
+    original = ImageOps.exif_transpose(Image.open(io.BytesIO(contenido)))
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+
+    variantes = {}
+    for variante, anchos in VARIANTES.items():
+        # Nunca se amplía: anchos mayores al original se reemplazan por el ancho original
+        anchos_validos = sorted({min(ancho, original.width) for ancho in anchos})
+        por_formato = {}
+        for ext, formato, opciones in FORMATOS:
+            generados = []
+            for ancho in anchos_validos:
+                nombre = f'{DIRECTORIO}/{carpeta}/{huella}_{variante}_{ancho}.{ext}'
+                if not default_storage.exists(nombre):
+                    alto = max(1, round(original.height * ancho / original.width))
+                    imagen = original.resize((ancho, alto), Image.LANCZOS)
+                    if formato == 'JPEG' and imagen.mode != 'RGB':
+                        imagen = imagen.convert('RGB')
+                    buffer = io.BytesIO()
+                    imagen.save(buffer, formato, **opciones)
+                    nombre = default_storage.save(nombre, ContentFile(buffer.getvalue()))
+                generados.append([ancho, nombre])
+            por_formato[ext] = generados
+        variantes[variante] = por_formato
+    return {'origen': nombre_imagen, 'hash': huella, 'variantes': variantes}
+
+
+def procesar(modelo, pk):
+    """Genera y guarda los derivados del objeto `modelo` con id `pk` (si siguen pendientes)."""
+    obj = modelo.objects.filter(pk=pk).only('imagen', 'imagen_variantes').first()
+    if obj is None:
+        return None
+    if not pendiente(obj):
+        return obj.imagen_variantes
+    datos = generar_variantes(obj.imagen.name, modelo._meta.model_name) if obj.imagen else {}
+    # update(): no vuelve a disparar las señales de guardado; la invalidación es explícita.
+    # Si la imagen cambió mientras se procesaba, el trabajo encolado para la nueva la reemplaza.
+    actual = modelo.objects.filter(pk=pk)
+    if obj.imagen:
+        actual = actual.filter(imagen=obj.imagen.name)
+    actual.update(imagen_variantes=datos, updated_at=timezone.now())
+    _invalidar_catalogo(modelo, pk)
+    return datos
+
+
+def _invalidar_catalogo(modelo, pk):
+    from .cache_catalogo import invalidar_productos, invalidar_talleres
+    if modelo._meta.model_name == 'taller':
+        invalidar_talleres([pk])
+    else:
+        invalidar_productos([pk])
+
+
+def _procesar_en_hilo(modelo, pk):
+    try:
+        procesar(modelo, pk)
+    except Exception:
+        logger.exception('No se pudieron generar los derivados de %s %s', modelo.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def pendiente(obj):
+    """True si la imagen actual aún no tiene derivados (o se quitó y quedan derivados)."""
+    origen = (obj.imagen_variantes or {}).get('origen')
+    return (obj.imagen.name or None) != origen
+
+
+def encolar(obj):
+    """Programa la generación de derivados tras el commit (en segundo plano salvo configuración)."""
+    modelo, pk = type(obj), obj.pk
+    if getattr(settings, 'IMAGENES_DERIVADOS_ASINCRONO', True):
+        transaction.on_commit(lambda: _executor.submit(_procesar_en_hilo, modelo, pk))
+    else:
+        transaction.on_commit(lambda: procesar(modelo, pk))
+
+
+def srcset(obj, variante, ext):
+    """'url 300w, url 600w' para una variante y formato, o '' si aún no hay derivados."""
+    if not obj.imagen or pendiente(obj):
+        return ''
+    datos = obj.imagen_variantes
+    archivos = datos.get('variantes', {}).get(variante, {}).get(ext, [])
+    return ', '.join(f'{default_storage.url(nombre)} {ancho}w' for ancho, nombre in archivos)
@@ -0,0 +1,131 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, When
+from django.db.models.functions import Now
+from django.utils import timezone
+
+from ..models import Producto, ReservaStock
+from . import stock
+from .cache_catalogo import invalidar_stock
+
+
+# Orden de bloqueo en todo el módulo (y en utils/checkout.py): primero las filas de
+# Producto (por id), después las ReservaStock. Así reservar, comprar y liberar
+# nunca se bloquean mutuamente en orden inverso.
+
+LOTE_LIBERACION = 1000
+
+
+class StockNoDisponible(ValueError):
+    """No quedan unidades sin reservar para cubrir la cantidad pedida."""
+
+    def __init__(self, producto, disponibles):
+        self.disponibles = disponibles
+        super().__init__(f'¡Stock insuficiente! Solo quedan {disponibles} unidades de "{producto}".')
+
+
+def duracion():
+    return timedelta(minutes=getattr(settings, 'RESERVA_CARRITO_MINUTOS', 15))
+
+
+def ajustar(producto_id, cantidad, reserva_id=None):
+    """Deja la reserva de un carrito en `cantidad` unidades del producto y renueva su vencimiento.
+
+    Si la reserva anterior ya se liberó (venció), se vuelven a reservar todas las
+    unidades. Con `cantidad` 0 la reserva se elimina.
+
+    Raises:
+        StockNoDisponible: no hay unidades libres suficientes (no se modifica nada).
+
+    Returns:
+        int | None: id de la reserva vigente (None si `cantidad` es 0).
+    """
+    with transaction.atomic():
+        producto = (
+            Producto.objects.select_for_update().filter(pk=producto_id)
+            .values('nombre', 'stock_actual', 'stock_reservado').first()
+        )
+        if producto is None:
+            raise Producto.DoesNotExist(producto_id)
+        reserva = ReservaStock.objects.filter(pk=reserva_id, producto_id=producto_id).first() if reserva_id else None
+        retenidas = reserva.cantidad if reserva else 0
+        delta = cantidad - retenidas
+        vigente = producto['stock_actual'] + stock.movidos([producto_id]).get(producto_id, 0)
+        libres = vigente - producto['stock_reservado']
+        if delta > libres:
+            raise StockNoDisponible(producto['nombre'], max(libres + retenidas, 0))
+
+        if delta:
+            Producto.objects.filter(pk=producto_id).update(
+                stock_reservado=F('stock_reservado') + delta, updated_at=Now()
+            )
+            invalidar_stock()
+        if cantidad == 0:
+            if reserva:
+                reserva.delete()
+            return None
+        expira_en = timezone.now() + duracion()
+        if reserva:
+            ReservaStock.objects.filter(pk=reserva.pk).update(cantidad=cantidad, expira_en=expira_en)
+            return reserva.pk
+        return ReservaStock.objects.create(producto_id=producto_id, cantidad=cantidad, expira_en=expira_en).pk
+
+
+def _liberar(**filtros):
+    """Libera las reservas que cumplan `filtros` con un número fijo de consultas.
+
+    Los filtros se vuelven a evaluar después de bloquear los productos, de modo que
+    una reserva renovada o comprada mientras tanto no se libera dos veces.
+    """
+    with transaction.atomic():
+        producto_ids = set(ReservaStock.objects.filter(**filtros).values_list('producto_id', flat=True))
+        if not producto_ids:
+            return 0
+        list(Producto.objects.select_for_update().filter(pk__in=producto_ids).order_by('pk').values_list('pk'))
+        totales = dict(
+            ReservaStock.objects.filter(**filtros).order_by()
+            .values('producto_id').annotate(total=Sum('cantidad')).values_list('producto_id', 'total')
+        )
+        if not totales:
+            return 0
+        Producto.objects.filter(pk__in=totales).update(
+            stock_reservado=Case(
+                *[When(pk=pk, then=F('stock_reservado') - total) for pk, total in totales.items()],
+                output_field=IntegerField(),
+            ),
+            updated_at=Now(),
+        )
+        borradas, _ = ReservaStock.objects.filter(**filtros).delete()
+        invalidar_stock()
+    return borradas
+
+
+def liberar(reserva_ids):
+    """Libera las reservas de un carrito que se vacía o abandona."""
+    reserva_ids = [pk for pk in reserva_ids if pk]
+    return _liberar(pk__in=reserva_ids) if reserva_ids else 0
+
+
+def liberar_vencidas(lote=LOTE_LIBERACION):
+    """Libera todas las reservas vencidas, en lotes de `lote` (una transacción corta por lote).
+
+    Returns:
+        int: cantidad de reservas liberadas.
+    """
+    ahora = timezone.now()
+    total, ultimo_id = 0, 0
+    while True:
+        ids = list(
+            ReservaStock.objects.filter(expira_en__lte=ahora, pk__gt=ultimo_id)
+            .order_by('pk').values_list('pk', flat=True)[:lote]
+        )
+        if not ids:
+            return total
+        total += _liberar(pk__in=ids, expira_en__lte=ahora)
+        ultimo_id = ids[-1]
+
+
+def ids_del_carrito(carrito):
+    return [data.get('reserva') for data in carrito.values() if isinstance(data, dict)]
@@ -0,0 +1,227 @@
+import datetime
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Case, Count, DateTimeField, F, Func, IntegerField, Max, Min, Q, Sum, Value, When
+from django.db.models.lookups import LessThanOrEqual
+from django.utils import timezone
+from ..models import Cliente, Inscripcion, VentaProducto, PuntajeCliente
+
+
+# Meses de gasto promedio que se proyectan sobre el monto histórico para el valor de vida
+LTV_HORIZONTE_MESES = 12
+SCORE_BATCH_SIZE = 2000
+
+_CAMPOS_PUNTAJE = [
+    'ultima_actividad', 'recencia_dias', 'frecuencia', 'monto_total', 'valor_vida',
+    'puntaje_r', 'puntaje_f', 'puntaje_m', 'puntaje_total', 'calculado_en',
+]
+
+
+def _cortes(poblacion):
+    return np.quantile(np.asarray(poblacion, dtype=np.float64), [0.2, 0.4, 0.6, 0.8])
+
+
+def quintile_scores(valores, poblacion, invertir=False):
+    """Asigna puntajes 1-5 según los quintiles de `poblacion`.
+
+    Con `invertir=True` los valores más bajos obtienen el puntaje más alto
+    (se usa para la recencia: menos días = mejor cliente).
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    poblacion = np.asarray(poblacion, dtype=np.float64)
+    if poblacion.size == 0:
+        return np.ones(valores.shape, dtype=np.int64)
+    cortes = _cortes(poblacion)
+    if invertir:
+        puntajes = 5 - np.searchsorted(cortes, valores, side='left')
+    else:
+        puntajes = np.searchsorted(cortes, valores, side='right') + 1
+    return puntajes.astype(np.int64)
+
+
+def _clientes_tocados(desde):
+    """Clientes con altas, inscripciones o compras posteriores a `desde`, o sin puntaje."""
+    return (
+        Cliente.objects.filter(
+            Q(fecha_registro__gte=desde)
+            | Q(inscripciones__fecha_inscripcion__gte=desde)
+            | Q(compras_kits__fecha_venta__gte=desde)
+            | Q(puntaje__isnull=True)
+        )
+        .values('id')
+    )
+
+
+class _DiasDesde(Func):
+    """Días completos entre `campo` y `ahora`, calculados en la base de datos."""
+    output_field = IntegerField()
+    arg_joiner = ' - '
+
+    def __init__(self, ahora, campo):
+        super().__init__(Value(ahora, output_field=DateTimeField()), F(campo))
+
+    def as_postgresql(self, compiler, connection):
+        return self.as_sql(compiler, connection, template='FLOOR(EXTRACT(EPOCH FROM (%(expressions)s)) / 86400)::integer')
+
+    def as_sqlite(self, compiler, connection):
+        return self.as_sql(
+            compiler, connection, template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+        )
+
+
+def _refrescar_recencia(excluir, pob_recencia, ahora):
+    """Actualiza recencia_dias, puntaje_r y puntaje_total del resto de clientes activos en un UPDATE.
+
+    La recencia cambia cada día aunque el cliente no tenga filas nuevas; frecuencia y
+    monto solo cambian con filas nuevas, así que sus puntajes almacenados siguen vigentes.
+    """
+    dias = _DiasDesde(ahora, 'ultima_actividad')
+    if pob_recencia.size:
+        # Mismo criterio que quintile_scores(invertir=True): 5 - cortes estrictamente menores
+        puntaje_r = Case(
+            *[When(LessThanOrEqual(dias, float(corte)), then=Value(5 - i)) for i, corte in enumerate(_cortes(pob_recencia))],
+            default=Value(1), output_field=IntegerField(),
+        )
+    else:
+        puntaje_r = Value(1, output_field=IntegerField())
+    qs = PuntajeCliente.objects.exclude(cliente_id__in=excluir).filter(ultima_actividad__isnull=False)
+    return qs.update(
+        recencia_dias=dias,
+        puntaje_r=puntaje_r,
+        puntaje_total=puntaje_r + F('puntaje_f') + F('puntaje_m'),
+    )
+
+
+def _agregados(cliente_filtro):
+    """Métricas crudas por cliente en tres consultas agregadas (clientes, inscripciones, ventas)."""
+    clientes = Cliente.objects.all()
+    inscripciones = Inscripcion.objects.exclude(estado_pago='ANULADO')
+    ventas = VentaProducto.objects.exclude(estado_pago='ANULADO')
+    if cliente_filtro is not None:
+        clientes = clientes.filter(id__in=cliente_filtro)
+        inscripciones = inscripciones.filter(cliente_id__in=cliente_filtro)
+        ventas = ventas.filter(cliente_id__in=cliente_filtro)
+
+    cliente_ids = np.fromiter(clientes.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    n = cliente_ids.size
+    frecuencia = np.zeros(n, dtype=np.int64)
+    monto = np.zeros(n, dtype=np.float64)
+    # Fechas como segundos epoch (NaN = sin actividad)
+    primera = np.full(n, np.nan)
+    ultima = np.full(n, np.nan)
+
+    consultas = [
+        inscripciones.values('cliente_id').annotate(
+            n=Count('id'),
+            total=Sum('monto_pagado', filter=Q(estado_pago__in=['PAGADO', 'ABONADO'])),
+            primera=Min('fecha_inscripcion'),
+            ultima=Max('fecha_inscripcion'),
+        ),
+        ventas.values('cliente_id').annotate(
+            n=Count('id'),
+            total=Sum('monto_total', filter=Q(estado_pago='PAGADO')),
+            primera=Min('fecha_venta'),
+            ultima=Max('fecha_venta'),
+        ),
+    ]
+    for qs in consultas:
+        filas = list(qs.order_by())
+        if not filas:
+            continue
+        ids = np.array([f['cliente_id'] for f in filas], dtype=np.int64)
+        pos = np.searchsorted(cliente_ids, ids)
+        frecuencia[pos] += np.array([f['n'] for f in filas], dtype=np.int64)
+        monto[pos] += np.array([float(f['total'] or 0) for f in filas])
+        primera[pos] = np.fmin(primera[pos], [f['primera'].timestamp() for f in filas])
+        ultima[pos] = np.fmax(ultima[pos], [f['ultima'].timestamp() for f in filas])
+
+    return cliente_ids, frecuencia, monto, primera, ultima
+
+
+def _poblacion_existente(excluir):
+    """Métricas ya almacenadas del resto de clientes, para mantener los quintiles globales."""
+    filas = list(
+        PuntajeCliente.objects.exclude(cliente_id__in=excluir)
+        .filter(frecuencia__gt=0)
+        .values_list('ultima_actividad', 'frecuencia', 'monto_total')
+    )
+    if not filas:
+        return np.empty(0), np.empty(0), np.empty(0)
+    ultima = np.array([f[0].timestamp() if f[0] else np.nan for f in filas])
+    frecuencia = np.array([f[1] for f in filas], dtype=np.float64)
+    monto = np.array([float(f[2]) for f in filas])
+    return ultima, frecuencia, monto
+
+
+def calcular_puntajes(completo=False, batch_size=SCORE_BATCH_SIZE, ahora=None):
+    """Recalcula la tabla PuntajeCliente.
+
+    En modo incremental (por defecto) solo recalcula por completo los clientes
+    tocados desde la última ejecución; los quintiles se siguen calculando sobre
+    toda la población usando los valores ya almacenados del resto, y la recencia
+    (y su puntaje R) del resto se actualiza con un único UPDATE. Los cambios de
+    estado de pago sin nuevas filas se recogen en la siguiente ejecución completa.
+
+    Returns:
+        int: cantidad de clientes actualizados.
+    """
+    ahora = ahora or timezone.now()
+    ultima_ejecucion = PuntajeCliente.objects.aggregate(m=Max('calculado_en'))['m']
+    filtro = None
+    if not completo and ultima_ejecucion is not None:
+        filtro = _clientes_tocados(ultima_ejecucion)
+
+    cliente_ids, frecuencia, monto, primera, ultima = _agregados(filtro)
+    if cliente_ids.size == 0 and filtro is None:
+        return 0
+
+    ahora_ts = ahora.timestamp()
+    activo = frecuencia > 0
+    recencia = np.where(activo, np.floor((ahora_ts - ultima) / 86400.0), np.nan)
+
+    # Valor de vida: histórico + proyección del gasto mensual promedio
+    meses_cliente = np.where(activo, np.maximum((ahora_ts - primera) / (86400.0 * 30), 1.0), 1.0)
+    valor_vida = monto + (monto / meses_cliente) * LTV_HORIZONTE_MESES
+
+    # Población para los quintiles: clientes activos procesados + resto almacenado
+    pob_ultima, pob_frec, pob_monto = (ultima[activo], frecuencia[activo], monto[activo])
+    if filtro is not None:
+        resto_ultima, resto_frec, resto_monto = _poblacion_existente(filtro)
+        pob_ultima = np.concatenate([pob_ultima, resto_ultima])
+        pob_frec = np.concatenate([pob_frec, resto_frec])
+        pob_monto = np.concatenate([pob_monto, resto_monto])
+    pob_recencia = np.floor((ahora_ts - pob_ultima[~np.isnan(pob_ultima)]) / 86400.0)
+
+    puntaje_r = np.where(activo, quintile_scores(np.nan_to_num(recencia), pob_recencia, invertir=True), 1)
+    puntaje_f = np.where(activo, quintile_scores(frecuencia, pob_frec), 1)
+    puntaje_m = np.where(activo, quintile_scores(monto, pob_monto), 1)
+    puntaje_total = puntaje_r + puntaje_f + puntaje_m
+
+    objetos = []
+    for i, cliente_id in enumerate(cliente_ids.tolist()):
+        objetos.append(PuntajeCliente(
+            cliente_id=cliente_id,
+            ultima_actividad=datetime.datetime.fromtimestamp(ultima[i], tz=datetime.timezone.utc) if activo[i] else None,
+            recencia_dias=int(recencia[i]) if activo[i] else None,
+            frecuencia=int(frecuencia[i]),
+            monto_total=int(round(monto[i])),
+            valor_vida=int(round(valor_vida[i])),
+            puntaje_r=int(puntaje_r[i]),
+            puntaje_f=int(puntaje_f[i]),
+            puntaje_m=int(puntaje_m[i]),
+            puntaje_total=int(puntaje_total[i]),
+            calculado_en=ahora,
+        ))
+
+    with transaction.atomic():
+        if filtro is not None:
+            _refrescar_recencia(filtro, pob_recencia, ahora)
+        for inicio in range(0, len(objetos), batch_size):
+            PuntajeCliente.objects.bulk_create(
+                objetos[inicio:inicio + batch_size],
+                update_conflicts=True,
+                unique_fields=['cliente'],
+                update_fields=_CAMPOS_PUNTAJE,
+            )
+    return len(objetos)
@@ -0,0 +1,501 @@
+import re
+import threading
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Exists, Max, OuterRef, Q
+from ..models import CambioSegmentacion, Cliente, Inscripcion, Interes
+
+
+# Estados de inscripción que definen cada bandera del índice (mismos criterios que listado_clientes)
+ESTADOS_DEUDA = ['PENDIENTE', 'ABONADO']
+ESTADOS_ASISTENCIA = ['PENDIENTE', 'ABONADO', 'PAGADO']
+
+# Versión: sube tras cada cambio confirmado (se aplican los deltas de CambioSegmentacion).
+# Generación: sube cuando hay que reconstruir el índice completo.
+_VERSION_KEY = 'crm:segmentos:version'
+_GENERACION_KEY = 'crm:segmentos:generacion'
+# Con más cambios pendientes que esto, reconstruir es más barato que aplicarlos
+DELTA_MAXIMO = 5000
+# Ids de CambioSegmentacion bajo el último aplicado que se vuelven a mirar: una transacción
+# puede confirmar un id menor después de que otra confirmó uno mayor
+VENTANA_CAMBIOS = 500
+_CHUNK_BITS = 16
+_CHUNK_SIZE = 1 << _CHUNK_BITS
+_CHUNK_MASK = _CHUNK_SIZE - 1
+
+ClienteInteres = Cliente.intereses_cliente.through
+
+
+class ExpresionInvalida(ValueError):
+    """La expresión de segmento no se pudo interpretar."""
+
+
+# =========================================================================
+# Bitmap comprimido por bloques (estilo roaring)
+# =========================================================================
+
+def _bloque_desde_bits(bajos):
+    """Entero de 2^16 bits con los bits `bajos` encendidos."""
+    bits = np.zeros(_CHUNK_SIZE, dtype=bool)
+    bits[bajos] = True
+    return int.from_bytes(np.packbits(bits, bitorder='little').tobytes(), 'little')
+
+
+def _bits_de_bloque(bloque):
+    """Posiciones encendidas (ascendentes) de un bloque."""
+    datos = np.frombuffer(bloque.to_bytes(_CHUNK_SIZE // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(datos, bitorder='little'))
+
+
+class Bitmap:
+    """Conjunto de ids de cliente como bloques de 2^16 bits (enteros de Python).
+
+    Solo se guardan los bloques no vacíos, así que una modificación copia a lo
+    sumo 8 KB y las operaciones AND/OR/NOT recorren únicamente los bloques presentes.
+    """
+
+    __slots__ = ('bloques',)
+
+    def __init__(self, bloques=None):
+        self.bloques = bloques or {}
+
+    @classmethod
+    def desde_ids(cls, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        if ids.size == 0:
+            return cls()
+        altos = ids >> _CHUNK_BITS
+        cortes = np.flatnonzero(np.diff(altos)) + 1
+        bloques = {}
+        for grupo in np.split(ids, cortes):
+            bloques[int(grupo[0] >> _CHUNK_BITS)] = _bloque_desde_bits(grupo & _CHUNK_MASK)
+        return cls(bloques)
+
+    def agregar(self, i):
+        alto = i >> _CHUNK_BITS
+        self.bloques[alto] = self.bloques.get(alto, 0) | (1 << (i & _CHUNK_MASK))
+
+    def quitar(self, i):
+        alto = i >> _CHUNK_BITS
+        bloque = self.bloques.get(alto)
+        if bloque is None:
+            return
+        bloque &= ~(1 << (i & _CHUNK_MASK))
+        if bloque:
+            self.bloques[alto] = bloque
+        else:
+            del self.bloques[alto]
+
+    def __contains__(self, i):
+        return bool((self.bloques.get(i >> _CHUNK_BITS, 0) >> (i & _CHUNK_MASK)) & 1)
+
+    def __and__(self, otro):
+        bloques = {}
+        for alto in self.bloques.keys() & otro.bloques.keys():
+            bloque = self.bloques[alto] & otro.bloques[alto]
+            if bloque:
+                bloques[alto] = bloque
+        return Bitmap(bloques)
+
+    def __or__(self, otro):
+        bloques = dict(self.bloques)
+        for alto, bloque in otro.bloques.items():
+            bloques[alto] = bloques.get(alto, 0) | bloque
+        return Bitmap(bloques)
+
+    def __sub__(self, otro):
+        bloques = {}
+        for alto, bloque in self.bloques.items():
+            bloque &= ~otro.bloques.get(alto, 0)
+            if bloque:
+                bloques[alto] = bloque
+        return Bitmap(bloques)
+
+    def __len__(self):
+        return sum(bloque.bit_count() for bloque in self.bloques.values())
+
+    def __eq__(self, otro):
+        return isinstance(otro, Bitmap) and self.bloques == otro.bloques
+
+    def ids(self):
+        """Todos los ids en orden ascendente (np.ndarray)."""
+        partes = [
+            _bits_de_bloque(self.bloques[alto]) + (alto << _CHUNK_BITS)
+            for alto in sorted(self.bloques)
+        ]
+        return np.concatenate(partes) if partes else np.empty(0, dtype=np.int64)
+
+    def pagina(self, inicio, cantidad, descendente=True):
+        """Ids de una página sin expandir los bloques anteriores (se saltan por conteo de bits)."""
+        resultado = []
+        saltar = inicio
+        for alto in sorted(self.bloques, reverse=descendente):
+            bloque = self.bloques[alto]
+            n = bloque.bit_count()
+            if saltar >= n:
+                saltar -= n
+                continue
+            bits = _bits_de_bloque(bloque) + (alto << _CHUNK_BITS)
+            if descendente:
+                bits = bits[::-1]
+            tomados = bits[saltar:saltar + cantidad - len(resultado)]
+            resultado.extend(int(i) for i in tomados)
+            saltar = 0
+            if len(resultado) >= cantidad:
+                break
+        return resultado
+
+
+# =========================================================================
+# Expresiones de segmento: interes:3 AND (tipo:B2C OR NOT deuda)
+# =========================================================================
+
+_TOKEN = re.compile(r'\s*(?:(\()|(\))|(\w+):"([^"]*)"|(\w+):(\S+?)(?=[\s()]|$)|(\w+))')
+
+
+def _tokenizar(texto):
+    tokens = []
+    pos = 0
+    texto = texto.strip()
+    while pos < len(texto):
+        m = _TOKEN.match(texto, pos)
+        if not m or m.end() == pos:
+            raise ExpresionInvalida(f'Símbolo inesperado en la posición {pos}: {texto[pos:pos + 10]!r}')
+        pos = m.end()
+        abre, cierra, clave_q, valor_q, clave, valor, palabra = m.groups()
+        if abre:
+            tokens.append(('(', None))
+        elif cierra:
+            tokens.append((')', None))
+        elif clave_q:
+            tokens.append(('ATOMO', (clave_q.lower(), valor_q)))
+        elif clave:
+            tokens.append(('ATOMO', (clave.lower(), valor)))
+        elif palabra.upper() in ('AND', 'OR', 'NOT', 'Y', 'O', 'NO'):
+            tokens.append(({'Y': 'AND', 'O': 'OR', 'NO': 'NOT'}.get(palabra.upper(), palabra.upper()), None))
+        else:
+            tokens.append(('ATOMO', (palabra.lower(), None)))
+    return tokens
+
+
+def parsear(texto):
+    """Convierte una expresión de segmento en un árbol de tuplas.
+
+    Gramática (NOT > AND > OR): `deuda`, `todos`, `interes:<id|nombre>`,
+    `tipo:B2C`, `comuna:"La Florida"`, `taller:<id>`, combinados con
+    AND / OR / NOT (o Y / O / NO) y paréntesis.
+    """
+    tokens = _tokenizar(texto)
+    pos = [0]
+
+    def ver():
+        return tokens[pos[0]][0] if pos[0] < len(tokens) else None
+
+    def tomar():
+        token = tokens[pos[0]]
+        pos[0] += 1
+        return token
+
+    def expr_or():
+        nodos = [expr_and()]
+        while ver() == 'OR':
+            tomar()
+            nodos.append(expr_and())
+        return nodos[0] if len(nodos) == 1 else ('or', *nodos)
+
+    def expr_and():
+        nodos = [expr_not()]
+        while ver() in ('AND', 'NOT', '(', 'ATOMO'):
+            if ver() == 'AND':
+                tomar()
+            nodos.append(expr_not())
+        return nodos[0] if len(nodos) == 1 else ('and', *nodos)
+
+    def expr_not():
+        if ver() == 'NOT':
+            tomar()
+            return ('not', expr_not())
+        return primario()
+
+    def primario():
+        tipo = ver()
+        if tipo == '(':
+            tomar()
+            nodo = expr_or()
+            if ver() != ')':
+                raise ExpresionInvalida('Falta cerrar un paréntesis.')
+            tomar()
+            return nodo
+        if tipo == 'ATOMO':
+            return ('atomo', *tomar()[1])
+        raise ExpresionInvalida('Expresión incompleta.')
+
+    if not tokens:
+        raise ExpresionInvalida('La expresión está vacía.')
+    arbol = expr_or()
+    if pos[0] != len(tokens):
+        raise ExpresionInvalida('Sobran símbolos al final de la expresión.')
+    return arbol
+
+
+def expresion_a_q(arbol):
+    """Traduce un árbol de parsear() (o una cadena) a un Q de Cliente con subconsultas EXISTS.
+
+    Misma semántica que IndiceSegmentos.evaluar(), pero resuelta por la base de datos
+    (se usa para materializar segmentos guardados sobre un subconjunto de clientes).
+    """
+    if isinstance(arbol, str):
+        arbol = parsear(arbol)
+    operador = arbol[0]
+    if operador == 'not':
+        return ~expresion_a_q(arbol[1])
+    if operador in ('and', 'or'):
+        partes = [expresion_a_q(nodo) for nodo in arbol[1:]]
+        q = partes[0]
+        for parte in partes[1:]:
+            q = q & parte if operador == 'and' else q | parte
+        return q
+
+    _, clave, valor = arbol
+    if clave == 'todos':
+        return Q(pk__isnull=False)
+    if clave == 'deuda':
+        return Q(Exists(Inscripcion.objects.filter(cliente_id=OuterRef('pk'), estado_pago__in=ESTADOS_DEUDA)))
+    if valor is None:
+        raise ExpresionInvalida(f'"{clave}" requiere un valor (p.ej. {clave}:...).')
+    if clave == 'interes':
+        intereses = ClienteInteres.objects.filter(cliente_id=OuterRef('pk'))
+        if str(valor).isdigit():
+            intereses = intereses.filter(interes_id=int(valor))
+        else:
+            intereses = intereses.filter(interes__nombre__iexact=valor)
+        return Q(Exists(intereses))
+    if clave == 'taller':
+        if not str(valor).isdigit():
+            raise ExpresionInvalida('taller: requiere el id del taller.')
+        return Q(Exists(Inscripcion.objects.filter(
+            cliente_id=OuterRef('pk'), taller_id=int(valor), estado_pago__in=ESTADOS_ASISTENCIA
+        )))
+    if clave == 'tipo':
+        return Q(tipo_cliente=str(valor).upper())
+    if clave == 'comuna':
+        return Q(comuna_vive__iexact=str(valor).strip())
+    raise ExpresionInvalida(f'Criterio desconocido: "{clave}".')
+
+
+# =========================================================================
+# Índice en memoria
+# =========================================================================
+
+class IndiceSegmentos:
+    """Bitmaps por interés, tipo de cliente, comuna, taller y deuda, indexados por id de cliente."""
+
+    def __init__(self):
+        self.universo = Bitmap()
+        self.bitmaps = {}
+        self.intereses_por_nombre = {}
+        self.version = None
+        self.generacion = None
+        # Último CambioSegmentacion incorporado y los ya aplicados dentro de la ventana
+        self.ultimo_cambio_id = 0
+        self.cambios_aplicados = set()
+
+    # --- Construcción ---
+
+    def construir(self):
+        """Carga el índice completo recorriendo una vez cada tabla de origen."""
+        # Antes de leer los datos: los cambios visibles ahora quedan incluidos en la carga
+        self.ultimo_cambio_id = CambioSegmentacion.objects.aggregate(m=Max('id'))['m'] or 0
+        self.cambios_aplicados = set(CambioSegmentacion.objects.filter(
+            id__gt=self.ultimo_cambio_id - VENTANA_CAMBIOS
+        ).values_list('id', flat=True))
+        grupos = {}
+
+        def acumular(clave, cliente_id):
+            grupos.setdefault(clave, []).append(cliente_id)
+
+        todos = []
+        for cliente_id, tipo, comuna in Cliente.objects.values_list('id', 'tipo_cliente', 'comuna_vive').iterator():
+            todos.append(cliente_id)
+            acumular(('tipo', tipo), cliente_id)
+            if comuna:
+                acumular(('comuna', comuna.strip().lower()), cliente_id)
+        for cliente_id, interes_id in ClienteInteres.objects.values_list('cliente_id', 'interes_id').iterator():
+            acumular(('interes', interes_id), cliente_id)
+        for cliente_id, taller_id, estado in (
+            Inscripcion.objects.filter(estado_pago__in=ESTADOS_ASISTENCIA)
+            .values_list('cliente_id', 'taller_id', 'estado_pago').iterator()
+        ):
+            acumular(('taller', taller_id), cliente_id)
+            if estado in ESTADOS_DEUDA:
+                acumular(('deuda', None), cliente_id)
+
+        self.universo = Bitmap.desde_ids(todos)
+        self.bitmaps = {clave: Bitmap.desde_ids(ids) for clave, ids in grupos.items()}
+        self.intereses_por_nombre = {
+            nombre.lower(): pk for pk, nombre in Interes.objects.values_list('id', 'nombre')
+        }
+        return self
+
+    # --- Mantenimiento incremental ---
+
+    def _claves_clientes(self, cliente_ids):
+        """{cliente_id: claves} de los clientes que existen (los eliminados no aparecen)."""
+        claves = {}
+        for pk, tipo, comuna in Cliente.objects.filter(id__in=cliente_ids).values_list('id', 'tipo_cliente', 'comuna_vive'):
+            claves[pk] = {('tipo', tipo)}
+            if comuna:
+                claves[pk].add(('comuna', comuna.strip().lower()))
+        for pk, interes_id in ClienteInteres.objects.filter(cliente_id__in=claves).values_list('cliente_id', 'interes_id'):
+            claves[pk].add(('interes', interes_id))
+        for pk, taller_id, estado in Inscripcion.objects.filter(
+            cliente_id__in=claves, estado_pago__in=ESTADOS_ASISTENCIA
+        ).values_list('cliente_id', 'taller_id', 'estado_pago'):
+            claves[pk].add(('taller', taller_id))
+            if estado in ESTADOS_DEUDA:
+                claves[pk].add(('deuda', None))
+        return claves
+
+    def con_clientes_actualizados(self, cliente_ids):
+        """Copia del índice con los bits de `cliente_ids` recalculados (altas, cambios y bajas).
+
+        El índice original no se modifica: las consultas en curso siguen leyendo un
+        estado consistente. Los bitmaps que no tocan a esos clientes se comparten.
+        """
+        tocados = Bitmap.desde_ids(list(cliente_ids))
+        claves = self._claves_clientes(list(cliente_ids))
+        agregados = {}
+        for pk, claves_cliente in claves.items():
+            for clave in claves_cliente:
+                agregados.setdefault(clave, []).append(pk)
+
+        nuevo = IndiceSegmentos()
+        nuevo.intereses_por_nombre = self.intereses_por_nombre
+        nuevo.universo = (self.universo - tocados) | Bitmap.desde_ids(list(claves))
+        for clave in self.bitmaps.keys() | agregados.keys():
+            bitmap = self.bitmaps.get(clave, Bitmap())
+            if bitmap.bloques.keys() & tocados.bloques.keys():
+                bitmap = bitmap - tocados
+            if clave in agregados:
+                bitmap = bitmap | Bitmap.desde_ids(agregados[clave])
+            if bitmap.bloques:
+                nuevo.bitmaps[clave] = bitmap
+        return nuevo
+
+    def con_cambios_pendientes(self):
+        """Índice con los CambioSegmentacion aún no incorporados, o None si conviene reconstruir."""
+        filas = list(
+            CambioSegmentacion.objects.filter(id__gt=self.ultimo_cambio_id - VENTANA_CAMBIOS)
+            .exclude(id__in=self.cambios_aplicados)
+            .order_by('id').values_list('id', 'cliente_id')[:DELTA_MAXIMO + 1]
+        )
+        if len(filas) > DELTA_MAXIMO:
+            return None
+        if not filas:
+            return self
+        nuevo = self.con_clientes_actualizados({cliente_id for _, cliente_id in filas})
+        nuevo.ultimo_cambio_id = max(self.ultimo_cambio_id, filas[-1][0])
+        nuevo.cambios_aplicados = {
+            pk for pk in self.cambios_aplicados | {pk for pk, _ in filas}
+            if pk > nuevo.ultimo_cambio_id - VENTANA_CAMBIOS
+        }
+        return nuevo
+
+    # --- Consultas ---
+
+    def bitmap(self, clave, valor=None):
+        if clave == 'todos':
+            return self.universo
+        if clave == 'deuda':
+            return self.bitmaps.get(('deuda', None), Bitmap())
+        if valor is None:
+            raise ExpresionInvalida(f'"{clave}" requiere un valor (p.ej. {clave}:...).')
+        if clave == 'interes':
+            pk = int(valor) if str(valor).isdigit() else self.intereses_por_nombre.get(str(valor).lower())
+            return self.bitmaps.get(('interes', pk), Bitmap())
+        if clave == 'taller':
+            if not str(valor).isdigit():
+                raise ExpresionInvalida('taller: requiere el id del taller.')
+            return self.bitmaps.get(('taller', int(valor)), Bitmap())
+        if clave == 'tipo':
+            return self.bitmaps.get(('tipo', str(valor).upper()), Bitmap())
+        if clave == 'comuna':
+            return self.bitmaps.get(('comuna', str(valor).strip().lower()), Bitmap())
+        raise ExpresionInvalida(f'Criterio desconocido: "{clave}".')
+
+    def evaluar(self, arbol):
+        """Evalúa un árbol de parsear() (o una cadena) y devuelve el Bitmap de clientes."""
+        if isinstance(arbol, str):
+            arbol = parsear(arbol)
+        operador = arbol[0]
+        if operador == 'atomo':
+            return self.bitmap(arbol[1], arbol[2])
+        if operador == 'not':
+            return self.universo - self.evaluar(arbol[1])
+        resultados = [self.evaluar(nodo) for nodo in arbol[1:]]
+        acumulado = resultados[0]
+        for r in resultados[1:]:
+            acumulado = acumulado & r if operador == 'and' else acumulado | r
+        return acumulado
+
+
+# =========================================================================
+# Instancia por proceso
+# =========================================================================
+
+_indice = None
+_lock = threading.Lock()
+
+
+def _contador(clave):
+    valor = cache.get(clave)
+    if valor is None:
+        valor = 1
+        cache.add(clave, valor, None)
+    return valor
+
+
+def _incrementar(clave):
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        cache.set(clave, 1, None)
+        return 1
+
+
+def obtener_indice():
+    """Índice del proceso, al día con los cambios confirmados por cualquier proceso.
+
+    Si solo subió la versión se aplican los deltas de CambioSegmentacion sobre una
+    copia; si subió la generación (o hay demasiados cambios) se reconstruye. El
+    reemplazo de `_indice` ocurre bajo `_lock`.
+    """
+    global _indice
+    generacion = _contador(_GENERACION_KEY)
+    version = _contador(_VERSION_KEY)
+    indice = _indice
+    if indice is not None and (indice.generacion, indice.version) == (generacion, version):
+        return indice
+    with _lock:
+        indice = _indice
+        if indice is not None and indice.generacion == generacion:
+            if indice.version != version:
+                indice = indice.con_cambios_pendientes()
+        else:
+            indice = None
+        if indice is None:
+            indice = IndiceSegmentos().construir()
+        indice.generacion, indice.version = generacion, version
+        _indice = indice
+        return indice
+
+
+def cambios_registrados():
+    """Avisa a todos los procesos de que hay CambioSegmentacion nuevos (llamar tras el commit)."""
+    _incrementar(_VERSION_KEY)
+
+
+def invalidar_indice():
+    """Fuerza la reconstrucción en todos los procesos (cambios sin CambioSegmentacion)."""
+    _incrementar(_GENERACION_KEY)
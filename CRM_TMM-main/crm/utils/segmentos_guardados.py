@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+from ..models import CambioSegmentacion, Cliente, Segmento, SegmentoMiembro
+from .segmentos import VENTANA_CAMBIOS, expresion_a_q, invalidar_indice
+
+
+REFRESCO_LOTE = 5000
+
+
+def registrar_cambio(cliente_ids):
+    """Anota clientes cuya pertenencia a segmentos pudo cambiar (misma transacción que el cambio)."""
+    ids = {int(pk) for pk in cliente_ids if pk is not None}
+    if ids:
+        CambioSegmentacion.objects.bulk_create([CambioSegmentacion(cliente_id=pk) for pk in ids])
+
+
+def expresion_desde_filtros(tipo=None, interes_ids=None, taller_id=None, deudores=False, segmento=None):
+    """Arma la expresión de segmento equivalente a los filtros de listado_clientes."""
+    partes = []
+    if tipo:
+        partes.append(f'tipo:{tipo}')
+    if interes_ids:
+        intereses = [f'interes:{pk}' for pk in interes_ids]
+        partes.append(intereses[0] if len(intereses) == 1 else f"({' OR '.join(intereses)})")
+    if taller_id:
+        partes.append(f'taller:{taller_id}')
+    if deudores:
+        partes.append('deuda')
+    if segmento:
+        partes.append(f'({segmento})')
+    return ' AND '.join(partes) or 'todos'
+
+
+def _agregar_miembros(segmento, ids):
+    for inicio in range(0, len(ids), REFRESCO_LOTE):
+        SegmentoMiembro.objects.bulk_create(
+            [SegmentoMiembro(segmento=segmento, cliente_id=pk) for pk in ids[inicio:inicio + REFRESCO_LOTE]],
+            ignore_conflicts=True,
+        )
+
+
+def refrescar_segmento(segmento, completo=False):
+    """Recalcula los miembros de `segmento`.
+
+    Incremental (por defecto): solo se re-evalúan los clientes registrados en
+    CambioSegmentacion después de `ultimo_cambio_id - VENTANA_CAMBIOS` (los
+    cambios confirmados tarde quedan bajo la marca; re-evaluar es idempotente).
+    Completo (o nunca refrescado): se evalúa la expresión sobre todos los clientes.
+
+    Returns:
+        int: cantidad de clientes re-evaluados.
+    """
+    condicion = expresion_a_q(segmento.expresion)
+    with transaction.atomic():
+        segmento = Segmento.objects.select_for_update().get(pk=segmento.pk)
+        hasta = CambioSegmentacion.objects.aggregate(m=Max('id'))['m'] or 0
+        miembros = SegmentoMiembro.objects.filter(segmento=segmento)
+
+        if completo or segmento.refrescado_en is None:
+            candidatos = Cliente.objects.all()
+            miembros.exclude(cliente__in=Cliente.objects.filter(condicion)).delete()
+        else:
+            tocados = set(CambioSegmentacion.objects.filter(
+                id__gt=segmento.ultimo_cambio_id - VENTANA_CAMBIOS, id__lte=hasta
+            ).values_list('cliente_id', flat=True))
+            candidatos = Cliente.objects.filter(id__in=tocados)
+            # Clientes tocados que ya no cumplen (o fueron eliminados: el CASCADE ya los quitó)
+            miembros.filter(cliente_id__in=tocados).exclude(
+                cliente__in=Cliente.objects.filter(id__in=tocados).filter(condicion)
+            ).delete()
+
+        nuevos = list(
+            candidatos.filter(condicion)
+            .exclude(Exists(miembros.filter(cliente_id=OuterRef('pk'))))
+            .values_list('id', flat=True)
+        )
+        _agregar_miembros(segmento, nuevos)
+
+        evaluados = candidatos.count()
+        segmento.ultimo_cambio_id = max(segmento.ultimo_cambio_id, hasta)
+        segmento.refrescado_en = timezone.now()
+        segmento.total_miembros = miembros.count()
+        segmento.save(update_fields=['ultimo_cambio_id', 'refrescado_en', 'total_miembros'])
+    return evaluados
+
+
+def refrescar_todos(completo=False):
+    """Refresca todos los segmentos guardados y purga el registro ya procesado."""
+    resultados = {s.nombre: refrescar_segmento(s, completo=completo) for s in Segmento.objects.all()}
+    purgar_cambios()
+    return resultados
+
+
+def purgar_cambios():
+    """Elimina los cambios ya incorporados por todos los segmentos.
+
+    Se conserva la ventana bajo la marca más atrasada, que refrescar_segmento
+    vuelve a mirar. Un índice en memoria atrasado podría necesitar los cambios
+    borrados: si se borró alguno, los procesos reconstruyen su índice.
+    """
+    minimo = Segmento.objects.aggregate(m=Min('ultimo_cambio_id'))['m']
+    cambios = CambioSegmentacion.objects.all()
+    if minimo is not None:
+        cambios = cambios.filter(id__lte=minimo - VENTANA_CAMBIOS)
+    eliminados = cambios.delete()[0]
+    if eliminados:
+        transaction.on_commit(invalidar_indice)
+    return eliminados
+
+
+def filas_miembros(segmento, chunk_size=2000):
+    """Filas CSV de los miembros materializados (recorre el índice segmento_id, cliente_id)."""
+    yield ['ID', 'Cliente', 'Email', 'Teléfono', 'Tipo', 'Comuna']
+    yield from (
+        list(fila) for fila in SegmentoMiembro.objects.filter(segmento=segmento)
+        .order_by('cliente_id')
+        .values_list(
+            'cliente_id', 'cliente__nombre_completo', 'cliente__email', 'cliente__telefono',
+            'cliente__tipo_cliente', 'cliente__comuna_vive',
+        )
+        .iterator(chunk_size=chunk_size)
+    )
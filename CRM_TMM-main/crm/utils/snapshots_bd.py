@@ -0,0 +1,191 @@
+"""Snapshots de la base de datos completa para preparar rápido las pruebas de rendimiento.
+
+Un snapshot se identifica por la versión del esquema (huella de todas las migraciones
+del código) y por los parámetros con que se generaron los datos (`generate_data`):
+`<esquema>-<parámetros>`. Junto a cada snapshot se guarda un `<nombre>.json` con
+esos metadatos en SNAPSHOTS_BD_DIR.
+
+  - SQLite: copia del archivo con la API de backup (consistente aunque haya WAL). Se
+    restaura clonando el archivo (reflink/copy-on-write si el sistema de archivos lo
+    permite, copia normal si no); una base en memoria se restaura con la API de backup.
+  - PostgreSQL: base de datos plantilla en el mismo servidor
+    (CREATE DATABASE ... TEMPLATE). Restaurar es una copia de archivos del servidor,
+    sin reejecutar SQL ni reconstruir índices.
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.migrations.loader import MigrationLoader
+
+from . import datos_sinteticos
+
+FICLONE = 0x40049409  # ioctl de Linux para clonar un archivo (btrfs, XFS, bcachefs...)
+
+
+class SnapshotNoDisponible(ValueError):
+    """No hay snapshot compatible o el motor de base de datos no está soportado."""
+
+
+def get_snapshots_dir():
+    return str(getattr(settings, 'SNAPSHOTS_BD_DIR', os.path.join(settings.BASE_DIR, 'snapshots_bd')))
+
+
+def _huella(texto):
+    return hashlib.sha1(texto.encode()).hexdigest()[:12]
+
+
+def version_esquema():
+    """Huella de todas las migraciones conocidas por el código."""
+    grafo = MigrationLoader(None, ignore_no_migrations=True).graph
+    return _huella(';'.join(f'{app}.{nombre}' for app, nombre in sorted(grafo.nodes)))
+
+
+def nombre_snapshot(parametros):
+    return f'{version_esquema()}-{_huella(json.dumps(parametros, sort_keys=True, default=str))}'
+
+
+def _motor():
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        raise SnapshotNoDisponible(f'Snapshots no soportados para el motor {connection.vendor}.')
+    return connection.vendor
+
+
+def _base_plantilla(nombre):
+    return connection.ops.quote_name(f'snapshot_{nombre.replace("-", "_")}')
+
+
+def buscar(nombre, directorio=None):
+    """Metadatos del snapshot `nombre`, o None si no existe."""
+    ruta = os.path.join(directorio or get_snapshots_dir(), f'{nombre}.json')
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta, encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['motor'] == 'sqlite' and not os.path.exists(os.path.join(os.path.dirname(ruta), meta['archivo'])):
+        return None
+    return meta
+
+
+def listar(directorio=None):
+    directorio = directorio or get_snapshots_dir()
+    if not os.path.isdir(directorio):
+        return []
+    nombres = sorted(n[:-len('.json')] for n in os.listdir(directorio) if n.endswith('.json'))
+    return [meta for meta in (buscar(n, directorio) for n in nombres) if meta]
+
+
+def guardar(parametros, directorio=None, totales=None):
+    """Captura la base actual como snapshot de (esquema, `parametros`).
+
+    Raises:
+        SnapshotNoDisponible: motor no soportado o migraciones sin aplicar.
+
+    Returns:
+        dict: metadatos del snapshot.
+    """
+    motor = _motor()
+    executor = MigrationExecutor(connection)
+    if executor.migration_plan(executor.loader.graph.leaf_nodes()):
+        raise SnapshotNoDisponible('Hay migraciones sin aplicar: ejecute migrate antes de guardar el snapshot.')
+    directorio = directorio or get_snapshots_dir()
+    os.makedirs(directorio, exist_ok=True)
+    nombre = nombre_snapshot(parametros)
+    meta = {
+        'nombre': nombre, 'motor': motor, 'esquema': version_esquema(), 'parametros': parametros,
+        'totales': totales or {}, 'creado_en': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+    }
+
+    if motor == 'sqlite':
+        meta['archivo'] = f'{nombre}.sqlite3'
+        temporal = os.path.join(directorio, f'.{nombre}.tmp')
+        connection.ensure_connection()
+        destino = sqlite3.connect(temporal)
+        try:
+            connection.connection.backup(destino)
+        finally:
+            destino.close()
+        os.replace(temporal, os.path.join(directorio, meta['archivo']))
+    else:
+        plantilla = _base_plantilla(nombre)
+        origen = connection.ops.quote_name(connection.settings_dict['NAME'])
+        # CREATE DATABASE ... TEMPLATE exige que nadie (tampoco esta conexión) use la base origen
+        connection.close()
+        with connection._nodb_cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {plantilla}')
+            cursor.execute(f'CREATE DATABASE {plantilla} TEMPLATE {origen}')
+        meta['base_datos'] = plantilla
+
+    with open(os.path.join(directorio, f'{nombre}.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2, ensure_ascii=False)
+    return meta
+
+
+def _clonar_archivo(origen, destino):
+    """Copia `origen` en `destino` compartiendo bloques si el sistema de archivos lo permite."""
+    try:
+        import fcntl
+        with open(origen, 'rb') as entrada, open(destino, 'wb') as salida:
+            fcntl.ioctl(salida.fileno(), FICLONE, entrada.fileno())
+        return 'reflink'
+    except (ImportError, OSError):
+        shutil.copyfile(origen, destino)
+        return 'copia'
+
+
+def restaurar(meta, directorio=None, forzar=False):
+    """Reemplaza la base de datos actual por el snapshot descrito en `meta`.
+
+    Args:
+        forzar: en PostgreSQL, cerrar las conexiones de otros procesos a la base.
+
+    Raises:
+        SnapshotNoDisponible: el snapshot es de otro motor o de otra versión del esquema.
+
+    Returns:
+        tuple: (segundos, método de copia).
+    """
+    motor = _motor()
+    if meta['motor'] != motor:
+        raise SnapshotNoDisponible(f'El snapshot {meta["nombre"]} es de {meta["motor"]}, la base actual es {motor}.')
+    if meta['esquema'] != version_esquema():
+        raise SnapshotNoDisponible(f'El snapshot {meta["nombre"]} es de otra versión del esquema; genérelo de nuevo.')
+    inicio = time.monotonic()
+
+    if motor == 'sqlite':
+        archivo = os.path.join(directorio or get_snapshots_dir(), meta['archivo'])
+        if connection.is_in_memory_db():
+            connection.ensure_connection()
+            origen = sqlite3.connect(archivo)
+            try:
+                origen.backup(connection.connection)
+            finally:
+                origen.close()
+            metodo = 'backup'
+        else:
+            ruta = str(connection.settings_dict['NAME'])
+            connection.close()
+            temporal = f'{ruta}.restaurando'
+            metodo = _clonar_archivo(archivo, temporal)
+            for sufijo in ('-wal', '-shm', '-journal'):
+                if os.path.exists(ruta + sufijo):
+                    os.remove(ruta + sufijo)
+            os.replace(temporal, ruta)
+    else:
+        base = connection.ops.quote_name(connection.settings_dict['NAME'])
+        connection.close()
+        with connection._nodb_cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS {base}' + (' WITH (FORCE)' if forzar else ''))
+            cursor.execute(f'CREATE DATABASE {base} TEMPLATE {meta["base_datos"]}')
+        metodo = 'plantilla'
+
+    # Los cachés (catálogo, segmentación, deudores) describían la base anterior
+    datos_sinteticos.invalidar_caches()
+    return time.monotonic() - inicio, metodo
@@ -1,34 +1,51 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
-from django.db.models import F, Sum, Count, Q, Max
+from django.db.models import F, Sum, Count, Q, Max, Exists, OuterRef
 # Importa IntegrityError para manejo específico de errores de base de datos
 from django.db import IntegrityError
-from .models import Taller, Cliente, Inscripcion, Producto, Interes, DetalleVenta, VentaProducto # Asegúrate de importar los modelos de Venta
+from .models import Taller, Cliente, Inscripcion, Producto, Interes, PuntajeCliente, Segmento, SegmentoMiembro
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db.models.functions import TruncMonth
 from django.db.models import Min, Max
 import logging
+import csv
 import json
 import math
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login
 from .forms import RegistroClienteForm
 from .utils.enrollment import enroll_cliente_en_taller
+from .utils.cache_catalogo import insertar_disponibles, pagina_anonima, respuesta_condicional, tarjetas
+from .utils.cupos import cupos_de, parsear_ids
+from .utils import acceso_login
+from .utils import carrito as carrito_util
+from .utils import checkout
+from .utils import reservas
+from .utils import stock
+from .utils.clientes import CLIENTES_POR_PAGINA, cliente_de_usuario, contar_clientes, filtrar_clientes
+from .utils.segmentos import ExpresionInvalida, expresion_a_q
+from .utils.segmentos_guardados import expresion_desde_filtros, filas_miembros, refrescar_segmento
+from .utils.deudores import FILTROS_ESTADO, ORDENES, cambiar_estado_masivo, contar_inscripciones, filas_exportacion, inscripciones_por_filtro, reporte_antiguedad, ventana_paginas
 from django.utils import timezone
 from django.core.mail import send_mail, BadHeaderError # Importa BadHeaderError
 from django.conf import settings
 from django.urls import reverse
 from django.template.loader import render_to_string
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from decimal import Decimal, InvalidOperation
 from django.db import transaction
 import calendar
 import datetime
 from datetime import date
 from django.contrib.auth.views import LoginView as DjangoLoginView
-from django.contrib.auth import get_user_model
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.forms.utils import ErrorDict
 from django.http import HttpResponseRedirect
-from django.contrib.auth import logout as auth_logout
+from django.contrib.auth import get_user_model, logout as auth_logout
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView
 
 
 def home(request):
@@ -41,28 +58,59 @@ def home(request):
     }
     return render(request, 'crm/home.html', context)
 
+def _resumen_catalogo(queryset):
+    """Validadores baratos de una página del catálogo: MAX(updated_at) y COUNT en una consulta."""
+    datos = queryset.aggregate(ultima=Max('updated_at'), total=Count('id'))
+    ultima = datos['ultima']
+    return ultima, f"{datos['total']}:{ultima.isoformat() if ultima else '-'}"
+
 def catalogo_talleres(request):
     """
     Vista que muestra una lista de todos los talleres activos.
+    Anónimos: página completa desde caché. Autenticados: tarjetas desde caché.
     """
-    # Consulta la base de datos para obtener los talleres activos y los ordena por fecha
-    talleres_activos = Taller.objects.filter(esta_activo=True).order_by('fecha_taller')
-    
-    context = {
-        'titulo': 'Catálogo de Talleres',
-        'talleres': talleres_activos,
-    }
-    return render(request, 'crm/catalogo_talleres.html', context)
+    def generar(contexto_extra):
+        # Consulta la base de datos para obtener los talleres activos y los ordena por fecha
+        talleres_activos = Taller.objects.filter(esta_activo=True).order_by('fecha_taller')
+        context = {
+            'titulo': 'Catálogo de Talleres',
+            'talleres': talleres_activos,
+            'tarjetas': tarjetas(talleres_activos, 'taller', 'crm/fragmentos/tarjeta_taller.html'),
+            **contexto_extra,
+        }
+        return render(request, 'crm/catalogo_talleres.html', context)
+
+    return respuesta_condicional(
+        request, 'catalogo_talleres', ['talleres'],
+        lambda: _resumen_catalogo(Taller.objects.filter(esta_activo=True)),
+        lambda: pagina_anonima(request, 'catalogo_talleres', ['talleres'], generar),
+    )
 
 def detalle_taller_inscripcion(request, taller_id):
     """
     Muestra la información de un taller y maneja el formulario de inscripción.
     Si la inscripción es exitosa, asigna la categoría del taller como interés al cliente.
     MEJORA: Manejo específico de IntegrityError.
+    El GET anónimo se sirve desde caché (se invalida al cambiar el taller o sus cupos).
     """
-    taller = get_object_or_404(Taller, pk=taller_id)
+    def generar(contexto_extra):
+        taller = get_object_or_404(Taller.objects.select_related('categoria'), pk=taller_id)
+        # Datos para la plantilla (Solicitud GET)
+        context = {
+            'titulo': f'Detalle: {taller.nombre}',
+            'taller': taller,
+            # Mostrar el formulario solo a usuarios autenticados
+            'show_form': request.user.is_authenticated,
+            **contexto_extra,
+        }
+        # Si el usuario es superusuario, incluir la lista de inscripciones para mostrarla en la plantilla
+        if request.user.is_superuser:
+            inscripciones = Inscripcion.objects.filter(taller=taller).select_related('cliente').order_by('-fecha_inscripcion')
+            context['inscripciones'] = inscripciones
+        return render(request, 'crm/detalle_taller.html', context)
 
     if request.method == 'POST':
+        taller = get_object_or_404(Taller, pk=taller_id)
 
         # Require authenticated user to create an enrollment
         if not request.user.is_authenticated:
@@ -76,7 +124,9 @@ def detalle_taller_inscripcion(request, taller_id):
 
         usuario = request.user
 
-        inscripcion, created, msg = enroll_cliente_en_taller(taller.id, nombre, email, telefono=telefono, usuario=usuario)
+        inscripcion, created, msg = enroll_cliente_en_taller(
+            taller.id, nombre, email, telefono=telefono, usuario=usuario, cliente=request.cliente or None
+        )
 
         if created:
             messages.success(request, f'¡Inscripción exitosa! Cupo reservado para {taller.nombre}. Ahora puedes proceder al pago.')
@@ -91,18 +141,25 @@ def detalle_taller_inscripcion(request, taller_id):
             return redirect('detalle_taller', taller_id=taller.id)
 
 
-    # Datos para la plantilla (Solicitud GET)
-    context = {
-        'titulo': f'Detalle: {taller.nombre}',
-        'taller': taller,
-        # Mostrar el formulario solo a usuarios autenticados
-        'show_form': request.user.is_authenticated
-    }
-    # Si el usuario es superusuario, incluir la lista de inscripciones para mostrarla en la plantilla
-    if request.user.is_superuser:
-        inscripciones = Inscripcion.objects.filter(taller=taller).select_related('cliente').order_by('-fecha_inscripcion')
-        context['inscripciones'] = inscripciones
-    return render(request, 'crm/detalle_taller.html', context)
+    ambitos = [f'taller:{taller_id}', 'categorias']
+    return respuesta_condicional(
+        request, f'detalle_taller:{taller_id}', ambitos,
+        lambda: _resumen_catalogo(Taller.objects.filter(pk=taller_id)),
+        lambda: pagina_anonima(request, f'detalle_taller:{taller_id}', ambitos, generar),
+    )
+
+def cupos_talleres(request):
+    """
+    JSON liviano con los cupos de uno o varios talleres: /talleres/cupos/?ids=1,2,3
+    Se sirve desde la caché de estado que mantiene el feed de cupos (sin renderizar la página).
+    """
+    ids = parsear_ids(request.GET.get('ids', ''))
+    if not ids:
+        return JsonResponse({'error': 'Debes indicar ids de talleres (?ids=1,2).'}, status=400)
+    datos = cupos_de(ids)
+    response = JsonResponse({'talleres': {str(pk): valor for pk, valor in datos.items()}})
+    response['Cache-Control'] = 'no-cache'
+    return response
 
 def pago_simulado(request, inscripcion_id):
     """
@@ -183,27 +240,45 @@ def registro_cliente(request):
 
 
 class CustomLoginView(DjangoLoginView):
-    """Custom LoginView que mejora la retroalimentación en fallos de inicio de sesión.
+    """Custom LoginView con control de admisión (ver utils/acceso_login.py).
 
-    Diferencia entre usuario inexistente y contraseña incorrecta y añade
-    un error no relacionado al formulario para mostrar en la plantilla.
+    Rechaza con 429 a usuarios/IPs con demasiados fallos recientes antes de hashear
+    la contraseña, y con 503 si el proceso ya tiene el máximo de hashes en curso.
+    Un error no relacionado al formulario se muestra en la plantilla.
     """
     template_name = 'registration/login.html'
 
-    def form_invalid(self, form):
-        # Extraer el valor del campo username tal como llegó en el POST
-        username_field = form.fields.get('username') if hasattr(form, 'fields') else None
-        username = self.request.POST.get('username', '').strip()
+    def post(self, request, *args, **kwargs):
+        username = request.POST.get('username', '').strip()
+        ip = acceso_login.ip_de(request)
 
-        User = get_user_model()
-        if username:
-            try:
-                User.objects.get(username=username)
-                # Usuario existe -> error de contraseña
-                form.add_error(None, 'Contraseña incorrecta para este usuario.')
-            except User.DoesNotExist:
-                # Usuario no existe
-                form.add_error(None, 'El usuario no existe. Verifica el nombre de usuario o regístrate.')
+        form = self.get_form()
+        try:
+            with acceso_login.admision(username, ip):
+                valido = form.is_valid()
+        except acceso_login.Rechazado as e:
+            return self._rechazar(e.mensaje, e.status, e.espera)
+
+        if valido:
+            acceso_login.registrar_exito(username)
+            return self.form_valid(form)
+        acceso_login.registrar_fallo(username, ip)
+        return self.form_invalid(form)
+
+    def _rechazar(self, mensaje, status, espera):
+        # Formulario sin validar (validarlo hashearía la contraseña): solo lleva el error
+        form = self.get_form_class()(self.request, initial={'username': self.request.POST.get('username', '')})
+        form._errors = ErrorDict({NON_FIELD_ERRORS: form.error_class([mensaje], error_class='nonfield')})
+        response = self.render_to_response(self.get_context_data(form=form))
+        response.status_code = status
+        response['Retry-After'] = str(espera)
+        return response
+
+    def form_invalid(self, form):
+        # Mensaje único: distinguir "usuario inexistente" costaba otra consulta por intento
+        # y revelaba qué usuarios existen
+        if self.request.POST.get('username', '').strip():
+            form.add_error(None, 'Usuario o contraseña incorrectos.')
         else:
             form.add_error(None, 'Debes ingresar tu nombre de usuario.')
 
@@ -223,11 +298,38 @@ class CustomLoginView(DjangoLoginView):
         return super().get_context_data(**kwargs)
 
 
+class TokenConAdmisionView(TokenObtainPairView):
+    """Emisión de JWT (api/token/) con el mismo control de admisión que el login web."""
+
+    def post(self, request, *args, **kwargs):
+        username = str(request.data.get(get_user_model().USERNAME_FIELD, '')).strip()
+        ip = acceso_login.ip_de(request)
+        serializer = self.get_serializer(data=request.data)
+        try:
+            with acceso_login.admision(username, ip):
+                try:
+                    serializer.is_valid(raise_exception=True)
+                except TokenError as e:
+                    raise InvalidToken(e.args[0]) from e
+                except AuthenticationFailed:
+                    acceso_login.registrar_fallo(username, ip)
+                    raise
+        except acceso_login.Rechazado as e:
+            return Response({'detail': e.mensaje}, status=e.status, headers={'Retry-After': str(e.espera)})
+        acceso_login.registrar_exito(username)
+        return Response(serializer.validated_data, status=200)
+
 
 def is_superuser(user):
     return user.is_superuser
 
 
+@user_passes_test(is_superuser)
+def metricas_login(request):
+    """JSON con los contadores del control de admisión del login (admitidos, rechazos, etc.)."""
+    return JsonResponse(acceso_login.metricas())
+
+
 @user_passes_test(is_superuser)
 def gestion_talleres(request):
     """Pantalla administrativa para listar y crear talleres activos.
@@ -268,6 +370,26 @@ def gestion_talleres(request):
     return render(request, 'crm/gestion_talleres.html', context)
 
 
+def _aplicar_estado_masivo(request, ids, taller_id=None):
+    """Lee nuevo_estado/monto_abono del POST y aplica el cambio en lote con mensajes al usuario."""
+    nuevo_estado = request.POST.get('nuevo_estado')
+    monto = None
+    if nuevo_estado == 'ABONADO':
+        try:
+            monto = Decimal(request.POST.get('monto_abono') or '')
+        except InvalidOperation:
+            monto = None
+    if not ids:
+        messages.error(request, 'Error: No seleccionaste ninguna inscripción.')
+        return
+    try:
+        actualizadas = cambiar_estado_masivo(ids, nuevo_estado, monto=monto, taller_id=taller_id)
+    except ValueError as e:
+        messages.error(request, f'No se pudo cambiar el estado: {e}')
+        return
+    messages.success(request, f'Estado actualizado a {nuevo_estado} en {actualizadas} inscripciones.')
+
+
 @user_passes_test(is_superuser)
 def detalle_taller_admin(request, taller_id):
     """
@@ -381,17 +503,18 @@ def detalle_taller_admin(request, taller_id):
         else:
             messages.error(request, f'Error en el formulario de correo: {email_form.errors}')
 
-    # C) Actualizar estado individual (Botón rápido o AJAX si implementaras)
+    # C) Actualizar estado individual: mismo camino que el cambio en lote (monto, saldo y cupos)
     if request.method == 'POST' and request.POST.get('action') == 'actualizar_estado_inscripcion':
         ins_id = request.POST.get('inscripcion_id')
-        nuevo_estado = request.POST.get('nuevo_estado')
-        try:
-            ins = Inscripcion.objects.get(id=ins_id, taller=taller)
-            ins.estado_pago = nuevo_estado
-            ins.save()
-            messages.success(request, 'Estado de inscripción actualizado.')
-        except Inscripcion.DoesNotExist:
+        if not Inscripcion.objects.filter(id=ins_id, taller=taller).exists():
             messages.error(request, 'Inscripción no encontrada.')
+        else:
+            _aplicar_estado_masivo(request, [ins_id], taller_id=taller.id)
+        return redirect('detalle_taller_admin', taller_id=taller.id)
+
+    # D) Cambiar estado de los seleccionados en lote (un UPDATE por estado)
+    if request.method == 'POST' and request.POST.get('action') == 'cambiar_estado_masivo':
+        _aplicar_estado_masivo(request, request.POST.getlist('inscripcion_sel'), taller_id=taller.id)
         return redirect('detalle_taller_admin', taller_id=taller.id)
 
     # ---------------------------------------------------------
@@ -439,8 +562,10 @@ def gestion_deudores(request):
     # 1. Obtener el parámetro de filtro de la URL
     filtro_estado = request.GET.get('estado', None)
     
-    # 2. Iniciar el QuerySet con todas las inscripciones (para el filtro 'Todos')
-    inscripciones_qs = Inscripcion.objects.all().order_by('-fecha_inscripcion')
+    # --- Cambio de estado en lote (PAGADO / ABONADO / ANULADO) ---
+    if request.method == 'POST' and request.POST.get('action') == 'cambiar_estado_masivo':
+        _aplicar_estado_masivo(request, request.POST.getlist('inscripcion_seleccionada'))
+        return redirect('gestion_deudores')
 
     # --- Manejo de envío de recordatorios / cancelaciones por correo (desde la UI) ---
     if request.method == 'POST' and request.POST.get('action') in ('enviar_recordatorio', 'enviar_cancelacion'):
@@ -472,7 +597,7 @@ def gestion_deudores(request):
         if not ins_ids:
             messages.error(request, 'Error: No seleccionaste ninguna inscripción.')
         else:
-            inscripciones_sel = Inscripcion.objects.filter(id__in=ins_ids).select_related('cliente')
+            inscripciones_sel = Inscripcion.objects.filter(id__in=ins_ids).select_related('cliente', 'taller')
             destinatarios = [ins.cliente.email for ins in inscripciones_sel if ins.cliente and ins.cliente.email]
             num_seleccionados = len(ins_ids)
             num_a_enviar = len(destinatarios)
@@ -538,20 +663,28 @@ def gestion_deudores(request):
         return redirect('gestion_deudores')
     
     # 3. Aplicar el filtro según el parámetro
-    # 'DEUDA' debe mostrar inscripciones con estado PENDIENTE (pendientes de pago)
-    if filtro_estado == 'DEUDA':
-        inscripciones_qs = inscripciones_qs.filter(estado_pago='PENDIENTE')
-    # Nuevo filtro: mostrar inscripciones con pagos 'ABONADO' (parciales)
-    elif filtro_estado == 'ABONADO':
-        inscripciones_qs = inscripciones_qs.filter(estado_pago='ABONADO')
-    # Se usa 'PAGADO' en lugar de 'COMPLETADO'
-    elif filtro_estado == 'PAGADO':
-        # Filtro de "Completados" (los que no tienen deuda). Usamos 'PAGADO' como estado final.
-        inscripciones_qs = inscripciones_qs.filter(estado_pago='PAGADO')
-        
-    # Si filtro_estado es None, se usa el .all() inicial.
+    # 'DEUDA' muestra inscripciones PENDIENTE, 'ABONADO' pagos parciales y 'PAGADO' las completadas.
+    # Si filtro_estado es None se muestran todas.
+    if filtro_estado not in FILTROS_ESTADO:
+        filtro_estado = None
+    orden = request.GET.get('orden')
+    if orden not in ORDENES:
+        orden = None
+
+    # Exportación CSV del filtro completo, escrita en streaming
+    if request.GET.get('exportar') == 'csv':
+        pseudo_buffer = _EchoBuffer()
+        writer = csv.writer(pseudo_buffer)
+        response = StreamingHttpResponse(
+            (writer.writerow(fila) for fila in filas_exportacion(filtro_estado, orden)),
+            content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = f'attachment; filename="deudores_{filtro_estado or "todos"}.csv"'
+        return response
+
+    inscripciones_qs = inscripciones_por_filtro(filtro_estado, orden)
 
-    # --- Agrupar inscripciones en lotes de 15 (índices)
+    # --- Paginación en la BD (LIMIT/OFFSET) en lotes de 15 ---
     PER_PAGE = 15
     try:
         indice = int(request.GET.get('indice', 1))
@@ -560,8 +693,8 @@ def gestion_deudores(request):
     if indice < 1:
         indice = 1
 
-    ins_list = list(inscripciones_qs)
-    total = len(ins_list)
+    # El total por filtro se sirve desde caché (se invalida al guardar inscripciones)
+    total = contar_inscripciones(filtro_estado)
     num_batches = max(1, math.ceil(total / PER_PAGE))
     # Ajustar indice si excede
     if indice > num_batches:
@@ -569,7 +702,7 @@ def gestion_deudores(request):
 
     start = (indice - 1) * PER_PAGE
     end = start + PER_PAGE
-    current_batch = ins_list[start:end]
+    current_batch = list(inscripciones_qs.select_related('cliente', 'taller')[start:end])
 
     # Índices para mostrar en la interfaz (evitar cálculos en la plantilla)
     if total == 0:
@@ -577,15 +710,10 @@ def gestion_deudores(request):
         mostrando_fin = 0
     else:
         mostrando_inicio = start + 1
-        mostrando_fin = min(end, total)
+        mostrando_fin = min(start + len(current_batch), total)
 
-    # Metadatos de otros lotes
-    batch_meta = []
-    for i in range(1, num_batches + 1):
-        s = (i - 1) * PER_PAGE + 1
-        e = min(i * PER_PAGE, total)
-        count = e - s + 1 if total > 0 else 0
-        batch_meta.append({'indice': i, 'range': f'{s}-{e}', 'count': count})
+    # Índice de páginas acotado alrededor de la actual (no una entrada por lote)
+    batch_meta = ventana_paginas(indice, num_batches, PER_PAGE, total)
 
     context = {
         'titulo': 'Gestión de Pagos CRM',
@@ -597,48 +725,28 @@ def gestion_deudores(request):
         'total_deudores': total,
         'mostrando_inicio': mostrando_inicio,
         'mostrando_fin': mostrando_fin,
+        'orden_activo': orden,
+        'antiguedad': reporte_antiguedad(),
     }
     return render(request, 'crm/gestion_deudores.html', context)
 
 # =========================================================================
 
-@user_passes_test(is_superuser)
-def panel_reportes(request):
-    """
-    Vista protegida que solo permite el acceso a superusuarios.
-    Muestra métricas y reportes analíticos.
-    """
-    # -----------------------------------------------------------
-    # METRICAS CLAVE
-    # -----------------------------------------------------------
+class _EchoBuffer:
+    """Objeto tipo archivo que devuelve lo escrito (para csv.writer en streaming)."""
+
+    def write(self, value):
+        return value
+
+
+def _series_ingresos_bd():
+    """Series de ingresos del panel calculadas con la base de datos (mismas claves que resumen_ingresos)."""
     ingresos_totales = Inscripcion.objects.filter(
         estado_pago__in=['PAGADO', 'ABONADO']
     ).aggregate(
         total=Sum('monto_pagado')
     )['total'] or 0
 
-    total_clientes = Cliente.objects.count()
-
-    num_deudores = Inscripcion.objects.filter(
-        estado_pago__in=['PENDIENTE', 'ABONADO']
-    ).count()
-
-    # -----------------------------------------------------------
-    # REPORTES TABLA
-    # -----------------------------------------------------------
-    talleres_populares = Taller.objects.annotate(
-        num_inscripciones=Count('inscripciones')
-    ).order_by('-num_inscripciones', 'nombre')[:5]
-
-    recaudacion_por_taller = Taller.objects.annotate(
-        recaudado=Sum('inscripciones__monto_pagado', 
-                      filter=Q(inscripciones__estado_pago__in=['PAGADO', 'ABONADO']))
-    ).order_by('-recaudado')
-    
-    # -----------------------------------------------------------
-    # NUEVOS DATOS PARA GRÁFICOS
-    # -----------------------------------------------------------
-
     # 1. Ingresos por Mes (Gráfico de Líneas)
     # Construimos un rango mensual continuo entre la fecha mínima y máxima.
     # NOTA: usamos todas las inscripciones para determinar el rango temporal
@@ -743,27 +851,94 @@ def panel_reportes(request):
     ingresos_categoria_data = [float(item['total'] or 0) for item in ingresos_por_categoria]
     ingresos_categoria_ids = [item['taller__categoria__id'] for item in ingresos_por_categoria]
 
+    return {
+        'ingresos_totales': ingresos_totales,
+        'ingresos_labels': ingresos_labels, 'ingresos_data': ingresos_data, 'ingresos_meta': ingresos_meta,
+        'categoria_labels': categoria_labels, 'categoria_data': categoria_data, 'categoria_ids': categoria_ids,
+        'modalidad_labels': modalidad_labels, 'modalidad_data': modalidad_data, 'modalidad_keys': modalidad_keys,
+        'ingresos_categoria_labels': ingresos_categoria_labels,
+        'ingresos_categoria_data': ingresos_categoria_data,
+        'ingresos_categoria_ids': ingresos_categoria_ids,
+    }
+
+
+@user_passes_test(is_superuser)
+def panel_reportes(request):
+    """
+    Vista protegida que solo permite el acceso a superusuarios.
+    Muestra métricas y reportes analíticos.
+    """
+    # -----------------------------------------------------------
+    # METRICAS CLAVE
+    # -----------------------------------------------------------
+    total_clientes = Cliente.objects.count()
+
+    num_deudores = Inscripcion.objects.filter(
+        estado_pago__in=['PENDIENTE', 'ABONADO']
+    ).count()
+
+    # -----------------------------------------------------------
+    # REPORTES TABLA
+    # -----------------------------------------------------------
+    talleres_populares = Taller.objects.annotate(
+        num_inscripciones=Count('inscripciones')
+    ).order_by('-num_inscripciones', 'nombre')[:5]
+
+    recaudacion_por_taller = Taller.objects.annotate(
+        recaudado=Sum('inscripciones__monto_pagado', 
+                      filter=Q(inscripciones__estado_pago__in=['PAGADO', 'ABONADO']))
+    ).order_by('-recaudado')
+    
+    # -----------------------------------------------------------
+    # NUEVOS DATOS PARA GRÁFICOS
+    # -----------------------------------------------------------
+
+    # Series de ingresos: desde el snapshot columnar (comando `snapshot_hechos`) si está
+    # activo y existe; solo si no, se consultan en la base de datos transaccional.
+    resumen, snapshot_creado = None, None
+    if getattr(settings, 'REPORTES_DESDE_SNAPSHOT', False):
+        from .utils.factstore import FactStore, resumen_ingresos
+        store = FactStore.open_current()
+        if store is not None:
+            resumen = resumen_ingresos(store)
+            snapshot_creado = store.creado
+    if resumen is None:
+        resumen = _series_ingresos_bd()
+
+    # 5. Retención por cohortes (mes de primera inscripción vs. meses siguientes)
+    # Se calcula vectorizado con NumPy y se sirve desde caché (ver utils/cohorts.py)
+    from .utils.cohorts import get_cohort_report
+    cohortes = get_cohort_report(refresh=request.GET.get('refrescar_cohortes') == '1')
+
     context = {
         'titulo': 'Panel de Reportes y Análisis CRM',
-        'ingresos_totales': ingresos_totales,
+        'ingresos_totales': resumen['ingresos_totales'],
         'total_clientes': total_clientes,
         'talleres_populares': talleres_populares,
         'recaudacion_por_taller': recaudacion_por_taller,
         'num_deudores': num_deudores,
 
         # DATOS PARA GRÁFICOS
-        'ingresos_labels': ingresos_labels,
-        'ingresos_data': ingresos_data,
-        'ingresos_meta': ingresos_meta,
-        'categoria_labels': categoria_labels,
-        'categoria_data': categoria_data,
-        'categoria_ids': categoria_ids,
-        'modalidad_labels': modalidad_labels,
-        'modalidad_data': modalidad_data,
-        'modalidad_keys': modalidad_keys,
-        'ingresos_categoria_labels': ingresos_categoria_labels,
-        'ingresos_categoria_data': ingresos_categoria_data,
-        'ingresos_categoria_ids': ingresos_categoria_ids,
+        'ingresos_labels': resumen['ingresos_labels'],
+        'ingresos_data': resumen['ingresos_data'],
+        'ingresos_meta': resumen['ingresos_meta'],
+        'categoria_labels': resumen['categoria_labels'],
+        'categoria_data': resumen['categoria_data'],
+        'categoria_ids': resumen['categoria_ids'],
+        'modalidad_labels': resumen['modalidad_labels'],
+        'modalidad_data': resumen['modalidad_data'],
+        'modalidad_keys': resumen['modalidad_keys'],
+        'ingresos_categoria_labels': resumen['ingresos_categoria_labels'],
+        'ingresos_categoria_data': resumen['ingresos_categoria_data'],
+        'ingresos_categoria_ids': resumen['ingresos_categoria_ids'],
+        'snapshot_creado': snapshot_creado,
+
+        # RETENCIÓN POR COHORTES (últimos 12 meses de cohortes)
+        'cohorte_horizonte': cohortes['horizonte'],
+        'cohorte_filas': cohortes['filas'][-12:],
+
+        # ANTIGÜEDAD DE LA DEUDA (saldo pendiente por tramos)
+        'antiguedad': reporte_antiguedad(),
     }
     return render(request, 'crm/panel_reportes.html', context)
 
@@ -839,28 +1014,108 @@ def listado_clientes(request):
     intereses_filtro = request.GET.getlist('interes', [])
     taller_asistir_filtro = request.GET.get('taller_asistir', None)
     deudores_filtro = request.GET.get('deudores', None)
-
-    clientes = Cliente.objects.all().order_by('-fecha_registro')
-
-    # --- Lógica de Filtrado (Se mantiene igual) ---
-    if tipo_cliente_filtro:
-        clientes = clientes.filter(tipo_cliente=tipo_cliente_filtro)
-    if intereses_filtro:
-        # Asegurarse que los IDs son números antes de filtrar
-        interes_ids_int = [int(i) for i in intereses_filtro if i.isdigit()]
+    orden_filtro = request.GET.get('orden', None)
+    puntaje_min_filtro = request.GET.get('puntaje_min', None)
+    busqueda = request.GET.get('q', '').strip()
+    segmento_expr = request.GET.get('segmento', '').strip()
+    segmento_guardado_filtro = request.GET.get('segmento_guardado', None)
+
+    # select_related('puntaje'): el puntaje RFM viene de la tabla precalculada (sin agregados por fila)
+    clientes = Cliente.objects.select_related('puntaje')
+    if orden_filtro == 'valor':
+        clientes = clientes.order_by(
+            F('puntaje__puntaje_total').desc(nulls_last=True),
+            F('puntaje__valor_vida').desc(nulls_last=True),
+            '-id',
+        )
+    else:
+        clientes = clientes.order_by('-fecha_registro', '-id')
+
+    # --- Lógica de Filtrado: subconsultas EXISTS en vez de JOIN + DISTINCT ---
+    interes_ids_int = [int(i) for i in intereses_filtro if i.isdigit()]
+    taller_id = int(taller_asistir_filtro) if taller_asistir_filtro and taller_asistir_filtro.isdigit() else None
+    puntaje_min = int(puntaje_min_filtro) if puntaje_min_filtro and puntaje_min_filtro.isdigit() else None
+
+    # Segmento guardado: refresco incremental y lectura de los miembros materializados
+    segmento_guardado = None
+    if segmento_guardado_filtro and segmento_guardado_filtro.isdigit():
+        segmento_guardado = Segmento.objects.filter(pk=int(segmento_guardado_filtro)).first()
+        if segmento_guardado:
+            refrescar_segmento(segmento_guardado)
+            clientes = clientes.filter(Exists(
+                SegmentoMiembro.objects.filter(segmento=segmento_guardado, cliente_id=OuterRef('pk'))
+            ))
+
+    # Índice de segmentación en memoria: resuelve tipo/intereses/taller/deuda (y ?segmento=)
+    # como operaciones de bitmaps y solo hidrata la página de clientes resultante.
+    # Con filtros que no están en el índice (puntaje, búsqueda, orden por valor, segmento
+    # guardado) todo se resuelve en la BD: pasar los ids del bitmap sería un IN sin tope.
+    segmento = None
+    fuera_del_indice = puntaje_min or busqueda or orden_filtro == 'valor' or segmento_guardado
+    if (segmento_expr or getattr(settings, 'SEGMENTOS_EN_MEMORIA', False)) and not fuera_del_indice:
+        from .utils.segmentos import obtener_indice, parsear
+        condiciones = []
+        if tipo_cliente_filtro:
+            condiciones.append(('atomo', 'tipo', tipo_cliente_filtro))
         if interes_ids_int:
-            clientes = clientes.filter(intereses_cliente__id__in=interes_ids_int).distinct()
-    if taller_asistir_filtro and taller_asistir_filtro.isdigit():
-        taller_id = int(taller_asistir_filtro)
-        clientes = clientes.filter(
-            inscripciones__taller__id=taller_id,
-            inscripciones__estado_pago__in=['PENDIENTE', 'ABONADO', 'PAGADO']
-        ).distinct()
-    
-    if deudores_filtro == 'true':
-        clientes = clientes.filter(
-            inscripciones__estado_pago__in=['PENDIENTE', 'ABONADO']
-        ).distinct()
+            condiciones.append(('or', *[('atomo', 'interes', i) for i in interes_ids_int]))
+        if taller_id:
+            condiciones.append(('atomo', 'taller', taller_id))
+        if deudores_filtro == 'true':
+            condiciones.append(('atomo', 'deuda', None))
+        indice = obtener_indice()
+        if segmento_expr:
+            try:
+                arbol = parsear(segmento_expr)
+                indice.evaluar(arbol)  # valida los criterios antes de combinarlos
+                condiciones.append(arbol)
+            except ExpresionInvalida as e:
+                messages.error(request, f'Segmento inválido: {e}')
+        segmento = indice.evaluar(('and', *condiciones)) if condiciones else indice.universo
+    else:
+        clientes = filtrar_clientes(
+            clientes,
+            tipo=tipo_cliente_filtro,
+            interes_ids=interes_ids_int,
+            taller_id=taller_id,
+            deudores=deudores_filtro == 'true',
+            puntaje_min=puntaje_min,
+        )
+        if segmento_expr:
+            try:
+                clientes = clientes.filter(expresion_a_q(segmento_expr))
+            except ExpresionInvalida as e:
+                messages.error(request, f'Segmento inválido: {e}')
+    if busqueda:
+        # Búsqueda indexada (tsvector/trigram o FTS5); ordena por relevancia salvo que se pida "valor"
+        from .utils.busqueda import buscar_clientes
+        clientes = buscar_clientes(clientes, busqueda, por_relevancia=orden_filtro != 'valor')
+
+    # --- Guardar los filtros actuales como segmento con nombre ---
+    if request.method == 'POST' and request.POST.get('action') == 'guardar_segmento':
+        nombre = request.POST.get('nombre_segmento', '').strip()
+        expresion = expresion_desde_filtros(
+            tipo=tipo_cliente_filtro,
+            interes_ids=interes_ids_int,
+            taller_id=taller_id,
+            deudores=deudores_filtro == 'true',
+            segmento=segmento_expr,
+        )
+        if not nombre:
+            messages.error(request, 'Error: Debes indicar un nombre para el segmento.')
+        elif Segmento.objects.filter(nombre=nombre).exists():
+            messages.error(request, f'Ya existe un segmento llamado "{nombre}".')
+        else:
+            try:
+                nuevo = Segmento(nombre=nombre, expresion=expresion, creado_por=request.user)
+                expresion_a_q(expresion)  # valida antes de guardar
+                nuevo.save()
+                refrescar_segmento(nuevo, completo=True)
+                messages.success(request, f'Segmento "{nombre}" guardado con {nuevo.miembros.count()} clientes.')
+                return redirect(f"{request.path}?segmento_guardado={nuevo.pk}")
+            except ExpresionInvalida as e:
+                messages.error(request, f'Segmento inválido: {e}')
+        return redirect(f'{request.path}?{request.GET.urlencode()}')
 
     # --- Lógica de Acción por Lote (POST) ---
     if request.method == 'POST' and 'action' in request.POST and request.POST['action'] == 'enviar_correo':
@@ -952,17 +1207,68 @@ def listado_clientes(request):
         fecha_taller__gte=timezone.now().date()
     ).order_by('fecha_taller')
 
+    # --- Paginación en la BD (LIMIT/OFFSET) ---
+    filtrado = any([tipo_cliente_filtro, interes_ids_int, taller_id, deudores_filtro == 'true', puntaje_min, busqueda, segmento_expr, segmento_guardado])
+    if segmento is not None:
+        # El total sale del bitmap (sin COUNT en la BD)
+        total_clientes, total_estimado = len(segmento), False
+    else:
+        total_clientes, total_estimado = contar_clientes(clientes, filtrado)
+    num_paginas = max(1, math.ceil(total_clientes / CLIENTES_POR_PAGINA))
+    try:
+        pagina = int(request.GET.get('pagina', 1))
+    except ValueError:
+        pagina = 1
+    pagina = min(max(pagina, 1), num_paginas)
+    inicio = (pagina - 1) * CLIENTES_POR_PAGINA
+    # Solo la página visible se hidrata con empresa (JOIN) e intereses (1 consulta extra)
+    if segmento is not None:
+        # Orden por id descendente (equivale al orden de registro) tomado directo del bitmap
+        ids_pagina = segmento.pagina(inicio, CLIENTES_POR_PAGINA)
+        clientes_pagina = clientes.filter(id__in=ids_pagina).order_by('-id')
+    else:
+        clientes_pagina = clientes[inicio:inicio + CLIENTES_POR_PAGINA]
+    pagina_clientes = list(clientes_pagina.select_related('empresa').prefetch_related('intereses_cliente'))
+    parametros = request.GET.copy()
+    parametros.pop('pagina', None)
+
     context = {
         'titulo': 'Listado de Clientes CRM',
-        'clientes': clientes,
+        'clientes': pagina_clientes,
+        'total_clientes': total_clientes,
+        'total_estimado': total_estimado,
+        'pagina_actual': pagina,
+        'paginas': ventana_paginas(pagina, num_paginas, CLIENTES_POR_PAGINA, total_clientes),
+        'parametros_filtro': parametros.urlencode(),
         'todos_intereses': todos_intereses,
         'intereses_activos': [int(i) for i in intereses_filtro if i.isdigit()],
         'talleres_futuros': talleres_futuros,
-        'taller_asistir_activo': int(taller_asistir_filtro) if taller_asistir_filtro and taller_asistir_filtro.isdigit() else None,
+        'taller_asistir_activo': taller_id,
+        'orden_activo': orden_filtro,
+        'busqueda': busqueda,
+        'segmento_activo': segmento_expr,
+        'segmentos_guardados': Segmento.objects.all(),
+        'segmento_guardado_activo': segmento_guardado,
+        'puntaje_min_activo': puntaje_min,
+        'opciones_puntaje': range(3, 16),
     }
     return render(request, 'crm/listado_clientes.html', context)
 
 
+@user_passes_test(is_superuser)
+def exportar_segmento(request, segmento_id):
+    """Exporta a CSV los miembros de un segmento guardado (refresco incremental previo)."""
+    segmento = get_object_or_404(Segmento, pk=segmento_id)
+    refrescar_segmento(segmento)
+    writer = csv.writer(_EchoBuffer())
+    response = StreamingHttpResponse(
+        (writer.writerow(fila) for fila in filas_miembros(segmento)),
+        content_type='text/csv; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="segmento_{segmento.pk}.csv"'
+    return response
+
+
 @user_passes_test(is_superuser)
 def detalle_cliente_admin(request, cliente_id):
     """
@@ -974,9 +1280,13 @@ def detalle_cliente_admin(request, cliente_id):
     historial_inscripciones = cliente.inscripciones.all().order_by('-taller__fecha_taller')
     total_talleres_realizados = historial_inscripciones.count()
 
+    # Puntaje RFM precalculado por el comando `calcular_puntajes` (puede no existir aún)
+    puntaje = PuntajeCliente.objects.filter(cliente=cliente).first()
+
     context = {
         'titulo': f'Detalle de Cliente: {cliente.nombre_completo}',
         'cliente': cliente,
+        'puntaje': puntaje,
         'historial_inscripciones': historial_inscripciones,
         'total_talleres_realizados': total_talleres_realizados,
         # Aquí se podrían agregar las notas de seguimiento en un paso posterior
@@ -1023,15 +1333,31 @@ def email_preview(request):
 def catalogo_productos(request):
     """
     Vista que muestra una lista de todos los Kits/Productos disponibles para la venta.
+    Anónimos: página completa desde caché. Autenticados: tarjetas desde caché.
+    Las unidades disponibles se insertan al responder (ámbito 'stock').
     """
-    # Filtra solo los productos que están marcados como disponibles
-    productos_disponibles = Producto.objects.filter(esta_disponible=True).order_by('nombre')
-    
-    context = {
-        'titulo': 'Catálogo de Kits y Productos',
-        'productos': productos_disponibles,
-    }
-    return render(request, 'crm/catalogo_productos.html', context)
+    def generar(contexto_extra):
+        # Filtra solo los productos que están marcados como disponibles
+        productos_disponibles = stock.con_stock(Producto.objects.filter(esta_disponible=True)).order_by('nombre')
+        context = {
+            'titulo': 'Catálogo de Kits y Productos',
+            'productos': productos_disponibles,
+            'tarjetas': tarjetas(productos_disponibles, 'producto', 'crm/fragmentos/tarjeta_producto.html'),
+            **contexto_extra,
+        }
+        return render(request, 'crm/catalogo_productos.html', context)
+
+    def disponibles():
+        return {p.pk: p.stock_disponible for p in stock.con_stock(Producto.objects.filter(esta_disponible=True))}
+
+    return respuesta_condicional(
+        request, 'catalogo_productos', ['productos', 'stock'],
+        lambda: _resumen_catalogo(Producto.objects.filter(esta_disponible=True)),
+        lambda: insertar_disponibles(
+            pagina_anonima(request, 'catalogo_productos', ['productos'], generar),
+            ['productos', 'stock'], disponibles,
+        ),
+    )
 
 def detalle_producto(request, producto_id):
     """
@@ -1053,11 +1379,9 @@ def perfil_usuario(request):
     de inscripciones/compras del cliente actual.
     INCLUYE RECOMENDACIONES DE TALLERES Y DATOS PARA EL CALENDARIO.
     """
-    try:
-        # 1. Obtener el objeto Cliente asociado al usuario autenticado
-        cliente = Cliente.objects.get(email=request.user.email)
-    except Cliente.DoesNotExist:
-        cliente = None 
+    # 1. Obtener el objeto Cliente asociado al usuario autenticado (por usuario_id)
+    cliente = request.cliente or None
+    if cliente is None:
         messages.warning(request, "Tu perfil de cliente aún no ha sido creado. Inscríbete a un taller para completarlo.")
         
     historial_inscripciones = None
@@ -1142,17 +1466,12 @@ def perfil_usuario(request):
 
 
 def get_carrito(request):
-    """Obtiene el carrito de la sesión. Si no existe, lo inicializa."""
-    if 'carrito' not in request.session:
-        # Estructura del carrito: { 'producto_id': {'cantidad': X, 'precio': Y} }
-        request.session['carrito'] = {}
-    return request.session['carrito']
+    """Obtiene el carrito (cookie firmada o sesión) sin crear una sesión vacía."""
+    return carrito_util.obtener(request)
 
 def guardar_carrito(request, carrito):
-    """Guarda el carrito actualizado en la sesión."""
-    request.session['carrito'] = carrito
-    # Marcar la sesión como modificada para asegurar que se guarde en la base de datos
-    request.session.modified = True 
+    """Guarda el carrito actualizado; CarritoMiddleware lo escribe al responder."""
+    carrito_util.guardar(request, carrito)
 
 def agregar_a_carrito(request, producto_id):
     """Añade un producto al carrito, manejando el incremento de cantidad."""
@@ -1162,13 +1481,25 @@ def agregar_a_carrito(request, producto_id):
     # Se usa str(producto_id) porque las claves de sesión deben ser strings
     producto_id_str = str(producto_id)
 
-    if producto_id_str in carrito:
-        carrito[producto_id_str]['cantidad'] += 1
+    linea = carrito.get(producto_id_str)
+    cantidad = (linea['cantidad'] if linea else 0) + 1
+
+    # Reserva la unidad agregada (con vencimiento) para que no se venda a otro carrito
+    try:
+        reserva_id = reservas.ajustar(producto.pk, cantidad, linea.get('reserva') if linea else None)
+    except reservas.StockNoDisponible as e:
+        messages.error(request, str(e))
+        return redirect('ver_carrito')
+
+    if linea:
+        linea['cantidad'] = cantidad
+        linea['reserva'] = reserva_id
     else:
         carrito[producto_id_str] = {
             'cantidad': 1,
             # Almacenamos el precio de venta actual del producto en el carrito
             'precio': str(producto.precio_venta), 
+            'reserva': reserva_id,
         }
 
     guardar_carrito(request, carrito)
@@ -1188,8 +1519,13 @@ def actualizar_carrito(request):
             try:
                 nueva_cantidad = int(nueva_cantidad)
                 
+                # Ajusta (o libera, con cantidad 0) la reserva de la línea
+                reserva_id = reservas.ajustar(
+                    int(producto_id), max(nueva_cantidad, 0), carrito[producto_id].get('reserva')
+                )
                 if nueva_cantidad > 0:
                     carrito[producto_id]['cantidad'] = nueva_cantidad
+                    carrito[producto_id]['reserva'] = reserva_id
                     messages.success(request, 'Cantidad actualizada.')
                 else:
                     del carrito[producto_id]
@@ -1197,6 +1533,13 @@ def actualizar_carrito(request):
                     
                 guardar_carrito(request, carrito)
                 
+            except reservas.StockNoDisponible as e:
+                messages.error(request, str(e))
+            except Producto.DoesNotExist:
+                reservas.liberar(reservas.ids_del_carrito({producto_id: carrito[producto_id]}))
+                del carrito[producto_id]
+                guardar_carrito(request, carrito)
+                messages.error(request, f'El producto con ID {producto_id} ya no existe.')
             except ValueError:
                 messages.error(request, 'Cantidad inválida.')
         
@@ -1211,32 +1554,37 @@ def ver_carrito(request):
     items = []
     subtotal_general = Decimal(0)
     
-    # Iterar sobre una copia de los items para evitar modificar el dict durante la iteración
+    # Una sola consulta para todas las líneas del carrito
+    ids = [int(id_str) for id_str in carrito_data if id_str.isdigit()]
+    productos = Producto.objects.in_bulk(ids)
     keys_to_remove = []
     for id_str, data in list(carrito_data.items()):
+        producto = productos.get(int(id_str)) if id_str.isdigit() else None
+        if producto is None:
+            # Si el producto ya no existe, marcar para eliminarlo después
+            keys_to_remove.append(id_str)
+            continue
         try:
-            producto = Producto.objects.get(pk=int(id_str))
             cantidad = int(data.get('cantidad', 0))
             # Convertir el precio de str a Decimal para el cálculo
-            precio = Decimal(str(data.get('precio', '0'))) 
-            subtotal = precio * Decimal(cantidad)
-            subtotal_general += subtotal;
-
-            items.append({
-                'producto': producto,
-                'cantidad': cantidad,
-                'precio_unitario': precio,
-                'subtotal': subtotal,
-            })
-        except Producto.DoesNotExist:
-            # Si el producto ya no existe, marcar para eliminarlo después
-            keys_to_remove.append(id_str)
+            precio = Decimal(str(data.get('precio', '0')))
         except (ValueError, InvalidOperation):
-            # Datos corruptos en sesión; marcar para eliminación
+            # Datos corruptos en el carrito; marcar para eliminación
             keys_to_remove.append(id_str)
+            continue
+        subtotal = precio * Decimal(cantidad)
+        subtotal_general += subtotal
+        items.append({
+            'producto': producto,
+            'cantidad': cantidad,
+            'precio_unitario': precio,
+            'subtotal': subtotal,
+        })
 
     # Eliminar las claves inválidas fuera del bucle de iteración y guardar sólo si hubo cambios
     if keys_to_remove:
+        # Devolver las unidades que esas líneas tenían reservadas
+        reservas.liberar(reservas.ids_del_carrito({k: carrito_data[k] for k in keys_to_remove}))
         for k in keys_to_remove:
             carrito_data.pop(k, None)
         guardar_carrito(request, carrito_data)
@@ -1262,73 +1610,34 @@ def finalizar_compra(request):
         messages.error(request, 'El carrito está vacío.')
         return redirect('ver_carrito')
 
-    # 1. Obtener el cliente
-    try:
-        cliente = Cliente.objects.get(email=request.user.email)
-    except Cliente.DoesNotExist:
-        cliente, _ = Cliente.objects.get_or_create(
+    # 1. Obtener el cliente (por usuario_id; se crea y vincula en la primera compra).
+    # Sin la ausencia recordada: un cliente invitado con el email de la cuenta se vincula aquí.
+    cliente = request.cliente or cliente_de_usuario(request.user, recordar_ausencia=False)
+    if cliente is None:
+        # El email es único: si ya pertenece al cliente de otra cuenta no se puede reutilizar
+        if not request.user.email or Cliente.objects.filter(email=request.user.email).exists():
+            messages.error(
+                request,
+                'No pudimos asociar tu cuenta a un cliente: su email falta o ya pertenece a otra cuenta. '
+                'Actualiza tu email o contáctanos para completar la compra.'
+            )
+            return redirect('ver_carrito')
+        cliente = Cliente.objects.create(
             email=request.user.email,
-            defaults={'nombre_completo': request.user.get_full_name() or request.user.username}
+            nombre_completo=request.user.get_full_name() or request.user.username,
+            usuario=request.user,
         )
 
-    # --- NUEVO: PASO 2 - VALIDACIÓN DE STOCK ANTES DE COBRAR ---
-    # Revisamos todo el carrito antes de tocar la base de datos
-    for id_str, data in carrito_data.items():
-        try:
-            producto = Producto.objects.get(pk=int(id_str))
-            cantidad_solicitada = data['cantidad']
-            
-            # Comparamos con el stock_actual del modelo Producto
-            if producto.stock_actual < cantidad_solicitada:
-                messages.error(request, f'¡Stock insuficiente! Solo quedan {producto.stock_actual} unidades de "{producto.nombre}".')
-                return redirect('ver_carrito')
-        except Producto.DoesNotExist:
-            messages.error(request, f'El producto con ID {id_str} ya no existe.')
-            # (Opcional: eliminarlo del carrito aquí)
-            return redirect('ver_carrito')
-    # --- FIN DE LA VALIDACIÓN ---
-
-
-    # 3. Registrar la Venta (VentaProducto)
-    # (El código anterior se mueve del paso 2 al 3)
-    venta = VentaProducto.objects.create(
-        cliente=cliente,
-        monto_total=Decimal(0), 
-        estado_pago='PENDIENTE' 
-    )
-
-    subtotal_general = Decimal(0)
-    
-    # 4. Registrar Detalles y Actualizar Stock
-    for id_str, data in carrito_data.items():
-        # Volvemos a obtener el producto (dentro de la transacción)
-        producto = get_object_or_404(Producto, pk=int(id_str))
-        cantidad = data['cantidad']
-        precio_unitario = Decimal(data['precio'])
-        subtotal = precio_unitario * Decimal(cantidad)
-        subtotal_general += subtotal
-
-        # --- MODIFICADO: Actualizar Stock Atómicamente ---
-        # Usamos F() para evitar condiciones de carrera (race conditions)
-        producto.stock_actual = F('stock_actual') - cantidad
-        producto.save(update_fields=['stock_actual']) 
-        # --------------------------------------------------
-
-        DetalleVenta.objects.create(
-            venta=venta,
-            producto=producto,
-            cantidad=cantidad,
-            precio_unitario=precio_unitario,
-        )
+    # 2. Validar stock, registrar la venta y descontar stock con un número fijo de consultas
+    # (bloqueo de todos los productos en orden de id: sin deadlocks entre compras concurrentes)
+    try:
+        venta = checkout.finalizar_venta(cliente, carrito_data)
+    except checkout.CarritoInvalido as e:
+        messages.error(request, str(e))
+        return redirect('ver_carrito')
 
-    # 5. Actualizar Monto Total y marcar como PAGADO (Simulación)
-    venta.monto_total = subtotal_general
-    venta.estado_pago = 'PAGADO' 
-    venta.save()
-    
-    # 6. Limpiar Carrito y Mensaje
-    del request.session['carrito']
-    request.session.modified = True
+    # 3. Limpiar Carrito y Mensaje
+    carrito_util.vaciar(request)
     
     messages.success(request, f'¡Compra finalizada y pagada con éxito! Total: ${venta.monto_total} CLP.')
     return redirect('home')
@@ -1337,15 +1646,24 @@ def finalizar_compra(request):
 def detalle_producto(request, producto_id):
     """
     Muestra la información de un Kit/Producto específico.
+    El GET anónimo se sirve desde caché (el token CSRF del formulario se inserta por visitante).
     """
-    producto = get_object_or_404(Producto, pk=producto_id)
-    
-    context = {
-        'titulo': f'Detalle de Kit: {producto.nombre}',
-        'producto': producto,
-    }
-    # NOTA: La plantilla tendrá el botón para agregar al carrito
-    return render(request, 'crm/detalle_producto.html', context)
+    def generar(contexto_extra):
+        producto = get_object_or_404(stock.con_stock(Producto.objects.all()), pk=producto_id)
+        context = {
+            'titulo': f'Detalle de Kit: {producto.nombre}',
+            'producto': producto,
+            **contexto_extra,
+        }
+        # NOTA: La plantilla tendrá el botón para agregar al carrito
+        return render(request, 'crm/detalle_producto.html', context)
+
+    ambitos = [f'producto:{producto_id}']
+    return respuesta_condicional(
+        request, f'detalle_producto:{producto_id}', ambitos,
+        lambda: _resumen_catalogo(Producto.objects.filter(pk=producto_id)),
+        lambda: pagina_anonima(request, f'detalle_producto:{producto_id}', ambitos, generar),
+    )
 
 def logout(request):
     """Cierra la sesión del usuario y redirige a la página de inicio."""
@@ -66,8 +66,8 @@ PY
     echo "Existing data found in DB — skipping populate script."
   else
     echo "No existing data found — running populate script"
-    # The script configures Django itself, so run it directly
-    python crm/populate_data.py || echo "populate script failed (continuing)"
+    # Scale parameters can be passed through GENERATE_DATA_ARGS (e.g. "--clientes 100000")
+    python manage.py generate_data ${GENERATE_DATA_ARGS:-} || echo "populate script failed (continuing)"
   fi
 else
   echo "POPULATE_DATA not set - skipping populate script"
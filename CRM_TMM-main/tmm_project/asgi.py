@@ -13,4 +13,17 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tmm_project.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Importar después de inicializar Django (usa la caché y los modelos)
+from crm.sse import STREAM_PATH, app_cupos  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Enruta el stream SSE de cupos fuera del stack de Django; el resto va a Django.
+
+    Servir con un servidor ASGI, p.ej.: uvicorn tmm_project.asgi:application
+    """
+    if scope['type'] == 'http' and scope['path'] == STREAM_PATH:
+        return await app_cupos(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -1,37 +1,119 @@
-from django.contrib.auth.models import AnonymousUser
+import copy
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+
+class CacheTokens:
+    """LRU acotado con TTL: token ya validado -> usuario.
+
+    Un acierto evita verificar la firma y la consulta del User. El TTL nunca supera
+    la expiración del token; un usuario desactivado deja de autenticarse, como
+    máximo, cuando vence su entrada (JWT_CACHE_TTL segundos).
+    """
+
+    def __init__(self, maximo, ttl):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        with self._lock:
+            entrada = self._datos.get(token)
+            if entrada is None:
+                return None
+            user, vence = entrada
+            if vence <= time.time():
+                del self._datos[token]
+                return None
+            self._datos.move_to_end(token)
+        # Copia: cada petición puede modificar su request.user sin afectar a las demás
+        return copy.copy(user)
+
+    def set(self, token, user, expira):
+        if self.maximo <= 0:
+            return
+        vence = min(time.time() + self.ttl, expira)
+        with self._lock:
+            self._datos[token] = (user, vence)
+            self._datos.move_to_end(token)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+
+
+def _rutas_publicas():
+    """Prefijos y patrones que nunca necesitan usuario JWT (estáticos, media y catálogo público)."""
+    prefijos = tuple(p for p in (settings.STATIC_URL, settings.MEDIA_URL) if p)
+    prefijos = tuple(p if p.startswith('/') else f'/{p}' for p in prefijos)
+    patrones = [re.compile(p) for p in getattr(settings, 'JWT_RUTAS_PUBLICAS', [])]
+    return prefijos, patrones
 
 
 class JWTAuthMiddleware:
     """Middleware that attempts to authenticate the request using a Bearer JWT.
 
-    If a valid token is present in the Authorization header (Bearer ...), the
-    middleware sets request.user to the authenticated user. If authentication
-    fails or no token is present, it leaves request.user untouched.
-    This allows existing Django views decorated with @login_required or
-    @user_passes_test to work with JWT tokens.
+    If a valid token is present in the Authorization header (Bearer ...) or in the
+    `access_token` cookie, the middleware sets request.user to the authenticated
+    user. If authentication fails or no token is present, it leaves request.user
+    untouched (session authentication still applies).
+
+    Fast path: requests without a token, static/media files and GETs of the public
+    catalog (JWT_RUTAS_PUBLICAS) skip JWT work entirely; validated tokens are kept
+    in a bounded TTL LRU (CacheTokens) so repeated requests neither re-verify the
+    signature nor query the User table.
     """
 
-    def __init__(self, get_response):
+    def __init__(self, get_response, cache_tokens=None, rutas_publicas=None):
         self.get_response = get_response
         self.jwt_auth = JWTAuthentication()
+        self.cache_tokens = cache_tokens if cache_tokens is not None else CacheTokens(
+            getattr(settings, 'JWT_CACHE_TAMANO', 2048), getattr(settings, 'JWT_CACHE_TTL', 60)
+        )
+        self.prefijos, self.patrones = rutas_publicas if rutas_publicas is not None else _rutas_publicas()
 
-    def __call__(self, request):
-        # If no Authorization header is present, try reading the access token from cookie
-        if 'HTTP_AUTHORIZATION' not in request.META:
-            access_token = request.COOKIES.get('access_token')
-            if access_token:
-                # Set the Authorization header so SimpleJWT can pick it up
-                request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}'
+    def _es_publica(self, request):
+        path = request.path_info
+        if self.prefijos and path.startswith(self.prefijos):
+            return True
+        return request.method in ('GET', 'HEAD') and any(p.match(path) for p in self.patrones)
+
+    def _token_crudo(self, request):
+        header = request.META.get('HTTP_AUTHORIZATION')
+        if header:
+            partes = header.split()
+            if len(partes) == 2 and partes[0] == 'Bearer':
+                return partes[1]
+            return None
+        return request.COOKIES.get('access_token') or None
+
+    def autenticar(self, raw):
+        """Usuario del token `raw` (desde el LRU si ya se validó) o None si no es válido."""
+        user = self.cache_tokens.get(raw)
+        if user is not None:
+            return user
         try:
-            auth_result = self.jwt_auth.authenticate(request)
-            if auth_result is not None:
-                user, token = auth_result
+            validado = self.jwt_auth.get_validated_token(raw)
+            user = self.jwt_auth.get_user(validado)
+        except (InvalidToken, AuthenticationFailed, TokenError):
+            return None
+        self.cache_tokens.set(raw, user, validado.get('exp', 0))
+        return user
+
+    def __call__(self, request):
+        raw = None if self._es_publica(request) else self._token_crudo(request)
+        if raw:
+            user = self.autenticar(raw)
+            if user is not None:
                 # Override request.user only when a JWT authenticated user is found
                 request.user = user
-        except Exception:
-            # Any failure to authenticate via JWT should not raise; fall back
-            # to the default authentication mechanisms (session middleware).
-            pass
-
         return self.get_response(request)
@@ -52,7 +52,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'tmm_project.middleware.JWTAuthMiddleware',
+    'crm.middleware.ClienteMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'crm.middleware.CarritoMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -167,6 +170,78 @@ MEDIA_URL = '/media/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Snapshot columnar de hechos (comando `snapshot_hechos`) para reportes analíticos.
+# Si REPORTES_DESDE_SNAPSHOT está activo, panel_reportes calcula los ingresos desde
+# el snapshot vigente en vez de consultar la base de datos.
+FACTSTORE_DIR = os.getenv('FACTSTORE_DIR', os.path.join(BASE_DIR, 'factstore'))
+REPORTES_DESDE_SNAPSHOT = os.getenv('REPORTES_DESDE_SNAPSHOT', 'False').lower() in ('1', 'true', 'yes')
+
+# Snapshots de la base completa (comandos `snapshot_bd` y `generate_data --snapshot`) para
+# preparar pruebas de rendimiento sin migrar ni regenerar datos en cada corrida.
+SNAPSHOTS_BD_DIR = os.getenv('SNAPSHOTS_BD_DIR', os.path.join(BASE_DIR, 'snapshots_bd'))
+
+# Índice de segmentación en memoria (bitmaps por interés/tipo/comuna/taller/deuda).
+# Si está activo, los filtros de listado_clientes se resuelven con el índice; las
+# expresiones ?segmento=... lo usan siempre.
+SEGMENTOS_EN_MEMORIA = os.getenv('SEGMENTOS_EN_MEMORIA', 'False').lower() in ('1', 'true', 'yes')
+
+# Derivados de imágenes (miniatura/tarjeta/detalle en WebP y JPEG). Por defecto se
+# generan en un hilo de fondo tras guardar; con False se generan en la misma petición
+# (o con el comando `generar_derivados`).
+IMAGENES_DERIVADOS_ASINCRONO = os.getenv('IMAGENES_DERIVADOS_ASINCRONO', 'True').lower() in ('1', 'true', 'yes')
+
+# Carrito en una cookie firmada y comprimida (sin escribir en django_session al navegar
+# y agregar productos). Los carritos que no caben en la cookie se guardan en la sesión.
+CARRITO_EN_COOKIE = os.getenv('CARRITO_EN_COOKIE', 'False').lower() in ('1', 'true', 'yes')
+
+# Minutos que un producto agregado al carrito queda reservado para ese carrito. Las
+# reservas vencidas se liberan con `python manage.py liberar_reservas` (cron).
+RESERVA_CARRITO_MINUTOS = int(os.getenv('RESERVA_CARRITO_MINUTOS', '15'))
+
+# Caché compartida (catálogo, cupos y sesiones en caché). Con varios nodos debe ser un
+# servidor común, p.ej. CACHE_BACKEND=django.core.cache.backends.redis.RedisCache y
+# CACHE_LOCATION=redis://redis:6379/1 (requiere el paquete `redis`).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Sesiones en la caché compartida; solo las autenticadas se escriben también en
+# django_session (ver crm/sesiones.py). Las filas vencidas se borran en lotes con
+# `python manage.py purgar_sesiones`.
+SESIONES_EN_CACHE = os.getenv('SESIONES_EN_CACHE', 'False').lower() in ('1', 'true', 'yes')
+if SESIONES_EN_CACHE:
+    SESSION_ENGINE = 'crm.sesiones'
+
+# JWT (api/token/ y api/token/refresh/). JWTAuthMiddleware acepta el access token en
+# "Authorization: Bearer ..." o en la cookie access_token.
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=int(os.getenv('JWT_ACCESS_MINUTOS', '15'))),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=int(os.getenv('JWT_REFRESH_DIAS', '1'))),
+}
+# Tokens ya validados que se recuerdan por proceso (LRU) y por cuántos segundos como máximo
+JWT_CACHE_TAMANO = int(os.getenv('JWT_CACHE_TAMANO', '2048'))
+JWT_CACHE_TTL = int(os.getenv('JWT_CACHE_TTL', '60'))
+# GETs que no necesitan usuario JWT (además de STATIC_URL y MEDIA_URL): catálogo público
+JWT_RUTAS_PUBLICAS = [
+    r'^/talleres/(\d+/)?$',
+    r'^/talleres/cupos/$',
+    r'^/productos/(\d+/)?$',
+]
+
+# Control de admisión del login (crm/utils/acceso_login.py): fallos permitidos por
+# usuario y por IP en una ventana deslizante (0 = sin límite) y hashes de contraseña
+# simultáneos por proceso. Detrás de un proxy, confiar en X-Forwarded-For para la IP.
+LOGIN_FALLOS_POR_USUARIO = int(os.getenv('LOGIN_FALLOS_POR_USUARIO', '5'))
+LOGIN_VENTANA_USUARIO = int(os.getenv('LOGIN_VENTANA_USUARIO', '300'))
+LOGIN_FALLOS_POR_IP = int(os.getenv('LOGIN_FALLOS_POR_IP', '50'))
+LOGIN_VENTANA_IP = int(os.getenv('LOGIN_VENTANA_IP', '300'))
+LOGIN_HASHES_CONCURRENTES = int(os.getenv('LOGIN_HASHES_CONCURRENTES', str(os.cpu_count() or 2)))
+LOGIN_ESPERA_HASH = float(os.getenv('LOGIN_ESPERA_HASH', '2'))
+LOGIN_CONFIAR_X_FORWARDED_FOR = os.getenv('LOGIN_CONFIAR_X_FORWARDED_FOR', 'False').lower() in ('1', 'true', 'yes')
+
 # Email / from (use console backend by default in dev)
 EMAIL_BACKEND = os.getenv('DJANGO_EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.getenv('DJANGO_DEFAULT_FROM_EMAIL', 'carolina@tmmbienestar.cl')
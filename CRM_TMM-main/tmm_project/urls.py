@@ -18,9 +18,17 @@ from django.contrib import admin
 from django.urls import path,include
 from django.conf.urls.static import static
 from django.conf import settings
+from rest_framework_simplejwt.views import TokenRefreshView
+from crm.utils.acceso_login import con_admision
+from crm.views import TokenConAdmisionView
 
 urlpatterns = [
+    # Login del admin con el control de admisión de crm/utils/acceso_login.py (antes que admin.site.urls)
+    path('admin/login/', con_admision(admin.site.login)),
     path('admin/', admin.site.urls),
+    # Emisión y renovación de JWT (los valida tmm_project.middleware.JWTAuthMiddleware)
+    path('api/token/', TokenConAdmisionView.as_view(), name='token_obtain_pair'),
+    path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('', include('crm.urls')),
     path('', include('django.contrib.auth.urls')),
 ]